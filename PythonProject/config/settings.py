@@ -4,12 +4,88 @@ import os
 # Токен бота (замените на ваш токен)
 BOT_TOKEN = os.getenv('BOT_TOKEN', "8203943846:AAF6L1OwqxX5Y9THZ1TQhgEWNOBMEuXIpuU")
 
+# Режим работы бота: polling (TeleBot, потоки), asyncio (AsyncTeleBot, event loop) или webhook
+BOT_RUNTIME = os.getenv('BOT_RUNTIME', 'polling')
+ASYNC_HANDLER_WORKERS = int(os.getenv('ASYNC_HANDLER_WORKERS', 8))  # Потоков для обработчиков и запросов к БД
+POLLING_TIMEOUT = 20  # Long polling timeout (сек)
+POLLING_MAX_BACKOFF = 30  # Максимальная пауза после ошибок получения обновлений (сек)
+
+# Шардирование обработки обновлений по пользователю (polling и webhook)
+UPDATE_SHARDS = int(os.getenv('UPDATE_SHARDS', 4))  # Рабочих потоков
+UPDATE_SHARD_QUEUE_SIZE = int(os.getenv('UPDATE_SHARD_QUEUE_SIZE', 100))  # Обновлений в очереди одного потока
+UPDATE_DEDUP_WINDOW = int(os.getenv('UPDATE_DEDUP_WINDOW', 10000))  # Последних update_id для отсева повторов
+
+# Исходящие сообщения: ограничения Telegram на частоту отправки
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))  # Сообщений в секунду на бота
+OUTBOUND_CHAT_RATE = 1.0  # Сообщений в секунду в личный чат
+OUTBOUND_GROUP_RATE = 20 / 60  # Сообщений в секунду в группу (20 в минуту)
+OUTBOUND_CHAT_BURST = 3  # Сообщений подряд в один чат без ожидания
+OUTBOUND_SENDERS = int(os.getenv('OUTBOUND_SENDERS', 8))  # Одновременных запросов к Telegram API
+OUTBOUND_MAX_RETRIES = 3  # Повторов сообщения после ответа 429
+
+# Режим webhook (BOT_RUNTIME=webhook): встроенный HTTP-сервер вместо long polling
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Публичный https-адрес; если задан, webhook регистрируется при запуске
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 9999))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # secret_token из setWebhook
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))  # Принятых, но не обработанных обновлений
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 8))  # Потоков обработки
+WEBHOOK_MAX_CONNECTIONS = 40  # Одновременных соединений от Telegram
+
+# Сессии пользователей (состояние диалогов)
+SESSION_TTL = int(os.getenv('SESSION_TTL', 86400))  # Время жизни сессии без обращений (сек)
+SESSION_MAX_SIZE = int(os.getenv('SESSION_MAX_SIZE', 10000))  # Максимум сессий в памяти
+SESSION_PERSIST = os.getenv('SESSION_PERSIST', '1') == '1'  # Сохранять сессии в БД (переживают перезапуск)
+SESSION_FLUSH_INTERVAL = 5  # Период записи изменений сессий в БД (сек)
+SESSION_MISS_TTL = int(os.getenv('SESSION_MISS_TTL', 300))  # Сколько помнить, что сессии нет в БД (сек)
+
 # Пути к файлам
 DATABASE_PATH = "data/salon_bot.db"
 
+# Пул соединений с базой данных
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))  # Максимум одновременно выданных соединений
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))  # Закрывать простаивающие соединения (сек)
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', 10))  # Ожидание свободного соединения (сек)
+
+# PRAGMA, применяемые к каждому соединению с SQLite
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),  # читатели не блокируются писателями
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),  # в режиме WAL безопасно и быстрее FULL
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64000)),  # отрицательное значение - в КиБ (~64 МБ)
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 268435456)),  # 256 МБ
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),  # мс ожидания блокировки
+}
+
+# Кэш каталога (мастера и услуги) в памяти процесса
+CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', 300))  # Перечитывать каталог не реже (сек)
+
+# Постраничный вывод списков (записи, расписание, пользователи)
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', 10))  # Строк на странице
+
+# Кэш свободных слотов: (мастер, дата, длительность услуги) -> слоты
+SLOT_CACHE_SIZE = int(os.getenv('SLOT_CACHE_SIZE', 2048))  # Максимум записей в LRU
+
+# Миграции схемы: пакетное заполнение данных без долгой блокировки записи
+MIGRATION_BACKFILL_BATCH_SIZE = 1000  # Строк в одной транзакции
+MIGRATION_BACKFILL_PAUSE = 0.05  # Пауза между пачками (сек), чтобы пропустить других писателей
+
 # Настройки напоминаний
 REMINDER_HOUR = 10  # Час отправки напоминаний (10:00)
 
+# Задачи APScheduler (кастомные напоминания хранятся в БД и переживают перезапуск)
+SCHEDULER_COALESCE = os.getenv('SCHEDULER_COALESCE', '1') == '1'  # Пропущенные запуски задачи выполнять один раз
+SCHEDULER_MISFIRE_GRACE_TIME = int(os.getenv('SCHEDULER_MISFIRE_GRACE_TIME', 3600))  # Опоздание, с которым задача еще выполняется (сек)
+
+# Очередь напоминаний outbox
+OUTBOX_POLL_INTERVAL = int(os.getenv('OUTBOX_POLL_INTERVAL', 600))  # Страховочная проверка outbox (сек)
+OUTBOX_BATCH_SIZE = 100  # Строк, забираемых за один запрос
+REMINDER_CONCURRENCY = int(os.getenv('REMINDER_CONCURRENCY', 20))  # Одновременных отправок напоминаний
+OUTBOX_MAX_ATTEMPTS = 5  # Попыток отправки одного напоминания
+OUTBOX_RETRY_DELAY = 60  # Пауза перед первым повтором (сек), дальше удваивается
+OUTBOX_CLAIM_TIMEOUT = 300  # Через сколько секунд забранная, но не отмеченная строка снова доступна
+
 # ID администратора (замените на ваш Telegram ID)
 ADMIN_ID = int(os.getenv('ADMIN_ID', 123456789))
 
@@ -24,6 +100,8 @@ MESSAGES = {
     'master_info': "📍 Адрес: {address}\n🔗 Соцсети: {social_media}\n\nВыберите услугу:",
     'choose_date': "Выберите дату:",
     'choose_time': "Выберите время:",
+    'slot_taken': "😔 Это время только что заняли. Выберите другое:",
+    'slot_unavailable': "Это время больше недоступно. Выберите другое:",
     'appointment_created': "✅ Запись создана!\n\n📅 Дата: {date}\n⏰ Время: {time}\n👨‍💼 Мастер: {master}\n💇‍♀️ Услуга: {service}\n💰 Цена: {price} руб.",
     'reminder': "⏰ Напоминание!\n\nУ вас завтра запись:\n📅 {date}\n⏰ {time}\n👨‍💼 Мастер: {master}\n💇‍♀️ Услуга: {service}",
     'no_appointments': "У вас нет активных записей",
@@ -0,0 +1,40 @@
+import asyncio
+import functools
+from concurrent.futures import Executor
+from typing import Optional
+from core.database import Database
+
+
+class AsyncDatabase:
+    """
+    Асинхронный адаптер Database для кода на asyncio
+    
+    Любой метод Database доступен как корутина: вызов выполняется в пуле
+    потоков, поэтому запросы к SQLite не блокируют event loop. Атрибуты,
+    не являющиеся методами (pool, catalog, slots), отдаются как есть.
+    """
+    
+    def __init__(self, db: Database, executor: Optional[Executor] = None):
+        """
+        Args:
+            db: Синхронная база данных
+            executor: Пул потоков для запросов (None - пул event loop по умолчанию)
+        """
+        self.db = db
+        self.executor = executor
+    
+    async def run(self, func, *args, **kwargs):
+        """Выполнение произвольной синхронной функции в пуле потоков"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+    
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+        
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        
+        call.__name__ = name
+        return call
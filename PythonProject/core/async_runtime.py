@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Set
+from telebot.async_telebot import AsyncTeleBot
+from core.scheduler_service import SchedulerService
+from core.outbound import Priority
+from core.updates import update_chat_key
+from config.settings import BOT_TOKEN, ASYNC_HANDLER_WORKERS, POLLING_TIMEOUT, POLLING_MAX_BACKOFF
+
+logger = logging.getLogger(__name__)
+
+
+class ChatDispatcher:
+    """
+    Параллельная обработка обновлений с сохранением порядка внутри чата
+    
+    Для каждого чата с необработанными обновлениями работает одна задача,
+    которая обрабатывает его очередь строго по порядку. Разные чаты
+    обрабатываются параллельно. Когда очередь чата пустеет, задача завершается.
+    """
+    
+    def __init__(self, handler: Callable[[object], Awaitable[None]]):
+        self.handler = handler
+        self._pending: Dict[Hashable, Deque] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        
+        self.processed = 0
+        self.failed = 0
+    
+    def submit(self, key: Hashable, update):
+        """Постановка обновления в очередь чата key"""
+        pending = self._pending.get(key)
+        if pending is not None:
+            pending.append(update)
+            return
+        self._pending[key] = deque([update])
+        task = asyncio.create_task(self._drain(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _drain(self, key: Hashable):
+        pending = self._pending[key]
+        try:
+            while pending:
+                update = pending.popleft()
+                try:
+                    await self.handler(update)
+                    self.processed += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Ошибка обработки обновления {update.update_id}: {e}", exc_info=True)
+        finally:
+            del self._pending[key]
+    
+    @property
+    def backlog(self) -> int:
+        """Число обновлений, ожидающих обработки"""
+        return sum(len(pending) for pending in self._pending.values())
+    
+    async def join(self):
+        """Ожидание обработки всех поставленных обновлений"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+
+class AsyncBotRuntime:
+    """
+    Асинхронный режим работы бота (BOT_RUNTIME=asyncio)
+    
+    Обновления получаются через AsyncTeleBot и раздаются ChatDispatcher'у.
+    Обработчик каждого обновления - корутина, которая выполняет синхронные
+    обработчики SalonBot (запросы к SQLite и Telegram API) в пуле потоков,
+    поэтому медленный вызов задерживает только свой чат. Планировщик
+    напоминаний работает в том же event loop и отправляет сообщения через
+    общую с обработчиками очередь SalonBot.outbound с низким приоритетом.
+    """
+    
+    def __init__(self, salon_bot, workers: int = ASYNC_HANDLER_WORKERS):
+        """
+        Args:
+            salon_bot: SalonBot без пула потоков TeleBot (threaded=False), обработчики
+                выполняются в потоке вызова process_new_updates
+            workers: Размер пула потоков для обработчиков и запросов к БД
+        """
+        self.salon_bot = salon_bot
+        self.async_bot = AsyncTeleBot(BOT_TOKEN)
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='handler')
+        self.dispatcher = ChatDispatcher(self.handle_update)
+        self.scheduler = SchedulerService(salon_bot.outbound.async_client(Priority.REMINDER),
+                                          db=salon_bot.db, executor=self.executor)
+        self._stopping = False
+    
+    async def handle_update(self, update):
+        """Обработка одного обновления синхронными обработчиками SalonBot"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.salon_bot.bot.process_new_updates, [update])
+    
+    async def poll(self):
+        """Long polling через AsyncTeleBot с экспоненциальной паузой при ошибках"""
+        offset = None
+        backoff = 1
+        while not self._stopping:
+            try:
+                updates = await self.async_bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка получения обновлений: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, POLLING_MAX_BACKOFF)
+                continue
+            backoff = 1
+            for update in updates:
+                offset = update.update_id + 1
+                self.dispatcher.submit(update_chat_key(update), update)
+    
+    async def main(self):
+        self.scheduler.start()
+        logger.info(f"🚀 Salon Bot запущен (asyncio, потоков обработчиков: {self.workers})")
+        try:
+            await self.poll()
+        finally:
+            self._stopping = True
+            self.scheduler.stop()
+            await self.dispatcher.join()
+            await self.async_bot.close_session()
+            self.executor.shutdown(wait=True)
+            logger.info(f"Обработано обновлений: {self.dispatcher.processed}, с ошибкой: {self.dispatcher.failed}")
+            self.salon_bot.shutdown()
+    
+    def run(self):
+        """Запуск event loop до остановки (Ctrl+C)"""
+        try:
+            asyncio.run(self.main())
+        except KeyboardInterrupt:
+            logger.info("🛑 Bot stopped by user")
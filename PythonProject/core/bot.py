@@ -1,21 +1,47 @@
 import logging
-from datetime import datetime, timedelta
 import telebot
 from telebot import types
 from core.database import Database
-from config.settings import BOT_TOKEN, MESSAGES, KEYBOARDS, MASTER_PASSWORD
+from core.records import BookingStatus, Page
+from core.update_dispatcher import ShardedDispatcher
+from core.updates import UpdateDeduplicator
+from core.callbacks import Action, CallbackRouter, encode_callback
+from core.keyboards import MarkupCache
+from core.outbound import OutboundQueue
+from core.sessions import SessionStore, SQLiteSessionBackend
+from config.settings import BOT_TOKEN, MESSAGES, MASTER_PASSWORD, SESSION_PERSIST
 from utils.time_utils import TimeUtils
+from utils.availability import format_minutes, minutes_not_before, to_minutes
+from utils import fast_time
 
 # Настройка логирования
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class SalonBot:
-    def __init__(self):
+    def __init__(self, threaded: bool = False):
+        """
+        Args:
+            threaded: Обрабатывать обновления в пуле потоков TeleBot. По умолчанию
+                выключено: параллелизмом управляют ShardedDispatcher (polling, webhook)
+                или AsyncBotRuntime, и обработчики выполняются в потоке вызова
+                process_new_updates
+        """
         self.db = Database()
-        self.bot = telebot.TeleBot(BOT_TOKEN)
-        self.user_data = {}  # Храним данные пользователей
-        self._processed_callbacks = set()  # Для отслеживания обработанных callback'ов
+        self.bot = telebot.TeleBot(BOT_TOKEN, threaded=threaded)
+        # send_message/edit_message_text идут через очередь с ограничением частоты
+        self.outbound = OutboundQueue()
+        self.outbound.install(self.bot)
+        # Сессии пользователей: TTL, ограничение размера, запись в БД в фоне
+        self.user_data = SessionStore(SQLiteSessionBackend(self.db.pool) if SESSION_PERSIST else None)
+        self.user_data.start()
+        # Повторно доставленные обновления (polling после сбоя, повтор webhook) отсекаются до обработчиков
+        self.dedup = UpdateDeduplicator()
+        self.bot.process_new_updates = self.dedup.filter(self.bot.process_new_updates)
+        self.callbacks = CallbackRouter()
+        # Клавиатуры меню и каталога сериализуются один раз
+        self.markups = MarkupCache(self.db.catalog)
+        self.register_callbacks()
         self.setup_handlers()
     
     def setup_handlers(self):
@@ -44,39 +70,17 @@ class SalonBot:
         # Добавляем пользователя в базу
         self.db.add_user(user.id, user.username, user.first_name)
         
-        # Создаем клавиатуру
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        for row in KEYBOARDS['main_menu']:
-            markup.row(*row)
-        
-        self.bot.send_message(message.chat.id, MESSAGES['welcome'], reply_markup=markup)
+        self.bot.send_message(message.chat.id, MESSAGES['welcome'], reply_markup=self.markups.main_menu)
     
     def show_main_menu(self, message):
         """Показать главное меню"""
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        for row in KEYBOARDS['main_menu']:
-            markup.row(*row)
-        
-        self.bot.send_message(message.chat.id, "Выберите действие:", reply_markup=markup)
+        self.bot.send_message(message.chat.id, "Выберите действие:", reply_markup=self.markups.main_menu)
     
     def handle_message(self, message):
         """Обработчик текстовых сообщений"""
         text = message.text
         user_id = message.from_user.id
         
-        # Защита от дублирования сообщений
-        message_key = f"{user_id}_{message.message_id}"
-        if hasattr(self, '_processed_messages'):
-            if message_key in self._processed_messages:
-                logger.warning(f"Дублированное сообщение: {message_key}")
-                return
-            self._processed_messages.add(message_key)
-            # Очищаем старые сообщения (оставляем только последние 1000)
-            if len(self._processed_messages) > 1000:
-                self._processed_messages.clear()
-        else:
-            self._processed_messages = {message_key}
-        
         # Проверяем, ожидает ли пользователь ввода пароля мастера
         if user_id in self.user_data and self.user_data[user_id].get('waiting_for_master_password'):
             # Если пользователь нажимает кнопки меню - выходим из режима ввода пароля
@@ -154,50 +158,41 @@ class SalonBot:
     
     def show_service_types(self, message):
         """Показать типы услуг"""
-        # Получаем уникальные специализации мастеров
-        masters = self.db.get_masters()
-        
-        if not masters:
+        # Уникальные специализации мастеров (отсортированы в кэше каталога)
+        if not self.db.catalog.get_masters():
             self.bot.send_message(message.chat.id, "Пока нет доступных мастеров.")
             return
         
-        # Создаем уникальный список специализаций
-        specializations = list(set([master[3] for master in masters if master[3]]))
+        markup = self.markups.specializations()
         
-        if not specializations:
+        if not markup:
             self.bot.send_message(message.chat.id, "Нет доступных типов услуг.")
             return
         
-        markup = types.InlineKeyboardMarkup()
-        for specialization in sorted(specializations):
-            button = types.InlineKeyboardButton(
-                specialization,
-                callback_data=f"specialization_{specialization}"
-            )
-            markup.add(button)
-        
         self.bot.send_message(message.chat.id, MESSAGES['choose_service'], reply_markup=markup)
     
-    def show_masters_by_specialization(self, call, specialization):
-        """Показать мастеров по выбранной специализации"""
-        masters = self.db.get_masters_by_specialization(specialization)
+    def show_masters_by_specialization(self, call, key):
+        """
+        Показать мастеров по выбранной специализации
+        
+        key - id мастера этой специализации (кнопки старого формата передают название)
+        """
+        if isinstance(key, int):
+            master = self.db.catalog.get_master(key)
+            specialization = master.specialization if master else None
+        else:
+            specialization = key
+        markup = self.markups.masters_by_specialization(specialization) if specialization else None
         
-        if not masters:
+        if not markup:
             self.bot.edit_message_text(
-                f"Нет доступных мастеров по специализации '{specialization}'.",
+                f"Нет доступных мастеров по специализации '{specialization}'." if specialization
+                else "Специализация больше недоступна.",
                 call.message.chat.id,
                 call.message.message_id
             )
             return
         
-        markup = types.InlineKeyboardMarkup()
-        for master in masters:
-            button = types.InlineKeyboardButton(
-                f"{master[2]} - {master[5]}",  # name - address
-                callback_data=f"master_{master[0]}"
-            )
-            markup.add(button)
-        
         if call.from_user.id not in self.user_data:
             self.user_data[call.from_user.id] = {}
         self.user_data[call.from_user.id]['selected_specialization'] = specialization
@@ -209,44 +204,83 @@ class SalonBot:
             reply_markup=markup
         )
     
+    @staticmethod
+    def _next_page_markup(page: Page, action: Action, markup=None):
+        """
+        Кнопка следующей страницы с курсором в callback_data
+        
+        Добавляется в markup (кнопки строк страницы), если он передан.
+        Возвращает None, если кнопок нет.
+        """
+        if page.next_cursor is not None:
+            if markup is None:
+                markup = types.InlineKeyboardMarkup()
+            markup.add(types.InlineKeyboardButton("Далее ▶️", callback_data=encode_callback(action, *page.next_cursor)))
+        return markup
+    
+    def _edit_page(self, call, text: str, page: Page, action: Action, markup=None):
+        """Замена сообщения списка следующей страницей"""
+        self.bot.edit_message_text(
+            text if page.items else "Больше записей нет.",
+            call.message.chat.id,
+            call.message.message_id,
+            reply_markup=self._next_page_markup(page, action, markup)
+        )
+    
     def show_my_appointments(self, message):
         """Показать записи клиента"""
-        user_id = message.from_user.id
-        appointments = self.db.get_client_appointments(user_id)
+        page = self.db.get_client_appointments_page(message.from_user.id)
         
-        if not appointments:
+        if not page.items:
             self.bot.send_message(message.chat.id, MESSAGES['no_appointments'])
             return
         
+        self.bot.send_message(message.chat.id, self._client_appointments_text(page),
+                              reply_markup=self._next_page_markup(page, Action.CLIENT_APPOINTMENTS_PAGE))
+    
+    def show_my_appointments_page(self, call, date: str, time: str, appointment_id: int):
+        """Следующая страница записей клиента"""
+        page = self.db.get_client_appointments_page(call.from_user.id, (date, time, appointment_id))
+        self._edit_page(call, self._client_appointments_text(page), page, Action.CLIENT_APPOINTMENTS_PAGE)
+    
+    @staticmethod
+    def _client_appointments_text(page: Page) -> str:
         text = "📋 Ваши записи:\n\n"
-        for app in appointments:
-            formatted_date = TimeUtils.format_date_russian(app[4])  # appointment_date
-            duration_str = TimeUtils.format_duration(app[11])  # duration
-            text += f"📅 {formatted_date} в {app[5]}\n"  # appointment_time
-            text += f"👨‍💼 Мастер: {app[8]}\n"  # master_name
-            text += f"💇‍♀️ Услуга: {app[9]}\n"  # service_name
-            text += f"💰 Цена: {app[10]} руб.\n"  # price
-            text += f"⏳ Продолжительность: {duration_str}\n\n"  # duration
-        
-        self.bot.send_message(message.chat.id, text)
+        for app in page.items:
+            formatted_date = TimeUtils.format_date_russian(app.appointment_date)
+            duration_str = TimeUtils.format_duration(app.duration)
+            text += f"📅 {formatted_date} в {app.appointment_time}\n"
+            text += f"👨‍💼 Мастер: {app.master_name}\n"
+            text += f"💇‍♀️ Услуга: {app.service_name}\n"
+            text += f"💰 Цена: {app.price} руб.\n"
+            text += f"⏳ Продолжительность: {duration_str}\n\n"
+        return text
     
     def show_appointments_to_cancel(self, message):
         """Показать записи для отмены"""
-        user_id = message.from_user.id
-        appointments = self.db.get_client_appointments(user_id)
+        page = self.db.get_client_appointments_page(message.from_user.id)
         
-        if not appointments:
+        if not page.items:
             self.bot.send_message(message.chat.id, MESSAGES['no_appointments'])
             return
         
+        markup = self._next_page_markup(page, Action.CANCEL_LIST_PAGE, self._cancel_markup(page))
+        self.bot.send_message(message.chat.id, "Выберите запись для отмены:", reply_markup=markup)
+    
+    def show_appointments_to_cancel_page(self, call, date: str, time: str, appointment_id: int):
+        """Следующая страница записей для отмены"""
+        page = self.db.get_client_appointments_page(call.from_user.id, (date, time, appointment_id))
+        self._edit_page(call, "Выберите запись для отмены:", page, Action.CANCEL_LIST_PAGE, self._cancel_markup(page))
+    
+    @staticmethod
+    def _cancel_markup(page: Page):
         markup = types.InlineKeyboardMarkup()
-        for app in appointments:
-            formatted_date = TimeUtils.format_date_russian(app[4])  # appointment_date
-            button_text = f"{formatted_date} {app[5]} - {app[8]}"  # appointment_time, master_name
-            button = types.InlineKeyboardButton(button_text, callback_data=f"cancel_{app[0]}")
+        for app in page.items:
+            formatted_date = TimeUtils.format_date_russian(app.appointment_date)
+            button_text = f"{formatted_date} {app.appointment_time} - {app.master_name}"
+            button = types.InlineKeyboardButton(button_text, callback_data=encode_callback(Action.CANCEL, app.id))
             markup.add(button)
-        
-        self.bot.send_message(message.chat.id, "Выберите запись для отмены:", reply_markup=markup)
+        return markup
     
     def request_master_password(self, message):
         """Запрос пароля для входа в режим мастера"""
@@ -258,8 +292,8 @@ class SalonBot:
         
         # Показываем меню выбора: войти как существующий мастер или создать нового
         markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton("🔑 Войти как существующий мастер", callback_data="login_existing_master"))
-        markup.add(types.InlineKeyboardButton("➕ Создать нового мастера", callback_data="create_new_master"))
+        markup.add(types.InlineKeyboardButton("🔑 Войти как существующий мастер", callback_data=encode_callback(Action.LOGIN_EXISTING_MASTER)))
+        markup.add(types.InlineKeyboardButton("➕ Создать нового мастера", callback_data=encode_callback(Action.CREATE_NEW_MASTER)))
         
         self.bot.send_message(message.chat.id, "Выберите действие:", reply_markup=markup)
     
@@ -273,26 +307,25 @@ class SalonBot:
             return
         
         # Получаем мастера по ID
-        masters = self.db.get_masters()
-        master = next((m for m in masters if m[0] == master_id), None)
+        master = self.db.catalog.get_master(master_id)
         
         if not master:
             self.bot.send_message(message.chat.id, "Ошибка: мастер не найден.")
             return
         
         # Проверяем пароль
-        if password == master[6]:  # password field
+        if password == master.password:
             # Пароль верный - входим под мастером
             
             # Если у мастера фиктивный user_id, обновляем его на реальный
-            if master[1] == 111111111:  # фиктивный user_id
+            if master.user_id == 111111111:  # фиктивный user_id
                 self.db.update_master_user_id(master_id, user_id)
             
             self.user_data[user_id]['waiting_for_master_password'] = False
             self.user_data[user_id]['current_master_id'] = master_id
-            self.user_data[user_id]['current_master_name'] = master[2]
+            self.user_data[user_id]['current_master_name'] = master.name
             
-            self.bot.send_message(message.chat.id, f"✅ Успешный вход под мастером '{master[2]}'!")
+            self.bot.send_message(message.chat.id, f"✅ Успешный вход под мастером '{master.name}'!")
             self.show_master_menu(message)
         else:
             # Неверный пароль
@@ -300,19 +333,11 @@ class SalonBot:
     
     def show_master_menu(self, message):
         """Показать меню мастера"""
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        for row in KEYBOARDS['master_menu']:
-            markup.row(*row)
-        
-        self.bot.send_message(message.chat.id, MESSAGES['master_menu'], reply_markup=markup)
+        self.bot.send_message(message.chat.id, MESSAGES['master_menu'], reply_markup=self.markups.master_menu)
     
     def client_mode(self, message):
         """Переключение в режим клиента"""
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        for row in KEYBOARDS['main_menu']:
-            markup.row(*row)
-        
-        self.bot.send_message(message.chat.id, "Режим клиента активирован", reply_markup=markup)
+        self.bot.send_message(message.chat.id, "Режим клиента активирован", reply_markup=self.markups.main_menu)
     
     def add_schedule_start(self, message):
         """Начало добавления расписания с динамическими кнопками"""
@@ -328,7 +353,7 @@ class SalonBot:
         
         markup = types.InlineKeyboardMarkup()
         for date_str, formatted_date in days:
-            button = types.InlineKeyboardButton(formatted_date, callback_data=f"add_sched_date_{date_str}")
+            button = types.InlineKeyboardButton(formatted_date, callback_data=encode_callback(Action.ADD_SCHED_DATE, date_str))
             markup.add(button)
         
         self.bot.send_message(
@@ -360,7 +385,7 @@ class SalonBot:
         
         markup = types.InlineKeyboardMarkup()
         for time_slot in time_slots:
-            button = types.InlineKeyboardButton(time_slot, callback_data=f"add_sched_start_{time_slot}")
+            button = types.InlineKeyboardButton(time_slot, callback_data=encode_callback(Action.ADD_SCHED_START, time_slot))
             markup.add(button)
         
         formatted_date = TimeUtils.format_date_russian(date)
@@ -389,20 +414,17 @@ class SalonBot:
         
         # Вычисляем минимальное время окончания (начало + 2 часа)
         try:
-            start_datetime = datetime.strptime(start_time, "%H:%M")
-            min_end_datetime = start_datetime + timedelta(hours=2)
-            min_end_time = min_end_datetime.strftime("%H:%M")
+            min_end = to_minutes(start_time) + 120
             
             # Генерируем слоты с минимального времени до 22:00
-            end_hour = max(min_end_datetime.hour, 10)  # не раньше 10:00
-            end_time_str = f"{end_hour:02d}:00"
+            end_hour = max(min_end // 60 % 24, 10)  # не раньше 10:00
             
-            time_slots = TimeUtils.generate_time_slots(end_time_str, "22:00", 30)
+            time_slots = fast_time.slot_labels(end_hour * 60, 22 * 60, 30)
             
             markup = types.InlineKeyboardMarkup()
             for time_slot in time_slots:
                 if time_slot > start_time:  # только время после начала работы
-                    button = types.InlineKeyboardButton(time_slot, callback_data=f"add_sched_end_{time_slot}")
+                    button = types.InlineKeyboardButton(time_slot, callback_data=encode_callback(Action.ADD_SCHED_END, time_slot))
                     markup.add(button)
             
             date = self.user_data[user_id].get('schedule_date', '')
@@ -494,129 +516,104 @@ class SalonBot:
             return
         
         master_id = self.user_data[user_id]['current_master_id']
-        appointments = self.db.get_master_appointments(master_id)
+        page = self.db.get_master_appointments_page(master_id)
         
-        if not appointments:
+        if not page.items:
             self.bot.send_message(message.chat.id, "У вас нет записей.")
             return
         
-        text = "👥 Ваши клиенты:\n\n"
-        for app in appointments:
-            formatted_date = TimeUtils.format_date_russian(app[4])  # appointment_date
-            text += f"📅 {formatted_date} в {app[5]}\n"  # appointment_time
-            text += f"👤 Клиент: {app[8]} (@{app[9] or 'без username'})\n"  # first_name, username
-            text += f"💇‍♀️ Услуга: {app[10]}\n\n"  # service_name
+        self.bot.send_message(message.chat.id, self._master_appointments_text(page),
+                              reply_markup=self._next_page_markup(page, Action.MASTER_CLIENTS_PAGE))
+    
+    def show_master_appointments_page(self, call, date: str, time: str, appointment_id: int):
+        """Следующая страница записей мастера"""
+        user_id = call.from_user.id
         
-        self.bot.send_message(message.chat.id, text)
+        # Проверяем, что пользователь вошел под мастером
+        if user_id not in self.user_data or not self.user_data[user_id].get('current_master_id'):
+            self.bot.edit_message_text("Вы не вошли под мастером.", call.message.chat.id, call.message.message_id)
+            return
+        
+        master_id = self.user_data[user_id]['current_master_id']
+        page = self.db.get_master_appointments_page(master_id, (date, time, appointment_id))
+        self._edit_page(call, self._master_appointments_text(page), page, Action.MASTER_CLIENTS_PAGE)
+    
+    @staticmethod
+    def _master_appointments_text(page: Page) -> str:
+        text = "👥 Ваши клиенты:\n\n"
+        for app in page.items:
+            formatted_date = TimeUtils.format_date_russian(app.appointment_date)
+            text += f"📅 {formatted_date} в {app.appointment_time}\n"
+            text += f"👤 Клиент: {app.client_name} (@{app.client_username or 'без username'})\n"
+            text += f"💇‍♀️ Услуга: {app.service_name}\n\n"
+        return text
+    
+    def register_callbacks(self):
+        """Таблица обработчиков inline-кнопок"""
+        as_message = self._message_from_call
+        handlers = {
+            Action.SPECIALIZATION: self.show_masters_by_specialization,
+            Action.MASTER: self.show_master_info,
+            Action.SERVICE: self.select_service,
+            Action.DATE: self.select_date,
+            Action.TIME: self.create_appointment,
+            Action.CANCEL: self.cancel_appointment,
+            Action.LOGIN_EXISTING_MASTER: self.show_masters_for_login,
+            Action.CREATE_NEW_MASTER: self.start_master_registration,
+            Action.LOGIN_MASTER: self.request_master_login_password,
+            Action.DELETE_SCHEDULE: self.delete_specific_schedule,
+            Action.DELETE_ALL_SCHEDULE: self.delete_all_schedule,
+            Action.DELETE_SERVICE: self.delete_specific_service,
+            Action.DELETE_ALL_SERVICES: self.delete_all_services,
+            Action.ADD_SCHED_DATE: self.add_schedule_select_start_time,
+            Action.ADD_SCHED_START: self.add_schedule_select_end_time,
+            Action.ADD_SCHED_END: self.add_schedule_confirm,
+            # Команды меню мастера, вызванные кнопкой
+            Action.MASTER_SCHEDULE: lambda call: self.show_master_schedule(as_message(call)),
+            Action.MASTER_CLIENTS: lambda call: self.show_master_appointments(as_message(call)),
+            Action.ADD_SCHEDULE: lambda call: self.add_schedule_start(as_message(call)),
+            Action.ADD_SERVICE: lambda call: self.add_service_start(as_message(call)),
+            Action.DELETE_SCHEDULE_MENU: lambda call: self.delete_schedule_start(as_message(call)),
+            Action.CLIENT_MODE: lambda call: self.client_mode(as_message(call)),
+            # Следующие страницы списков
+            Action.CLIENT_APPOINTMENTS_PAGE: self.show_my_appointments_page,
+            Action.MASTER_CLIENTS_PAGE: self.show_master_appointments_page,
+            Action.MASTER_SCHEDULE_PAGE: self.show_master_schedule_page,
+            Action.CANCEL_LIST_PAGE: self.show_appointments_to_cancel_page,
+        }
+        for action, handler in handlers.items():
+            self.callbacks.register(action, handler)
+    
+    @staticmethod
+    def _message_from_call(call):
+        """Message-объект из callback для обработчиков команд"""
+        message = types.Message()
+        message.chat = call.message.chat
+        message.from_user = call.from_user
+        return message
     
     def handle_callback(self, call):
         """Обработчик callback запросов"""
         self.bot.answer_callback_query(call.id)
-        
-        data = call.data
-        
-        # Защита от дублирования - проверяем, не обрабатывали ли мы уже этот callback
-        callback_key = f"{call.from_user.id}_{call.id}"
-        if callback_key in self._processed_callbacks:
-            logger.warning(f"Дублированный callback: {callback_key}")
-            return
-        self._processed_callbacks.add(callback_key)
-        
-        # Очищаем старые callback'и (оставляем только последние 1000)
-        if len(self._processed_callbacks) > 1000:
-            self._processed_callbacks.clear()
-        
-        if data.startswith("specialization_"):
-            specialization = data.split("_", 1)[1]
-            self.show_masters_by_specialization(call, specialization)
-        elif data.startswith("master_"):
-            master_id = int(data.split("_")[1])
-            self.show_master_info(call, master_id)
-        elif data.startswith("service_"):
-            service_id = int(data.split("_")[1])
-            if call.from_user.id not in self.user_data:
-                self.user_data[call.from_user.id] = {}
-            self.user_data[call.from_user.id]['selected_service'] = service_id
-            self.show_available_dates(call)
-        elif data.startswith("date_"):
-            date = data.split("_")[1]
-            if call.from_user.id not in self.user_data:
-                self.user_data[call.from_user.id] = {}
-            self.user_data[call.from_user.id]['selected_date'] = date
-            self.show_available_times(call)
-        elif data.startswith("time_"):
-            time = data.split("_")[1]
-            self.create_appointment(call, time)
-        elif data.startswith("cancel_"):
-            appointment_id = int(data.split("_")[1])
-            self.cancel_appointment(call, appointment_id)
-        elif data == "login_existing_master":
-            self.show_masters_for_login(call)
-        elif data == "create_new_master":
-            self.start_master_registration(call)
-        elif data.startswith("login_master_"):
-            master_id = int(data.split("_")[2])
-            self.request_master_login_password(call, master_id)
-        elif data.startswith("delete_schedule_"):
-            schedule_id = int(data.split("_")[2])
-            self.delete_specific_schedule(call, schedule_id)
-        elif data == "delete_all_schedule":
-            self.delete_all_schedule(call)
-        elif data.startswith("delete_service_"):
-            service_id = int(data.split("_")[2])
-            self.delete_specific_service(call, service_id)
-        elif data == "delete_all_services":
-            self.delete_all_services(call)
-        elif data.startswith("add_sched_date_"):
-            date = data.split("_")[3]
-            self.add_schedule_select_start_time(call, date)
-        elif data.startswith("add_sched_start_"):
-            start_time = data.split("_")[3]
-            self.add_schedule_select_end_time(call, start_time)
-        elif data.startswith("add_sched_end_"):
-            end_time = data.split("_")[3]
-            self.add_schedule_confirm(call, end_time)
-        elif data == "master_schedule":
-            # Конвертируем call в message-объект для совместимости
-            message = types.Message()
-            message.chat = call.message.chat
-            message.from_user = call.from_user
-            self.show_master_schedule(message)
-        elif data == "master_clients":
-            # Конвертируем call в message-объект для совместимости
-            message = types.Message()
-            message.chat = call.message.chat
-            message.from_user = call.from_user
-            self.show_master_appointments(message)
-        elif data == "add_schedule":
-            # Конвертируем call в message-объект для совместимости
-            message = types.Message()
-            message.chat = call.message.chat
-            message.from_user = call.from_user
-            self.add_schedule_start(message)
-        elif data == "add_service":
-            # Конвертируем call в message-объект для совместимости
-            message = types.Message()
-            message.chat = call.message.chat
-            message.from_user = call.from_user
-            self.add_service_start(message)
-        elif data == "delete_schedule":
-            # Конвертируем call в message-объект для совместимости
-            message = types.Message()
-            message.chat = call.message.chat
-            message.from_user = call.from_user
-            self.delete_schedule_start(message)
-        elif data == "client_mode":
-            # Конвертируем call в message-объект для совместимости
-            message = types.Message()
-            message.chat = call.message.chat
-            message.from_user = call.from_user
-            self.client_mode(message)
+        self.callbacks.dispatch(call)
+    
+    def select_service(self, call, service_id: int):
+        """Выбор услуги: запоминаем и показываем даты"""
+        if call.from_user.id not in self.user_data:
+            self.user_data[call.from_user.id] = {}
+        self.user_data[call.from_user.id]['selected_service'] = service_id
+        self.show_available_dates(call)
+    
+    def select_date(self, call, date: str):
+        """Выбор даты: запоминаем и показываем время"""
+        if call.from_user.id not in self.user_data:
+            self.user_data[call.from_user.id] = {}
+        self.user_data[call.from_user.id]['selected_date'] = date
+        self.show_available_times(call)
     
     def show_master_info(self, call, master_id):
         """Показать информацию о мастере и его услуги"""
-        masters = self.db.get_masters()
-        master = next((m for m in masters if m[0] == master_id), None)
+        master = self.db.catalog.get_master(master_id)
         
         if not master:
             self.bot.edit_message_text(
@@ -626,9 +623,9 @@ class SalonBot:
             )
             return
         
-        services = self.db.get_services_by_master(master_id)
+        markup = self.markups.master_services(master_id)
         
-        if not services:
+        if not markup:
             self.bot.edit_message_text(
                 "У этого мастера пока нет услуг.",
                 call.message.chat.id,
@@ -637,17 +634,10 @@ class SalonBot:
             return
         
         text = MESSAGES['master_info'].format(
-            address=master[5],
-            social_media=master[4]
+            address=master.address,
+            social_media=master.social_media
         )
         
-        markup = types.InlineKeyboardMarkup()
-        for service in services:
-            duration_str = TimeUtils.format_duration(service[4])
-            button_text = f"{service[2]} - {service[3]} руб. ({duration_str})"
-            button = types.InlineKeyboardButton(button_text, callback_data=f"service_{service[0]}")
-            markup.add(button)
-        
         if call.from_user.id not in self.user_data:
             self.user_data[call.from_user.id] = {}
         self.user_data[call.from_user.id]['selected_master'] = master_id
@@ -686,7 +676,7 @@ class SalonBot:
         # Создаем список уникальных дат из расписания
         available_dates = []
         for schedule_entry in master_schedule:
-            date_str = schedule_entry[2]  # date
+            date_str = schedule_entry.date
             if date_str not in [d[0] for d in available_dates]:
                 formatted_date = TimeUtils.format_date_russian(date_str)
                 available_dates.append((date_str, formatted_date))
@@ -701,7 +691,7 @@ class SalonBot:
         
         markup = types.InlineKeyboardMarkup()
         for date_str, formatted_date in available_dates:
-            button = types.InlineKeyboardButton(formatted_date, callback_data=f"date_{date_str}")
+            button = types.InlineKeyboardButton(formatted_date, callback_data=encode_callback(Action.DATE, date_str))
             markup.add(button)
         
         self.bot.edit_message_text(
@@ -711,7 +701,7 @@ class SalonBot:
             reply_markup=markup
         )
     
-    def show_available_times(self, call):
+    def show_available_times(self, call, header: str = "Выберите время:"):
         """Показать доступное время"""
         user_data = self.user_data.get(call.from_user.id, {})
         master_id = user_data.get('selected_master')
@@ -725,55 +715,23 @@ class SalonBot:
             )
             return
         
-        # Получаем расписание мастера на выбранную дату
-        schedule = self.db.get_available_schedule(master_id, date)
-        
-        if not schedule:
-            self.bot.edit_message_text(
-                "На выбранную дату нет доступного времени.",
-                call.message.chat.id,
-                call.message.message_id
-            )
-            return
-        
-        # Получаем существующие записи на эту дату для этого мастера
-        existing_appointments = self.db.get_appointments_by_date(date)
-        # Фильтруем только записи к выбранному мастеру
-        existing_appointments = [app for app in existing_appointments if app[2] == master_id]
+        # Продолжительность выбранной услуги
+        service_duration = 60  # По умолчанию
+        if user_data.get('selected_service'):
+            service = self.db.catalog.get_service(user_data['selected_service'])
+            if service and service.master_id == master_id:
+                service_duration = service.duration
         
-        # Отладочная информация
-        logger.info(f"Расписание мастера {master_id} на {date}: {schedule}")
-        logger.info(f"Существующие записи на {date} для мастера {master_id}: {existing_appointments}")
+        # Свободные слоты дня берутся из кэша, прошедшее время отсекается
+        available_slots = [
+            format_minutes(start) for start in
+            self.db.get_free_slots(master_id, date, service_duration, not_before=minutes_not_before(date))
+        ]
         
-        # Генерируем временные слоты
         markup = types.InlineKeyboardMarkup()
-        available_slots = []
-        
-        for sched in schedule:
-            start_time = sched[3]  # start_time
-            end_time = sched[4]    # end_time
-            
-            time_slots = TimeUtils.generate_time_slots(start_time, end_time, 60)
-            
-            for time_slot in time_slots:
-                # Проверяем, не в прошлом ли время
-                if not TimeUtils.is_time_in_past(date, time_slot):
-                    # Получаем продолжительность выбранной услуги
-                    service_duration = 60  # По умолчанию
-                    if user_data.get('selected_service'):
-                        services = self.db.get_services_by_master(master_id)
-                        service = next((s for s in services if s[0] == user_data['selected_service']), None)
-                        if service:
-                            service_duration = service[4]  # duration
-                    
-                    # Проверяем доступность слота
-                    is_available = TimeUtils.is_slot_available(time_slot, existing_appointments, service_duration)
-                    logger.info(f"Слот {time_slot} доступен: {is_available}")
-                    
-                    if is_available:
-                        button = types.InlineKeyboardButton(time_slot, callback_data=f"time_{time_slot}")
-                        markup.add(button)
-                        available_slots.append(time_slot)
+        for time_slot in available_slots:
+            button = types.InlineKeyboardButton(time_slot, callback_data=encode_callback(Action.TIME, time_slot))
+            markup.add(button)
         
         logger.info(f"Доступные слоты: {available_slots}")
         
@@ -786,7 +744,7 @@ class SalonBot:
             return
         
         self.bot.edit_message_text(
-            "Выберите время:",
+            header,
             call.message.chat.id,
             call.message.message_id,
             reply_markup=markup
@@ -809,24 +767,33 @@ class SalonBot:
             )
             return
         
-        # Создаем запись (конфликт времени уже проверен в show_available_times)
-        appointment_id = self.db.create_appointment(user_id, master_id, service_id, date, time)
+        # Проверка занятости и создание записи одной транзакцией
+        result = self.db.book_appointment(user_id, master_id, service_id, date, time)
         
-        # Получаем информацию для подтверждения
-        masters = self.db.get_masters()
-        master = next((m for m in masters if m[0] == master_id), None)
-        services = self.db.get_services_by_master(master_id)
-        service = next((s for s in services if s[0] == service_id), None)
+        if result.status is BookingStatus.UNKNOWN_SERVICE:
+            self.bot.edit_message_text(
+                "Ошибка: услуга не найдена.",
+                call.message.chat.id,
+                call.message.message_id
+            )
+            return
         
-        formatted_date = TimeUtils.format_date_russian(date)
-        duration_str = TimeUtils.format_duration(service[4])  # service duration
+        if not result.booked:
+            # Время заняли или оно вышло из расписания - показываем актуальные слоты
+            header = MESSAGES['slot_taken'] if result.status is BookingStatus.CONFLICT else MESSAGES['slot_unavailable']
+            self.show_available_times(call, header)
+            return
+        
+        appointment = result.appointment
+        formatted_date = TimeUtils.format_date_russian(appointment.appointment_date)
+        duration_str = TimeUtils.format_duration(appointment.duration)
         
         text = MESSAGES['appointment_created'].format(
             date=formatted_date,
-            time=time,
-            master=master[2],
-            service=service[2],
-            price=service[3]
+            time=appointment.appointment_time,
+            master=appointment.master_name,
+            service=appointment.service_name,
+            price=appointment.price
         )
         text += f"\n⏱️ Продолжительность: {duration_str}"
         text += f"\n🔔 Мы отправим вам напоминание за час до записи!"
@@ -860,9 +827,9 @@ class SalonBot:
     
     def show_masters_for_login(self, call):
         """Показать список мастеров для входа"""
-        masters = self.db.get_masters_list()
+        markup = self.markups.login_masters()
         
-        if not masters:
+        if not markup:
             self.bot.edit_message_text(
                 "Нет доступных мастеров для входа.",
                 call.message.chat.id,
@@ -870,12 +837,6 @@ class SalonBot:
             )
             return
         
-        markup = types.InlineKeyboardMarkup()
-        for master in masters:
-            button_text = f"{master[1]} ({master[2]})"  # name (specialization)
-            button = types.InlineKeyboardButton(button_text, callback_data=f"login_master_{master[0]}")
-            markup.add(button)
-        
         self.bot.edit_message_text(
             "Выберите мастера для входа:",
             call.message.chat.id,
@@ -906,9 +867,8 @@ class SalonBot:
         self.user_data[user_id]['waiting_for_master_password'] = True
         
         # Получаем имя мастера
-        masters = self.db.get_masters()
-        master = next((m for m in masters if m[0] == master_id), None)
-        master_name = master[2] if master else "Неизвестный мастер"
+        master = self.db.catalog.get_master(master_id)
+        master_name = master.name if master else "Неизвестный мастер"
         
         self.bot.edit_message_text(
             f"Введите пароль для входа под мастером '{master_name}':",
@@ -928,15 +888,11 @@ class SalonBot:
             
             master_id = self.db.add_master(user_id, name, specialization, social_media, address, password)
             
-            markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-            for row in KEYBOARDS['master_menu']:
-                markup.row(*row)
-            
             self.bot.send_message(
                 message.chat.id,
                 f"✅ Вы успешно зарегистрированы как мастер '{name}'!\n"
                 f"Пароль: {password}",
-                reply_markup=markup
+                reply_markup=self.markups.master_menu
             )
             
         except Exception as e:
@@ -1036,25 +992,40 @@ class SalonBot:
         master_id = self.user_data[user_id]['current_master_id']
         master_name = self.user_data[user_id]['current_master_name']
         
-        # Получаем расписание мастера
-        schedule = self.db.get_master_schedule(master_id)
+        # Получаем первую страницу расписания мастера
+        page = self.db.get_master_schedule_page(master_id)
         
-        if not schedule:
+        if not page.items:
             self.bot.send_message(message.chat.id, f"У мастера '{master_name}' пока нет расписания.")
             return
         
+        self.bot.send_message(message.chat.id, self._master_schedule_text(master_name, page),
+                              reply_markup=self._next_page_markup(page, Action.MASTER_SCHEDULE_PAGE))
+    
+    def show_master_schedule_page(self, call, date: str, time: str, schedule_id: int):
+        """Следующая страница расписания мастера"""
+        user_id = call.from_user.id
+        
+        # Проверяем, что пользователь вошел под мастером
+        if user_id not in self.user_data or not self.user_data[user_id].get('current_master_id'):
+            self.bot.edit_message_text("Вы не вошли под мастером.", call.message.chat.id, call.message.message_id)
+            return
+        
+        master_id = self.user_data[user_id]['current_master_id']
+        master_name = self.user_data[user_id]['current_master_name']
+        page = self.db.get_master_schedule_page(master_id, (date, time, schedule_id))
+        self._edit_page(call, self._master_schedule_text(master_name, page), page, Action.MASTER_SCHEDULE_PAGE)
+    
+    @staticmethod
+    def _master_schedule_text(master_name: str, page: Page) -> str:
         text = f"📋 Расписание мастера '{master_name}':\n\n"
         
         # Группируем по датам
-        for s in schedule:
-            date = s[2]  # date
-            start_time = s[3]  # start_time
-            end_time = s[4]  # end_time
-            formatted_date = TimeUtils.format_date_russian(date)
+        for s in page.items:
+            formatted_date = TimeUtils.format_date_russian(s.date)
             text += f"📅 {formatted_date}:\n"
-            text += f"   ⏰ {start_time} - {end_time}\n\n"
-        
-        self.bot.send_message(message.chat.id, text)
+            text += f"   ⏰ {s.start_time} - {s.end_time}\n\n"
+        return text
     
     def delete_schedule_start(self, message):
         """Начало удаления расписания"""
@@ -1079,14 +1050,14 @@ class SalonBot:
         markup = types.InlineKeyboardMarkup()
         
         for s in schedule:
-            date = s[2]  # date
-            schedule_id = s[0]  # id
+            date = s.date
+            schedule_id = s.id
             formatted_date = TimeUtils.format_date_russian(date)
             button_text = f"🗑️ {formatted_date}"
-            button = types.InlineKeyboardButton(button_text, callback_data=f"delete_schedule_{schedule_id}")
+            button = types.InlineKeyboardButton(button_text, callback_data=encode_callback(Action.DELETE_SCHEDULE, schedule_id))
             markup.add(button)
         
-        markup.add(types.InlineKeyboardButton("🗑️ Удалить всё расписание", callback_data="delete_all_schedule"))
+        markup.add(types.InlineKeyboardButton("🗑️ Удалить всё расписание", callback_data=encode_callback(Action.DELETE_ALL_SCHEDULE)))
         
         self.bot.send_message(
             message.chat.id,
@@ -1166,17 +1137,17 @@ class SalonBot:
         markup = types.InlineKeyboardMarkup()
         
         for service in services:
-            service_id = service[0]  # id
-            service_name = service[2]  # name
-            service_price = service[3]  # price
-            service_duration = service[4]  # duration
+            service_id = service.id
+            service_name = service.name
+            service_price = service.price
+            service_duration = service.duration
             
             duration_str = TimeUtils.format_duration(service_duration)
             button_text = f"🗑️ {service_name} - {service_price} руб. ({duration_str})"
-            button = types.InlineKeyboardButton(button_text, callback_data=f"delete_service_{service_id}")
+            button = types.InlineKeyboardButton(button_text, callback_data=encode_callback(Action.DELETE_SERVICE, service_id))
             markup.add(button)
         
-        markup.add(types.InlineKeyboardButton("🗑️ Удалить все услуги", callback_data="delete_all_services"))
+        markup.add(types.InlineKeyboardButton("🗑️ Удалить все услуги", callback_data=encode_callback(Action.DELETE_ALL_SERVICES)))
         
         self.bot.send_message(
             message.chat.id,
@@ -1237,14 +1208,35 @@ class SalonBot:
         """Запуск бота"""
         logger.info("🚀 Salon Bot запущен!")
         
-        while True:
-            try:
-                self.bot.polling(none_stop=True, interval=1, timeout=20)
-            except KeyboardInterrupt:
-                logger.info("🛑 Bot stopped by user")
-                break
-            except Exception as e:
-                logger.error(f"Ошибка в боте: {e}")
-                logger.info("🔄 Перезапуск бота через 5 секунд...")
-                import time
-                time.sleep(5)
\ No newline at end of file
+        # Обновления одного пользователя обрабатываются по порядку, разных - параллельно
+        dispatcher = None
+        if not self.bot.threaded:
+            dispatcher = ShardedDispatcher(self.bot.process_new_updates, name='polling')
+            dispatcher.install(self.bot)
+            dispatcher.start()
+        
+        try:
+            while True:
+                try:
+                    self.bot.polling(none_stop=True, interval=1, timeout=20)
+                except KeyboardInterrupt:
+                    logger.info("🛑 Bot stopped by user")
+                    break
+                except Exception as e:
+                    logger.error(f"Ошибка в боте: {e}")
+                    logger.info("🔄 Перезапуск бота через 5 секунд...")
+                    import time
+                    time.sleep(5)
+        finally:
+            if dispatcher:
+                dispatcher.stop()
+                logger.info(f"Статистика обработки обновлений: {dispatcher.stats()}")
+            self.shutdown()
+    
+    def shutdown(self):
+        """Отправка поставленных сообщений и запись сессий перед остановкой"""
+        self.outbound.stop()
+        self.user_data.stop()
+        logger.info(f"Статистика отправки сообщений: {self.outbound.stats()}")
+        logger.info(f"Статистика сессий: {self.user_data.stats()}")
+        logger.info(f"Повторные обновления: {self.dedup.stats()}")
\ No newline at end of file
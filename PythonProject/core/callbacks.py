@@ -0,0 +1,242 @@
+"""
+callback_data inline-кнопок: компактная упаковка и маршрутизация
+
+Кнопка хранит код действия (1 байт) и аргументы в двоичном виде: целые -
+4 байта, даты - 2 байта (дни от 2000-01-01), время - 2 байта (минуты от
+полуночи), строки - длина и UTF-8. Всё кодируется в base64url с префиксом
+"~" и укладывается в ограничение Telegram в 64 байта. Кнопки старого
+формата ("master_5", "add_sched_date_2025-01-01"), оставшиеся в чатах,
+разбираются по таблице префиксов.
+"""
+import base64
+import logging
+import struct
+import threading
+from datetime import date
+from enum import IntEnum
+from typing import Callable, Dict, Optional, Tuple
+from utils.availability import format_minutes, to_minutes
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на callback_data
+CALLBACK_DATA_LIMIT = 64
+
+# Признак нового формата: в base64url и в префиксах старого формата его нет
+_MARKER = '~'
+# Длина упакованных байт, base64 которых с маркером помещается в лимит
+_PAYLOAD_LIMIT = (CALLBACK_DATA_LIMIT - len(_MARKER)) * 3 // 4
+
+_EPOCH = date(2000, 1, 1).toordinal()
+
+
+class Action(IntEnum):
+    """Код действия кнопки (первый байт callback_data)"""
+    SPECIALIZATION = 1
+    MASTER = 2
+    SERVICE = 3
+    DATE = 4
+    TIME = 5
+    CANCEL = 6
+    LOGIN_EXISTING_MASTER = 7
+    CREATE_NEW_MASTER = 8
+    LOGIN_MASTER = 9
+    DELETE_SCHEDULE = 10
+    DELETE_ALL_SCHEDULE = 11
+    DELETE_SERVICE = 12
+    DELETE_ALL_SERVICES = 13
+    ADD_SCHED_DATE = 14
+    ADD_SCHED_START = 15
+    ADD_SCHED_END = 16
+    MASTER_SCHEDULE = 17
+    MASTER_CLIENTS = 18
+    ADD_SCHEDULE = 19
+    ADD_SERVICE = 20
+    DELETE_SCHEDULE_MENU = 21
+    CLIENT_MODE = 22
+    CLIENT_APPOINTMENTS_PAGE = 23
+    MASTER_CLIENTS_PAGE = 24
+    MASTER_SCHEDULE_PAGE = 25
+    CANCEL_LIST_PAGE = 26
+
+
+# Типы аргументов
+INT, DATE, TIME, STR = 'int', 'date', 'time', 'str'
+
+# Аргументы каждого действия
+ARGUMENTS: Dict[Action, Tuple[str, ...]] = {
+    # id любого мастера специализации: название - свободный текст и может не поместиться в 64 байта
+    Action.SPECIALIZATION: (INT,),
+    Action.MASTER: (INT,),
+    Action.SERVICE: (INT,),
+    Action.DATE: (DATE,),
+    Action.TIME: (TIME,),
+    Action.CANCEL: (INT,),
+    Action.LOGIN_MASTER: (INT,),
+    Action.DELETE_SCHEDULE: (INT,),
+    Action.DELETE_SERVICE: (INT,),
+    Action.ADD_SCHED_DATE: (DATE,),
+    Action.ADD_SCHED_START: (TIME,),
+    Action.ADD_SCHED_END: (TIME,),
+    # Курсор следующей страницы списка: (дата, время, id) последней показанной строки
+    Action.CLIENT_APPOINTMENTS_PAGE: (DATE, TIME, INT),
+    Action.MASTER_CLIENTS_PAGE: (DATE, TIME, INT),
+    Action.MASTER_SCHEDULE_PAGE: (DATE, TIME, INT),
+    Action.CANCEL_LIST_PAGE: (DATE, TIME, INT),
+}
+
+# Старый формат: кнопки без аргументов
+_LEGACY_EXACT = {
+    'login_existing_master': Action.LOGIN_EXISTING_MASTER,
+    'create_new_master': Action.CREATE_NEW_MASTER,
+    'delete_all_schedule': Action.DELETE_ALL_SCHEDULE,
+    'delete_all_services': Action.DELETE_ALL_SERVICES,
+    'master_schedule': Action.MASTER_SCHEDULE,
+    'master_clients': Action.MASTER_CLIENTS,
+    'add_schedule': Action.ADD_SCHEDULE,
+    'add_service': Action.ADD_SERVICE,
+    'delete_schedule': Action.DELETE_SCHEDULE_MENU,
+    'client_mode': Action.CLIENT_MODE,
+}
+
+# Старый формат: префикс и один аргумент (остаток строки целиком)
+_LEGACY_PREFIXES = {
+    'specialization_': Action.SPECIALIZATION,
+    'master_': Action.MASTER,
+    'service_': Action.SERVICE,
+    'date_': Action.DATE,
+    'time_': Action.TIME,
+    'cancel_': Action.CANCEL,
+    'login_master_': Action.LOGIN_MASTER,
+    'delete_schedule_': Action.DELETE_SCHEDULE,
+    'delete_service_': Action.DELETE_SERVICE,
+    'add_sched_date_': Action.ADD_SCHED_DATE,
+    'add_sched_start_': Action.ADD_SCHED_START,
+    'add_sched_end_': Action.ADD_SCHED_END,
+}
+# Сначала длинные префиксы: "login_master_" раньше "master_"
+_LEGACY_ORDER = sorted(_LEGACY_PREFIXES, key=len, reverse=True)
+# Старые кнопки этих действий хранят строку, а не id
+_LEGACY_TEXT = {Action.SPECIALIZATION}
+
+
+def _pack(kind: str, value) -> bytes:
+    if kind == INT:
+        return struct.pack('>I', value)
+    if kind == DATE:
+        day = value if isinstance(value, date) else date.fromisoformat(value)
+        return struct.pack('>H', day.toordinal() - _EPOCH)
+    if kind == TIME:
+        return struct.pack('>H', value if isinstance(value, int) else to_minutes(value))
+    raw = value.encode('utf-8')
+    if len(raw) > 255:
+        raise ValueError("строка длиннее 255 байт")
+    return struct.pack('B', len(raw)) + raw
+
+
+def encode_callback(action: Action, *args) -> str:
+    """
+    callback_data для кнопки действия action
+    
+    Даты передаются как "YYYY-MM-DD" или date, время - как "HH:MM" или
+    минуты от полуночи.
+    
+    Raises:
+        ValueError: Неверное число аргументов или данные не помещаются в 64 байта
+    """
+    kinds = ARGUMENTS.get(action, ())
+    if len(args) != len(kinds):
+        raise ValueError(f"{action.name}: ожидается аргументов {len(kinds)}, передано {len(args)}")
+    payload = bytes((action,)) + b''.join(_pack(kind, value) for kind, value in zip(kinds, args))
+    if len(payload) > _PAYLOAD_LIMIT:
+        raise ValueError(f"{action.name}: callback_data длиннее {CALLBACK_DATA_LIMIT} байт")
+    return _MARKER + base64.urlsafe_b64encode(payload).rstrip(b'=').decode('ascii')
+
+
+def _decode_compact(data: str) -> Tuple[Action, tuple]:
+    encoded = data[len(_MARKER):]
+    payload = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+    action = Action(payload[0])
+    offset = 1
+    args = []
+    for kind in ARGUMENTS.get(action, ()):
+        if kind == INT:
+            args.append(struct.unpack_from('>I', payload, offset)[0])
+            offset += 4
+        elif kind == DATE:
+            args.append(date.fromordinal(_EPOCH + struct.unpack_from('>H', payload, offset)[0]).isoformat())
+            offset += 2
+        elif kind == TIME:
+            args.append(format_minutes(struct.unpack_from('>H', payload, offset)[0]))
+            offset += 2
+        else:
+            length = payload[offset]
+            args.append(payload[offset + 1:offset + 1 + length].decode('utf-8'))
+            offset += 1 + length
+    return action, tuple(args)
+
+
+def _decode_legacy(data: str) -> Optional[Tuple[Action, tuple]]:
+    action = _LEGACY_EXACT.get(data)
+    if action is not None:
+        return action, ()
+    for prefix in _LEGACY_ORDER:
+        if not data.startswith(prefix):
+            continue
+        action = _LEGACY_PREFIXES[prefix]
+        value = data[len(prefix):]
+        return action, ((int(value),) if ARGUMENTS[action] == (INT,) and action not in _LEGACY_TEXT else (value,))
+    return None
+
+
+def decode_callback(data: str) -> Optional[Tuple[Action, tuple]]:
+    """
+    Разбор callback_data (нового или старого формата)
+    
+    Returns:
+        (действие, аргументы) или None, если данные не распознаны
+    """
+    try:
+        if data.startswith(_MARKER):
+            return _decode_compact(data)
+        return _decode_legacy(data)
+    except (ValueError, IndexError, struct.error):
+        return None
+
+
+class CallbackRouter:
+    """
+    Таблица обработчиков callback'ов по коду действия
+    
+    Обработчик вызывается как handler(call, *args) с уже разобранными
+    аргументами; поиск - одно обращение к словарю.
+    """
+    
+    def __init__(self):
+        self._handlers: Dict[Action, Callable] = {}
+        self._lock = threading.Lock()
+        self.counters = {'dispatched': 0, 'legacy': 0, 'unknown': 0}
+    
+    def register(self, action: Action, handler: Callable):
+        self._handlers[action] = handler
+    
+    def dispatch(self, call) -> bool:
+        """Вызов обработчика callback'а; False, если данные не распознаны"""
+        decoded = decode_callback(call.data or '')
+        handler = self._handlers.get(decoded[0]) if decoded else None
+        with self._lock:
+            if handler is None:
+                self.counters['unknown'] += 1
+            else:
+                self.counters['dispatched'] += 1
+                if not call.data.startswith(_MARKER):
+                    self.counters['legacy'] += 1
+        if handler is None:
+            logger.warning(f"Неизвестный callback: {call.data!r}")
+            return False
+        handler(call, *decoded[1])
+        return True
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
@@ -0,0 +1,115 @@
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+from core.records import Master, Service
+
+logger = logging.getLogger(__name__)
+
+
+class _CatalogSnapshot:
+    """Неизменяемый снимок каталога с индексами для поиска за O(1)"""
+    
+    __slots__ = ('masters', 'masters_by_id', 'services_by_id', 'services_by_master',
+                 'masters_by_specialization', 'specializations', 'loaded_at')
+    
+    def __init__(self, masters: List[Master], services: List[Service]):
+        self.masters = masters
+        self.masters_by_id = {master.id: master for master in masters}
+        self.services_by_id = {service.id: service for service in services}
+        
+        self.services_by_master: Dict[int, List[Service]] = {}
+        for service in services:
+            self.services_by_master.setdefault(service.master_id, []).append(service)
+        
+        self.masters_by_specialization: Dict[str, List[Master]] = {}
+        for master in masters:
+            if master.specialization:
+                self.masters_by_specialization.setdefault(master.specialization, []).append(master)
+        self.specializations = sorted(self.masters_by_specialization)
+        self.loaded_at = time.monotonic()
+
+
+class CatalogCache:
+    """
+    Read-through кэш каталога: мастера, услуги и специализации
+    
+    Каталог меняется несколько раз в день, а читается почти на каждый callback,
+    поэтому он целиком загружается двумя запросами и хранится в памяти до
+    инвалидации (записью через Database) или истечения ttl (изменения из других
+    процессов, например скриптов администрирования).
+    """
+    
+    def __init__(self, loader: Callable[[], Tuple[List[Master], List[Service]]], ttl: float = None):
+        """
+        Args:
+            loader: Функция, возвращающая (все мастера, все услуги)
+            ttl: Время жизни снимка в секундах (None - без ограничения)
+        """
+        self._loader = loader
+        self.ttl = ttl
+        self._snapshot: Optional[_CatalogSnapshot] = None
+        self._lock = threading.Lock()
+        
+        self.version = 0  # Увеличивается при каждой инвалидации и перезагрузке по ttl
+        self.hits = 0
+        self.misses = 0
+    
+    def _get(self) -> _CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and (self.ttl is None or time.monotonic() - snapshot.loaded_at < self.ttl):
+            self.hits += 1
+            return snapshot
+        
+        with self._lock:
+            # Пока ждали блокировку, снимок мог загрузить другой поток
+            snapshot = self._snapshot
+            if snapshot is None or (self.ttl is not None and time.monotonic() - snapshot.loaded_at >= self.ttl):
+                self.misses += 1
+                if snapshot is not None:
+                    self.version += 1  # каталог мог измениться другим процессом
+                snapshot = self._snapshot = _CatalogSnapshot(*self._loader())
+                logger.debug(f"Каталог загружен: {len(snapshot.masters)} мастеров, {len(snapshot.services_by_id)} услуг")
+            else:
+                self.hits += 1
+            return snapshot
+    
+    def invalidate(self):
+        """Сброс кэша после изменения каталога"""
+        # Под блокировкой, чтобы не сохранить снимок, загруженный до изменения
+        with self._lock:
+            self.version += 1
+            self._snapshot = None
+    
+    def current_version(self) -> int:
+        """Версия каталога с проверкой ttl: истекший снимок перезагружается и версия растет"""
+        self._get()
+        return self.version
+    
+    def get_masters(self) -> List[Master]:
+        return self._get().masters
+    
+    def get_master(self, master_id: int) -> Optional[Master]:
+        return self._get().masters_by_id.get(master_id)
+    
+    def get_service(self, service_id: int) -> Optional[Service]:
+        return self._get().services_by_id.get(service_id)
+    
+    def get_services(self, master_id: int) -> List[Service]:
+        return self._get().services_by_master.get(master_id, [])
+    
+    def get_specializations(self) -> List[str]:
+        return self._get().specializations
+    
+    def get_masters_by_specialization(self, specialization: str) -> List[Master]:
+        return self._get().masters_by_specialization.get(specialization, [])
+    
+    def stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'version': self.version,
+        }
@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(RuntimeError):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений SQLite
+    
+    Соединения переиспользуются между вызовами вместо того, чтобы
+    открываться и закрываться на каждый запрос. Одновременно выдается
+    не более pool_size соединений, простаивающие дольше idle_timeout
+    секунд закрываются.
+    """
+    
+    def __init__(self, db_path: str, pool_size: int = 5, idle_timeout: float = 300.0,
+                 acquire_timeout: float = 10.0,
+                 on_connect: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.db_path = db_path
+        self.pool_size = max(1, pool_size)
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.on_connect = on_connect
+        
+        self._idle: List[Tuple[sqlite3.Connection, float]] = []  # (соединение, время возврата)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._closed = False
+        
+        # Статистика работы пула
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Открытие нового соединения"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        if self.on_connect:
+            self.on_connect(conn)
+        self.created += 1
+        return conn
+    
+    def _evict_idle(self, now: float) -> List[sqlite3.Connection]:
+        """Извлечение простаивающих соединений (вызывается под блокировкой)"""
+        if self.idle_timeout is None:
+            return []
+        expired = [conn for conn, released_at in self._idle if now - released_at > self.idle_timeout]
+        if expired:
+            self._idle = [(conn, released_at) for conn, released_at in self._idle
+                          if now - released_at <= self.idle_timeout]
+            self.evicted += len(expired)
+        return expired
+    
+    def acquire(self) -> sqlite3.Connection:
+        """Получение соединения из пула"""
+        if self._closed:
+            raise RuntimeError("Пул соединений закрыт")
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolTimeoutError(
+                f"Нет свободных соединений с {self.db_path} (размер пула {self.pool_size})"
+            )
+        
+        try:
+            with self._lock:
+                expired = self._evict_idle(time.monotonic())
+                conn = self._idle.pop()[0] if self._idle else None
+            for stale in expired:
+                stale.close()
+            
+            if conn is None:
+                conn = self._connect()
+            else:
+                self.reused += 1
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+    
+    def release(self, conn: sqlite3.Connection):
+        """Возврат соединения в пул"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                if self._closed:
+                    conn.close()
+                else:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            self._slots.release()
+    
+    @contextmanager
+    def connection(self):
+        """Контекстный менеджер: commit при успехе, rollback при ошибке"""
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        finally:
+            # release() откатывает незавершенную транзакцию
+            self.release(conn)
+    
+    def evict_idle(self):
+        """Принудительное закрытие простаивающих соединений"""
+        with self._lock:
+            expired = self._evict_idle(time.monotonic())
+        for conn in expired:
+            conn.close()
+    
+    def close(self):
+        """Закрытие всех свободных соединений"""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+    
+    def stats(self) -> dict:
+        """Статистика пула"""
+        with self._lock:
+            idle = len(self._idle)
+        return {
+            'pool_size': self.pool_size,
+            'idle': idle,
+            'created': self.created,
+            'reused': self.reused,
+            'evicted': self.evicted,
+        }
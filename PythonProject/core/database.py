@@ -1,91 +1,97 @@
 import sqlite3
 import logging
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Callable, List, Optional, Tuple
+from core.connection_pool import ConnectionPool
+from core.migrations import MigrationRunner
+from core.records import (row_factory, User, Master, MasterListItem, Service, ScheduleEntry, ClientAppointment,
+                          MasterAppointment, AppointmentDetails, BusyInterval, AppointmentSpan, ReminderAppointment,
+                          BookingConfirmation, BookingResult, BookingStatus, OutboxItem, PendingReminder,
+                          Page, PageCursor, FIRST_PAGE)
+from core.catalog_cache import CatalogCache
+from core.slot_cache import SlotCache
+from core.outbox import ENQUEUE_REMINDERS_SQL
+from utils.availability import DayAvailability, DEFAULT_DURATION, format_minutes, minutes_not_before, to_minutes
+from utils import fast_time
+from config.settings import (DB_POOL_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_ACQUIRE_TIMEOUT, SQLITE_PRAGMAS,
+                             CATALOG_CACHE_TTL, SLOT_CACHE_SIZE, LIST_PAGE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+# Записи не длиннее суток: нижняя граница start_at при поиске пересечений.
+# add_service не принимает услуги длиннее; услуги, заведенные SQL в обход
+# Database, длиннее суток быть не должны, иначе пересечения с ними не найдутся
+MAX_APPOINTMENT_SECONDS = 24 * 3600
+
+
+def _padded_time(time_str: str) -> str:
+    """Время "H:MM" в виде "HH:MM": start_at/end_at считаются SQLite только из такой строки"""
+    return format_minutes(to_minutes(time_str))
+
+
+def _minutes(column: str) -> str:
+    """SQL-выражение: время HH:MM из column в минутах от полуночи"""
+    return (f"(CAST(substr({column}, 1, instr({column}, ':') - 1) AS INTEGER) * 60"
+            f" + CAST(substr({column}, instr({column}, ':') + 1) AS INTEGER))")
+
+
+def _after_cursor(date: str, time: str, row_id: str) -> str:
+    """
+    SQL-условие keyset-пагинации: строка идет после курсора (:date, :time, :id)
+    
+    Отдельное условие date >= :date дает диапазон по индексу, остальное
+    уточняет порядок внутри дня курсора.
+    """
+    return (f"{date} >= :date AND ({date} > :date OR {time} > :time "
+            f"OR ({time} = :time AND {row_id} > :id))")
+
+
+# Списки колонок под записи из core.records (порядок полей совпадает)
+MASTER_COLUMNS = 'id, user_id, name, specialization, social_media, address, password'
+SERVICE_COLUMNS = 'id, master_id, name, price, duration'
+SCHEDULE_COLUMNS = (f"id, master_id, date, start_time, end_time, is_available, "
+                    f"{_minutes('start_time')}, {_minutes('end_time')}")
+APPOINTMENT_COLUMNS = ('a.id, a.client_id, a.master_id, a.service_id, '
+                       'a.appointment_date, a.appointment_time, a.status, a.created_at')
+APPOINTMENT_DETAILS_COLUMNS = (f"{APPOINTMENT_COLUMNS}, u.first_name as client_name, m.name as master_name, "
+                               f"s.name as service_name, s.duration, m.address, {_minutes('a.appointment_time')}")
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: dict = None):
+    """Применение профиля PRAGMA к соединению"""
+    for name, value in (SQLITE_PRAGMAS if pragmas is None else pragmas).items():
+        conn.execute(f"PRAGMA {name} = {value}")
+
 
 class Database:
     def __init__(self, db_path: str = "data/salon_bot.db"):
         self.db_path = db_path
+        # Пул долгоживущих соединений вместо sqlite3.connect() на каждый вызов
+        self.pool = ConnectionPool(
+            db_path,
+            pool_size=DB_POOL_SIZE,
+            idle_timeout=DB_POOL_IDLE_TIMEOUT,
+            acquire_timeout=DB_POOL_ACQUIRE_TIMEOUT,
+            on_connect=apply_pragmas
+        )
+        # Кэш каталога (мастера, услуги), сбрасывается методами, которые его меняют
+        self.catalog = CatalogCache(self._load_catalog, ttl=CATALOG_CACHE_TTL)
+        # Свободные слоты по (мастер, дата, длительность), сбрасываются при изменении записей и расписания
+        self.slots = SlotCache(maxsize=SLOT_CACHE_SIZE)
+        # Подписчики на изменение напоминаний записи (ReminderWheel)
+        self._reminder_listeners: List[Callable[[int, List[PendingReminder]], None]] = []
         self.init_database()
+        logger.info("SQLite %s: %s", self.db_path,
+                    ", ".join(f"{name}={value}" for name, value in self.get_pragma_report().items()))
     
     def init_database(self):
-        """Инициализация базы данных и создание таблиц"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Таблица пользователей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    is_master BOOLEAN DEFAULT FALSE,
-                    phone TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица мастеров
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS masters (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER UNIQUE,
-                    name TEXT NOT NULL,
-                    specialization TEXT,
-                    social_media TEXT,
-                    address TEXT,
-                    password TEXT DEFAULT 'master123',
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # Таблица услуг
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS services (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    master_id INTEGER,
-                    name TEXT NOT NULL,
-                    price DECIMAL(10,2),
-                    duration INTEGER, -- в минутах
-                    FOREIGN KEY (master_id) REFERENCES masters (id)
-                )
-            ''')
-            
-            # Таблица расписания мастеров
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS schedule (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    master_id INTEGER,
-                    date DATE,
-                    start_time TIME,
-                    end_time TIME,
-                    is_available BOOLEAN DEFAULT TRUE,
-                    FOREIGN KEY (master_id) REFERENCES masters (id)
-                )
-            ''')
-            
-            # Таблица записей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS appointments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    client_id INTEGER,
-                    master_id INTEGER,
-                    service_id INTEGER,
-                    appointment_date DATE,
-                    appointment_time TIME,
-                    status TEXT DEFAULT 'active', -- active, cancelled, completed
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (client_id) REFERENCES users (user_id),
-                    FOREIGN KEY (master_id) REFERENCES masters (id),
-                    FOREIGN KEY (service_id) REFERENCES services (id)
-                )
-            ''')
-            
-            conn.commit()
+        """Инициализация базы данных: применение недостающих миграций схемы"""
+        version = MigrationRunner(self.pool).run()
+        logger.info(f"🗄️ Версия схемы БД: {version}")
     
     def add_user(self, user_id: int, username: str, first_name: str, is_master: bool = False, phone: str = None):
         """Добавление пользователя"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT OR REPLACE INTO users (user_id, username, first_name, is_master, phone)
@@ -95,19 +101,21 @@ class Database:
     
     def get_user(self, user_id: int):
         """Получение информации о пользователе"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            cursor.row_factory = row_factory(User)
+            cursor.execute('SELECT user_id, username, first_name, is_master, phone, created_at '
+                           'FROM users WHERE user_id = ?', (user_id,))
             return cursor.fetchone()
     
     def is_master(self, user_id: int) -> bool:
         """Проверка, является ли пользователь мастером"""
         user = self.get_user(user_id)
-        return user and user[3]  # is_master field
+        return user and user.is_master
     
     def add_master(self, user_id: int, name: str, specialization: str, social_media: str, address: str, password: str = 'master123'):
         """Добавление мастера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT OR REPLACE INTO masters (user_id, name, specialization, social_media, address, password)
@@ -117,93 +125,117 @@ class Database:
             # Обновляем статус пользователя
             cursor.execute('UPDATE users SET is_master = TRUE WHERE user_id = ?', (user_id,))
             conn.commit()
-            return cursor.lastrowid
+            master_id = cursor.lastrowid
+        self.catalog.invalidate()
+        return master_id
     
     def update_master_user_id(self, master_id: int, new_user_id: int):
         """Обновление user_id мастера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('UPDATE masters SET user_id = ? WHERE id = ?', (new_user_id, master_id))
             cursor.execute('UPDATE users SET is_master = TRUE WHERE user_id = ?', (new_user_id,))
             conn.commit()
+        self.catalog.invalidate()
     
     def get_masters(self):
         """Получение списка всех мастеров"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM masters')
+            cursor.row_factory = row_factory(Master)
+            cursor.execute(f'SELECT {MASTER_COLUMNS} FROM masters')
             return cursor.fetchall()
     
     def get_masters_by_specialization(self, specialization: str):
         """Получение мастеров по специализации"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM masters WHERE specialization = ?', (specialization,))
+            cursor.row_factory = row_factory(Master)
+            cursor.execute(f'SELECT {MASTER_COLUMNS} FROM masters WHERE specialization = ?', (specialization,))
             return cursor.fetchall()
     
     def get_master_by_user_id(self, user_id: int):
         """Получение мастера по user_id"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM masters WHERE user_id = ?', (user_id,))
+            cursor.row_factory = row_factory(Master)
+            cursor.execute(f'SELECT {MASTER_COLUMNS} FROM masters WHERE user_id = ?', (user_id,))
             return cursor.fetchone()
     
     def get_master_by_name_and_password(self, name: str, password: str):
         """Получение мастера по имени и паролю"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM masters WHERE name = ? AND password = ?', (name, password))
+            cursor.row_factory = row_factory(Master)
+            cursor.execute(f'SELECT {MASTER_COLUMNS} FROM masters WHERE name = ? AND password = ?', (name, password))
             return cursor.fetchone()
     
     def get_masters_list(self):
         """Получение списка всех мастеров для выбора"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
+            cursor.row_factory = row_factory(MasterListItem)
             cursor.execute('SELECT id, name, specialization FROM masters ORDER BY name')
             return cursor.fetchall()
     
     def add_service(self, master_id: int, name: str, price: float, duration: int):
-        """Добавление услуги"""
-        with sqlite3.connect(self.db_path) as conn:
+        """
+        Добавление услуги
+        
+        Raises:
+            ValueError: Длительность не положительна или больше MAX_APPOINTMENT_SECONDS
+        """
+        if not 0 < duration * 60 <= MAX_APPOINTMENT_SECONDS:
+            raise ValueError(f"Длительность услуги должна быть от 1 до {MAX_APPOINTMENT_SECONDS // 60} минут")
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO services (master_id, name, price, duration)
                 VALUES (?, ?, ?, ?)
             ''', (master_id, name, price, duration))
             conn.commit()
-            return cursor.lastrowid
+            service_id = cursor.lastrowid
+        self.catalog.invalidate()
+        return service_id
     
     def get_services_by_master(self, master_id: int):
         """Получение услуг мастера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM services WHERE master_id = ?', (master_id,))
+            cursor.row_factory = row_factory(Service)
+            cursor.execute(f'SELECT {SERVICE_COLUMNS} FROM services WHERE master_id = ?', (master_id,))
             return cursor.fetchall()
     
     def add_schedule(self, master_id: int, date: str, start_time: str, end_time: str):
         """Добавление расписания"""
-        with sqlite3.connect(self.db_path) as conn:
+        start_time, end_time = _padded_time(start_time), _padded_time(end_time)
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO schedule (master_id, date, start_time, end_time)
                 VALUES (?, ?, ?, ?)
             ''', (master_id, date, start_time, end_time))
             conn.commit()
-            return cursor.lastrowid
+            schedule_id = cursor.lastrowid
+        self.slots.invalidate_day(master_id, date)
+        return schedule_id
     
     def get_available_schedule(self, master_id: int, date: str):
         """Получение доступного расписания мастера на дату"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM schedule 
-                WHERE master_id = ? AND date = ? AND is_available = TRUE
-            ''', (master_id, date))
-            return cursor.fetchall()
+        with self.pool.connection() as conn:
+            return self._fetch_schedule(conn.cursor(), master_id, date)
+    
+    @staticmethod
+    def _fetch_schedule(cursor, master_id: int, date: str) -> List[ScheduleEntry]:
+        cursor.execute(f'''
+            SELECT {SCHEDULE_COLUMNS} FROM schedule 
+            WHERE master_id = ? AND date = ? AND is_available = TRUE
+        ''', (master_id, date))
+        return [ScheduleEntry._make(row) for row in cursor]
     
     def is_time_available(self, master_id: int, appointment_date: str, appointment_time: str):
         """Проверка доступности времени у мастера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT COUNT(*) FROM appointments 
@@ -212,26 +244,104 @@ class Database:
             count = cursor.fetchone()[0]
             return count == 0
     
+    def add_reminder_listener(self, listener: Callable[[int, List[PendingReminder]], None]):
+        """Подписка на изменения: listener(appointment_id, ожидающие напоминания), [] - отмена"""
+        self._reminder_listeners.append(listener)
+    
+    def _notify_reminders(self, appointment_id: int, reminders: List[PendingReminder]):
+        for listener in self._reminder_listeners:
+            try:
+                listener(appointment_id, reminders)
+            except Exception as e:
+                logger.error(f"Ошибка подписчика напоминаний: {e}")
+    
+    @staticmethod
+    def _enqueue_reminders(cursor, appointment_id: int) -> List[PendingReminder]:
+        """Постановка напоминаний записи в outbox (внутри транзакции вызывающего)"""
+        cursor.execute(ENQUEUE_REMINDERS_SQL, {'appointment_id': appointment_id})
+        cursor.execute('''
+            SELECT appointment_id, kind, due_at FROM outbox WHERE appointment_id = ? AND status = 'pending'
+        ''', (appointment_id,))
+        return [PendingReminder._make(row) for row in cursor]
+    
     def create_appointment(self, client_id: int, master_id: int, service_id: int, 
                           appointment_date: str, appointment_time: str):
-        """Создание записи"""
-        with sqlite3.connect(self.db_path) as conn:
+        """Создание записи без проверки занятости (для клиентов - book_appointment)"""
+        appointment_time = _padded_time(appointment_time)
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO appointments (client_id, master_id, service_id, appointment_date, appointment_time)
                 VALUES (?, ?, ?, ?, ?)
             ''', (client_id, master_id, service_id, appointment_date, appointment_time))
+            appointment_id = cursor.lastrowid
+            reminders = self._enqueue_reminders(cursor, appointment_id)
             conn.commit()
-            return cursor.lastrowid
+        self.slots.invalidate_day(master_id, appointment_date)
+        self._notify_reminders(appointment_id, reminders)
+        return appointment_id
+    
+    def book_appointment(self, client_id: int, master_id: int, service_id: int,
+                         appointment_date: str, appointment_time: str) -> BookingResult:
+        """
+        Атомарная запись клиента
+        
+        В одной транзакции BEGIN IMMEDIATE проверяет, что время входит в сетку
+        расписания мастера и интервал услуги не пересекается с другими записями,
+        создает запись и читает данные для подтверждения. Блокировка записи
+        не дает двум клиентам одновременно занять один интервал.
+        """
+        start = to_minutes(appointment_time)
+        appointment_time = format_minutes(start)
+        if start < minutes_not_before(appointment_date):
+            return BookingResult(BookingStatus.OUTSIDE_SCHEDULE)
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('SELECT master_id, duration FROM services WHERE id = ?', (service_id,))
+            service = cursor.fetchone()
+            if not service or service[0] != master_id:
+                return BookingResult(BookingStatus.UNKNOWN_SERVICE)
+            duration = service[1] if service[1] is not None else DEFAULT_DURATION
+            
+            availability = DayAvailability.from_rows(self._fetch_schedule(cursor, master_id, appointment_date))
+            if not availability.on_grid(start):
+                return BookingResult(BookingStatus.OUTSIDE_SCHEDULE)
+            start_at = fast_time.local_epoch(fast_time.parse_date(appointment_date), start)
+            if self._fetch_overlapping(cursor, master_id, start_at, start_at + duration * 60):
+                return BookingResult(BookingStatus.CONFLICT)
+            
+            cursor.execute('''
+                INSERT INTO appointments (client_id, master_id, service_id, appointment_date, appointment_time)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (client_id, master_id, service_id, appointment_date, appointment_time))
+            appointment_id = cursor.lastrowid
+            # Напоминания попадают в outbox вместе с записью или не попадают вовсе
+            reminders = self._enqueue_reminders(cursor, appointment_id)
+            cursor.execute('''
+                SELECT a.id, a.appointment_date, a.appointment_time,
+                       m.name as master_name, s.name as service_name, s.price, s.duration, m.address
+                FROM appointments a
+                JOIN masters m ON a.master_id = m.id
+                JOIN services s ON a.service_id = s.id
+                WHERE a.id = ?
+            ''', (appointment_id,))
+            confirmation = BookingConfirmation._make(cursor.fetchone())
+        
+        self.slots.invalidate_day(master_id, appointment_date)
+        self._notify_reminders(appointment_id, reminders)
+        return BookingResult(BookingStatus.BOOKED, confirmation)
     
     def get_client_appointments(self, client_id: int):
         """Получение записей клиента"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT a.id, a.client_id, a.master_id, a.service_id, 
-                       a.appointment_date, a.appointment_time, a.status, a.created_at,
-                       m.name as master_name, s.name as service_name, s.price, s.duration
+            cursor.row_factory = row_factory(ClientAppointment)
+            cursor.execute(f'''
+                SELECT {APPOINTMENT_COLUMNS},
+                       m.name as master_name, s.name as service_name, s.price, s.duration,
+                       {_minutes('a.appointment_time')}
                 FROM appointments a
                 JOIN masters m ON a.master_id = m.id
                 JOIN services s ON a.service_id = s.id
@@ -242,10 +352,12 @@ class Database:
     
     def get_master_appointments(self, master_id: int):
         """Получение записей мастера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT a.*, u.first_name, u.username, s.name as service_name
+            cursor.row_factory = row_factory(MasterAppointment)
+            cursor.execute(f'''
+                SELECT {APPOINTMENT_COLUMNS}, u.first_name as client_name, u.username as client_username,
+                       s.name as service_name, {_minutes('a.appointment_time')}
                 FROM appointments a
                 JOIN users u ON a.client_id = u.user_id
                 JOIN services s ON a.service_id = s.id
@@ -254,36 +366,109 @@ class Database:
             ''', (master_id,))
             return cursor.fetchall()
     
+    def _fetch_page(self, sql: str, params: dict, record_type, limit: int,
+                    cursor_of: Callable[[tuple], PageCursor]) -> Page:
+        """Страница keyset-пагинации: читается limit + 1 строк, лишняя означает, что есть следующая"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory(record_type)
+            cursor.execute(sql, {**params, 'limit': limit + 1})
+            rows = cursor.fetchall()
+        if len(rows) <= limit:
+            return Page(rows, None)
+        return Page(rows[:limit], cursor_of(rows[limit - 1]))
+    
+    def get_client_appointments_page(self, client_id: int, after: PageCursor = FIRST_PAGE,
+                                     limit: int = LIST_PAGE_SIZE) -> Page:
+        """
+        Страница активных записей клиента в порядке (дата, время, id)
+        
+        Args:
+            client_id: ID клиента
+            after: Курсор последней строки предыдущей страницы
+            limit: Строк на странице
+        """
+        date, time, row_id = after
+        return self._fetch_page(f'''
+            SELECT {APPOINTMENT_COLUMNS},
+                   m.name as master_name, s.name as service_name, s.price, s.duration,
+                   {_minutes('a.appointment_time')}
+            FROM appointments a
+            JOIN masters m ON a.master_id = m.id
+            JOIN services s ON a.service_id = s.id
+            WHERE a.client_id = :owner AND a.status = 'active'
+            AND {_after_cursor('a.appointment_date', 'a.appointment_time', 'a.id')}
+            ORDER BY a.appointment_date, a.appointment_time, a.id
+            LIMIT :limit
+        ''', {'owner': client_id, 'date': date, 'time': time, 'id': row_id}, ClientAppointment, limit,
+            lambda app: (app.appointment_date, app.appointment_time, app.id))
+    
+    def get_master_appointments_page(self, master_id: int, after: PageCursor = FIRST_PAGE,
+                                     limit: int = LIST_PAGE_SIZE) -> Page:
+        """Страница активных записей мастера в порядке (дата, время, id), см. get_client_appointments_page"""
+        date, time, row_id = after
+        return self._fetch_page(f'''
+            SELECT {APPOINTMENT_COLUMNS}, u.first_name as client_name, u.username as client_username,
+                   s.name as service_name, {_minutes('a.appointment_time')}
+            FROM appointments a
+            JOIN users u ON a.client_id = u.user_id
+            JOIN services s ON a.service_id = s.id
+            WHERE a.master_id = :owner AND a.status = 'active'
+            AND {_after_cursor('a.appointment_date', 'a.appointment_time', 'a.id')}
+            ORDER BY a.appointment_date, a.appointment_time, a.id
+            LIMIT :limit
+        ''', {'owner': master_id, 'date': date, 'time': time, 'id': row_id}, MasterAppointment, limit,
+            lambda app: (app.appointment_date, app.appointment_time, app.id))
+    
+    def get_master_schedule_page(self, master_id: int, after: PageCursor = FIRST_PAGE,
+                                 limit: int = LIST_PAGE_SIZE) -> Page:
+        """Страница расписания мастера в порядке (дата, начало, id), см. get_client_appointments_page"""
+        date, time, row_id = after
+        return self._fetch_page(f'''
+            SELECT {SCHEDULE_COLUMNS} FROM schedule
+            WHERE master_id = :owner AND {_after_cursor('date', 'start_time', 'id')}
+            ORDER BY date, start_time, id
+            LIMIT :limit
+        ''', {'owner': master_id, 'date': date, 'time': time, 'id': row_id}, ScheduleEntry, limit,
+            lambda entry: (entry.date, entry.start_time, entry.id))
+    
     def cancel_appointment(self, appointment_id: int):
         """Отмена записи"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
+            # День мастера нужен для сброса кэша слотов
+            cursor.execute('SELECT master_id, appointment_date FROM appointments WHERE id = ?', (appointment_id,))
+            day = cursor.fetchone()
             cursor.execute('''
                 UPDATE appointments SET status = 'cancelled' WHERE id = ?
             ''', (appointment_id,))
+            cursor.execute('''
+                UPDATE outbox SET status = 'cancelled' WHERE appointment_id = ? AND status = 'pending'
+            ''', (appointment_id,))
             conn.commit()
+        if day:
+            self.slots.invalidate_day(*day)
+            self._notify_reminders(appointment_id, [])
     
-    def get_appointments_for_reminder(self):
-        """Получение записей для напоминаний (на завтра)"""
-        with sqlite3.connect(self.db_path) as conn:
+    def complete_appointments_before(self, date: str) -> int:
+        """Перевод активных записей до даты date в статус completed, возвращает их число"""
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT a.*, u.first_name, m.name as master_name, s.name as service_name
-                FROM appointments a
-                JOIN users u ON a.client_id = u.user_id
-                JOIN masters m ON a.master_id = m.id
-                JOIN services s ON a.service_id = s.id
-                WHERE a.status = 'active' 
-                AND date(a.appointment_date) = date('now', '+1 day')
-            ''')
-            return cursor.fetchall()
+                UPDATE appointments 
+                SET status = 'completed' 
+                WHERE appointment_date < ? AND status = 'active'
+            ''', (date,))
+            conn.commit()
+            return cursor.rowcount
     
     def get_appointments_by_time(self, date: str, time: str):
         """Получение записей на определенное время"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT a.*, u.first_name, m.name as master_name, s.name as service_name, m.address
+            cursor.row_factory = row_factory(AppointmentDetails)
+            cursor.execute(f'''
+                SELECT {APPOINTMENT_DETAILS_COLUMNS}
                 FROM appointments a
                 JOIN users u ON a.client_id = u.user_id
                 JOIN masters m ON a.master_id = m.id
@@ -296,10 +481,11 @@ class Database:
     
     def get_appointments_by_date(self, date: str):
         """Получение всех записей на определенную дату"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT a.*, u.first_name, m.name as master_name, s.name as service_name, s.duration, m.address
+            cursor.row_factory = row_factory(AppointmentDetails)
+            cursor.execute(f'''
+                SELECT {APPOINTMENT_DETAILS_COLUMNS}
                 FROM appointments a
                 LEFT JOIN users u ON a.client_id = u.user_id
                 LEFT JOIN masters m ON a.master_id = m.id
@@ -309,12 +495,159 @@ class Database:
             ''', (date,))
             return cursor.fetchall()
     
+    def get_master_busy_intervals(self, master_id: int, date: str) -> List[BusyInterval]:
+        """Занятые интервалы мастера на дату: (начало в минутах от полуночи, длительность)"""
+        day = fast_time.parse_date(date)
+        if day is None:
+            return []
+        with self.pool.connection() as conn:
+            return self._fetch_busy_intervals(conn.cursor(), master_id, fast_time.local_epoch(day))
+    
+    @staticmethod
+    def _fetch_busy_intervals(cursor, master_id: int, day_start: int) -> List[BusyInterval]:
+        # Те же start_at/end_at, что проверяет book_appointment; диапазон по индексу интервалов
+        cursor.execute('''
+            SELECT (start_at - :day) / 60, (end_at - start_at) / 60
+            FROM appointments
+            WHERE master_id = :master AND status = 'active' AND start_at >= :day AND start_at < :day + 86400
+            ORDER BY start_at
+        ''', {'master': master_id, 'day': day_start})
+        return [BusyInterval._make(row) for row in cursor]
+    
+    def get_free_slots(self, master_id: int, date: str, duration: int, not_before: int = 0) -> List[int]:
+        """
+        Свободные слоты мастера на дату для услуги длительностью duration
+        
+        Результат для дня кэшируется целиком, прошедшие слоты (раньше
+        not_before, в минутах) отсекаются при каждом чтении.
+        """
+        def compute():
+            schedule = self.get_available_schedule(master_id, date)
+            if not schedule:
+                return ()
+            busy = self.get_master_busy_intervals(master_id, date)
+            return DayAvailability.from_rows(schedule, busy).free_slots(duration)
+        
+        slots = self.slots.get_or_compute((master_id, date, duration), compute)
+        return [start for start in slots if start >= not_before]
+    
+    def get_upcoming_appointments(self, minutes: int, now: int = None) -> List[ReminderAppointment]:
+        """Активные записи, начинающиеся в ближайшие minutes минут (now - секунды local_epoch)"""
+        now = fast_time.now_epoch() if now is None else now
+        return self.get_appointments_starting_between(now, now + minutes * 60)
+    
+    def get_appointments_starting_between(self, start_at: int, end_at: int) -> List[ReminderAppointment]:
+        """Активные записи с началом в [start_at, end_at): диапазон по индексу start_at"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT a.id, a.client_id, a.appointment_date, a.appointment_time,
+                       m.name as master_name, s.name as service_name, m.address
+                FROM appointments a
+                LEFT JOIN masters m ON a.master_id = m.id
+                LEFT JOIN services s ON a.service_id = s.id
+                WHERE a.status = 'active' AND a.start_at >= ? AND a.start_at < ?
+                ORDER BY a.start_at
+            ''', (start_at, end_at))
+            return [ReminderAppointment._make(row) for row in cursor]
+    
+    def get_overlapping_appointments(self, master_id: int, start_at: int, end_at: int) -> List[AppointmentSpan]:
+        """Активные записи мастера, пересекающие [start_at, end_at) (секунды local_epoch)"""
+        with self.pool.connection() as conn:
+            return self._fetch_overlapping(conn.cursor(), master_id, start_at, end_at)
+    
+    @staticmethod
+    def _fetch_overlapping(cursor, master_id: int, start_at: int, end_at: int) -> List[AppointmentSpan]:
+        # Диапазон start_at ограничен с двух сторон: запись, начавшаяся раньше
+        # start_at - MAX_APPOINTMENT_SECONDS, уже закончилась; end_at читается из индекса
+        cursor.execute('''
+            SELECT id, master_id, start_at, end_at FROM appointments
+            WHERE master_id = ? AND status = 'active' AND start_at > ? AND start_at < ? AND end_at > ?
+        ''', (master_id, start_at - MAX_APPOINTMENT_SECONDS, end_at, start_at))
+        return [AppointmentSpan._make(row) for row in cursor]
+    
+    def claim_outbox(self, now: str, stale_before: str, limit: int) -> List[OutboxItem]:
+        """
+        Забрать до limit наступивших напоминаний для отправки
+        
+        Берутся строки pending с due_at <= now и строки sending, забранные
+        раньше stale_before (процесс упал до отметки). Строки переводятся в
+        sending в той же транзакции, поэтому два обработчика их не делят.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT o.id, o.appointment_id, o.kind, o.chat_id, o.attempts + 1,
+                       a.appointment_date, a.appointment_time, a.status,
+                       m.name as master_name, s.name as service_name, m.address
+                FROM outbox o
+                JOIN appointments a ON o.appointment_id = a.id
+                LEFT JOIN masters m ON a.master_id = m.id
+                LEFT JOIN services s ON a.service_id = s.id
+                WHERE (o.status = 'pending' AND o.due_at <= ?)
+                   OR (o.status = 'sending' AND o.claimed_at < ?)
+                ORDER BY o.due_at
+                LIMIT ?
+            ''', (now, stale_before, limit))
+            items = [OutboxItem._make(row) for row in cursor]
+            cursor.executemany('''
+                UPDATE outbox SET status = 'sending', claimed_at = ?, attempts = attempts + 1 WHERE id = ?
+            ''', [(now, item.id) for item in items])
+            return items
+    
+    def set_custom_reminder(self, appointment_id: int, remind_at: str):
+        """Запоминание времени кастомного напоминания записи"""
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE appointments SET custom_reminder_at = ? WHERE id = ?', (remind_at, appointment_id))
+            conn.commit()
+    
+    def get_unscheduled_custom_reminders(self, now: str, job_prefix: str) -> List[PendingReminder]:
+        """Будущие кастомные напоминания активных записей без задачи job_prefix + id в apscheduler_jobs"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory(PendingReminder)
+            cursor.execute('''
+                SELECT a.id, 'custom', a.custom_reminder_at
+                FROM appointments a
+                WHERE a.custom_reminder_at > ? AND a.status = 'active'
+                AND NOT EXISTS (SELECT 1 FROM apscheduler_jobs j WHERE j.id = ? || a.id)
+            ''', (now, job_prefix))
+            return cursor.fetchall()
+    
+    def get_pending_reminders(self) -> List[PendingReminder]:
+        """Все ожидающие отправки напоминания"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory(PendingReminder)
+            cursor.execute('''
+                SELECT appointment_id, kind, due_at FROM outbox WHERE status = 'pending' ORDER BY due_at
+            ''')
+            return cursor.fetchall()
+    
+    def finish_outbox(self, outbox_id: int, status: str, finished_at: str, error: str = None):
+        """Отметка напоминания: delivered, cancelled, expired или failed"""
+        with self.pool.connection() as conn:
+            conn.execute('''
+                UPDATE outbox SET status = ?, finished_at = ?, last_error = ? WHERE id = ?
+            ''', (status, finished_at, error, outbox_id))
+            conn.commit()
+    
+    def retry_outbox(self, outbox_id: int, retry_at: str, error: str):
+        """Возврат напоминания в очередь после ошибки отправки"""
+        with self.pool.connection() as conn:
+            conn.execute('''
+                UPDATE outbox SET status = 'pending', due_at = ?, last_error = ? WHERE id = ?
+            ''', (retry_at, error, outbox_id))
+            conn.commit()
+    
     def get_appointment_by_id(self, appointment_id: int):
         """Получение записи по ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT a.*, u.first_name, m.name as master_name, s.name as service_name
+            cursor.row_factory = row_factory(AppointmentDetails)
+            cursor.execute(f'''
+                SELECT {APPOINTMENT_DETAILS_COLUMNS}
                 FROM appointments a
                 JOIN users u ON a.client_id = u.user_id
                 JOIN masters m ON a.master_id = m.id
@@ -325,41 +658,71 @@ class Database:
     
     def get_master_schedule(self, master_id: int):
         """Получение расписания мастера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM schedule WHERE master_id = ? ORDER BY date, start_time
+            cursor.row_factory = row_factory(ScheduleEntry)
+            cursor.execute(f'''
+                SELECT {SCHEDULE_COLUMNS} FROM schedule WHERE master_id = ? ORDER BY date, start_time
             ''', (master_id,))
             return cursor.fetchall()
     
     def delete_schedule_by_id(self, schedule_id: int):
         """Удаление конкретного расписания по ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
+            cursor.execute('SELECT master_id, date FROM schedule WHERE id = ?', (schedule_id,))
+            day = cursor.fetchone()
             cursor.execute('DELETE FROM schedule WHERE id = ?', (schedule_id,))
             conn.commit()
+        if day:
+            self.slots.invalidate_day(*day)
     
     def delete_master_schedule(self, master_id: int):
         """Удаление всего расписания мастера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM schedule WHERE master_id = ?', (master_id,))
             conn.commit()
+        self.slots.invalidate_master(master_id)
     
     def delete_service_by_id(self, service_id: int):
         """Удаление конкретной услуги по ID"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
+            cursor.execute('SELECT master_id FROM services WHERE id = ?', (service_id,))
+            service = cursor.fetchone()
             cursor.execute('DELETE FROM services WHERE id = ?', (service_id,))
             conn.commit()
+        self.catalog.invalidate()
+        # Записи на удаленную услугу дальше считаются длительностью по умолчанию
+        if service:
+            self.slots.invalidate_master(service[0])
     
     def delete_master_services(self, master_id: int):
         """Удаление всех услуг мастера"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self.pool.connection() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM services WHERE master_id = ?', (master_id,))
             conn.commit()
+        self.catalog.invalidate()
+        self.slots.invalidate_master(master_id)
+    
+    def _load_catalog(self):
+        """Загрузка каталога для CatalogCache: все мастера и все услуги"""
+        with self.pool.connection() as conn:
+            masters = [Master._make(row) for row in conn.execute(f'SELECT {MASTER_COLUMNS} FROM masters ORDER BY id')]
+            services = [Service._make(row) for row in conn.execute(f'SELECT {SERVICE_COLUMNS} FROM services ORDER BY id')]
+        return masters, services
+    
+    def get_pragma_report(self) -> dict:
+        """Фактические значения PRAGMA из профиля (могут отличаться от запрошенных)"""
+        with self.pool.connection() as conn:
+            return {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in SQLITE_PRAGMAS}
     
     def get_connection(self):
-        """Получение соединения с базой данных"""
-        return sqlite3.connect(self.db_path)
+        """Получение соединения из пула (использовать как контекстный менеджер)"""
+        return self.pool.connection()
+    
+    def close(self):
+        """Закрытие соединений пула"""
+        self.pool.close()
@@ -0,0 +1,111 @@
+import pickle
+import sqlite3
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+
+class SQLiteJobStore(BaseJobStore):
+    """
+    Хранилище задач APScheduler в базе бота (таблица apscheduler_jobs)
+    
+    Повторяет SQLAlchemyJobStore, но работает через ConnectionPool бота и не
+    требует SQLAlchemy. Таблица создается миграцией. Задачи сериализуются
+    pickle, поэтому их функция должна быть доступна по имени модуля.
+    """
+    
+    def __init__(self, pool, pickle_protocol: int = pickle.HIGHEST_PROTOCOL):
+        """
+        Args:
+            pool: ConnectionPool базы бота
+            pickle_protocol: Протокол сериализации состояния задач
+        """
+        super().__init__()
+        self.pool = pool
+        self.pickle_protocol = pickle_protocol
+    
+    def lookup_job(self, job_id):
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT job_state FROM apscheduler_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+    
+    def get_due_jobs(self, now):
+        return self._get_jobs('WHERE next_run_time <= ?', (datetime_to_utc_timestamp(now),))
+    
+    def get_next_run_time(self):
+        with self.pool.connection() as conn:
+            row = conn.execute('''
+                SELECT next_run_time FROM apscheduler_jobs
+                WHERE next_run_time IS NOT NULL ORDER BY next_run_time LIMIT 1
+            ''').fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+    
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+    
+    def add_job(self, job):
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('INSERT INTO apscheduler_jobs (id, next_run_time, job_state) VALUES (?, ?, ?)',
+                             (job.id, datetime_to_utc_timestamp(job.next_run_time), self._state(job)))
+                conn.commit()
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id)
+    
+    def update_job(self, job):
+        with self.pool.connection() as conn:
+            cursor = conn.execute('UPDATE apscheduler_jobs SET next_run_time = ?, job_state = ? WHERE id = ?',
+                                  (datetime_to_utc_timestamp(job.next_run_time), self._state(job), job.id))
+            conn.commit()
+        if cursor.rowcount == 0:
+            raise JobLookupError(job.id)
+    
+    def remove_job(self, job_id):
+        with self.pool.connection() as conn:
+            cursor = conn.execute('DELETE FROM apscheduler_jobs WHERE id = ?', (job_id,))
+            conn.commit()
+        if cursor.rowcount == 0:
+            raise JobLookupError(job_id)
+    
+    def remove_all_jobs(self):
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM apscheduler_jobs')
+            conn.commit()
+    
+    def _state(self, job) -> bytes:
+        return pickle.dumps(job.__getstate__(), self.pickle_protocol)
+    
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state['jobstore'] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+    
+    def _get_jobs(self, where: str = '', args: tuple = ()):
+        with self.pool.connection() as conn:
+            rows = conn.execute(f'SELECT id, job_state FROM apscheduler_jobs {where} ORDER BY next_run_time',
+                                args).fetchall()
+        
+        jobs = []
+        failed_job_ids = []
+        for job_id, job_state in rows:
+            try:
+                jobs.append(self._reconstitute_job(job_state))
+            except BaseException:
+                self._logger.exception('Unable to restore job "%s" -- removing it', job_id)
+                failed_job_ids.append(job_id)
+        
+        # Задачи, которые не удалось восстановить (например, функция удалена), удаляются
+        if failed_job_ids:
+            with self.pool.connection() as conn:
+                conn.executemany('DELETE FROM apscheduler_jobs WHERE id = ?', [(job_id,) for job_id in failed_job_ids])
+                conn.commit()
+        return jobs
+    
+    def __repr__(self):
+        return f'<{self.__class__.__name__} (path={self.pool.db_path})>'
@@ -0,0 +1,132 @@
+import threading
+from typing import Callable, Dict, Hashable, List, Optional
+from telebot import types
+from core.callbacks import Action, encode_callback
+from config.settings import KEYBOARDS
+from utils.time_utils import TimeUtils
+
+
+def reply_keyboard_json(rows: List[List[str]]) -> str:
+    """JSON reply-клавиатуры из строк кнопок"""
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    for row in rows:
+        markup.row(*row)
+    return markup.to_json()
+
+
+class MarkupCache:
+    """
+    Готовые клавиатуры в виде JSON
+    
+    reply_markup принимает уже сериализованную строку, поэтому клавиатуры,
+    одинаковые для всех пользователей, собираются и сериализуются один раз:
+    меню из KEYBOARDS - при создании, клавиатуры каталога (специализации,
+    мастера, услуги) - при первом запросе. Последние сбрасываются, когда
+    меняется версия каталога (инвалидация или перезагрузка по ttl).
+    """
+    
+    def __init__(self, catalog):
+        """
+        Args:
+            catalog: CatalogCache
+        """
+        self.catalog = catalog
+        self.main_menu = reply_keyboard_json(KEYBOARDS['main_menu'])
+        self.master_menu = reply_keyboard_json(KEYBOARDS['master_menu'])
+        
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._inline: Dict[Hashable, str] = {}
+        
+        self.hits = 0
+        self.misses = 0
+    
+    def _memoize(self, key: Hashable, build: Callable[[], Optional[types.InlineKeyboardMarkup]]) -> Optional[str]:
+        """JSON клавиатуры key для текущей версии каталога; None, если кнопок нет"""
+        # Версия читается до каталога: сохраненная клавиатура не старее своей версии.
+        # current_version() проверяет ttl, иначе попадания в кэш клавиатур не дали бы
+        # каталогу перезагрузиться после изменений из других процессов
+        version = self.catalog.current_version()
+        with self._lock:
+            if version != self._version:
+                self._inline.clear()
+                self._version = version
+            markup = self._inline.get(key)
+            if markup is not None:
+                self.hits += 1
+                return markup
+            self.misses += 1
+        
+        built = build()
+        if built is None:
+            return None
+        markup = built.to_json()
+        with self._lock:
+            if version == self._version:
+                self._inline[key] = markup
+        return markup
+    
+    def specializations(self) -> Optional[str]:
+        """Выбор типа услуги"""
+        def build():
+            specializations = self.catalog.get_specializations()
+            if not specializations:
+                return None
+            markup = types.InlineKeyboardMarkup()
+            for specialization in specializations:
+                # Кнопка хранит id первого мастера специализации, а не ее название
+                master_id = self.catalog.get_masters_by_specialization(specialization)[0].id
+                markup.add(types.InlineKeyboardButton(
+                    specialization, callback_data=encode_callback(Action.SPECIALIZATION, master_id)
+                ))
+            return markup
+        return self._memoize('specializations', build)
+    
+    def masters_by_specialization(self, specialization: str) -> Optional[str]:
+        """Мастера выбранной специализации"""
+        def build():
+            masters = self.catalog.get_masters_by_specialization(specialization)
+            if not masters:
+                return None
+            markup = types.InlineKeyboardMarkup()
+            for master in masters:
+                markup.add(types.InlineKeyboardButton(
+                    f"{master.name} - {master.address}", callback_data=encode_callback(Action.MASTER, master.id)
+                ))
+            return markup
+        return self._memoize(('specialization', specialization), build)
+    
+    def master_services(self, master_id: int) -> Optional[str]:
+        """Услуги мастера"""
+        def build():
+            services = self.catalog.get_services(master_id)
+            if not services:
+                return None
+            markup = types.InlineKeyboardMarkup()
+            for service in services:
+                duration_str = TimeUtils.format_duration(service.duration)
+                button_text = f"{service.name} - {service.price} руб. ({duration_str})"
+                markup.add(types.InlineKeyboardButton(
+                    button_text, callback_data=encode_callback(Action.SERVICE, service.id)
+                ))
+            return markup
+        return self._memoize(('services', master_id), build)
+    
+    def login_masters(self) -> Optional[str]:
+        """Выбор мастера для входа (по имени)"""
+        def build():
+            masters = sorted(self.catalog.get_masters(), key=lambda master: master.name)
+            if not masters:
+                return None
+            markup = types.InlineKeyboardMarkup()
+            for master in masters:
+                markup.add(types.InlineKeyboardButton(
+                    f"{master.name} ({master.specialization})",
+                    callback_data=encode_callback(Action.LOGIN_MASTER, master.id)
+                ))
+            return markup
+        return self._memoize('login_masters', build)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'cached': len(self._inline), 'version': self._version}
@@ -0,0 +1,390 @@
+import sqlite3
+import time
+import logging
+from typing import Callable, List, Sequence, Union
+from core.outbox import BACKFILL_REMINDERS_SQL
+from utils.availability import DEFAULT_DURATION
+from config.settings import MIGRATION_BACKFILL_BATCH_SIZE, MIGRATION_BACKFILL_PAUSE
+
+logger = logging.getLogger(__name__)
+
+# Шаг миграции: SQL-строка или функция, получающая соединение
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+class Backfill:
+    """Пакетное заполнение данных после миграции
+    
+    SQL должен обрабатывать не более :limit строк за раз и со временем
+    переставать находить необработанные строки. Каждая пачка выполняется
+    в отдельной короткой транзакции, чтобы не держать блокировку записи.
+    """
+    
+    def __init__(self, description: str, sql: str, batch_size: int = None):
+        self.description = description
+        self.sql = sql
+        self.batch_size = batch_size or MIGRATION_BACKFILL_BATCH_SIZE
+    
+    def run(self, pool) -> int:
+        """Выполнение пачками до исчерпания, возвращает число обработанных строк"""
+        total = 0
+        while True:
+            with pool.connection() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                processed = conn.execute(self.sql, {'limit': self.batch_size}).rowcount
+            total += processed
+            if processed < self.batch_size:
+                return total
+            time.sleep(MIGRATION_BACKFILL_PAUSE)
+
+
+class Migration:
+    """Версионированное изменение схемы"""
+    
+    def __init__(self, version: int, description: str, steps: Sequence[Step] = (),
+                 backfills: Sequence[Backfill] = ()):
+        self.version = version
+        self.description = description
+        self.steps = list(steps)
+        self.backfills = list(backfills)
+    
+    def apply(self, conn: sqlite3.Connection):
+        """Выполнение шагов схемы (внутри транзакции раннера)"""
+        for step in self.steps:
+            if callable(step):
+                step(conn)
+            else:
+                conn.execute(step)
+
+
+def add_column_if_missing(table: str, column: str, definition: str) -> Callable[[sqlite3.Connection], None]:
+    """Шаг миграции: ALTER TABLE ADD COLUMN, если колонки еще нет"""
+    def step(conn: sqlite3.Connection):
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def _epoch(date: str, time: str) -> str:
+    """SQL-выражение: местное время date time в секундах от 1970-01-01 (без учета пояса)"""
+    return f"CAST(strftime('%s', {date} || ' ' || {time}) AS INTEGER)"
+
+
+# Интервал записи [start_at, end_at) в секундах; конец - по длительности услуги
+APPOINTMENT_SPAN_SQL = f'''
+    start_at = {_epoch('appointment_date', 'appointment_time')},
+    end_at = {_epoch('appointment_date', 'appointment_time')}
+        + COALESCE((SELECT duration FROM services WHERE id = appointments.service_id), {DEFAULT_DURATION}) * 60'''
+
+SCHEDULE_SPAN_SQL = f'''
+    start_at = {_epoch('date', 'start_time')},
+    end_at = {_epoch('date', 'end_time')}'''
+
+
+def _unpadded(time: str) -> str:
+    """SQL-условие: время без ведущих нулей ("9:00", "10:5"), которое strftime('%s') не разбирает"""
+    return f"({time} GLOB '[0-9]:[0-9]' OR {time} GLOB '[0-9]:[0-9][0-9]' OR {time} GLOB '[0-9][0-9]:[0-9]')"
+
+
+def _pad(time: str) -> str:
+    """SQL-выражение: время в виде HH:MM"""
+    return (f"printf('%02d:%02d', CAST(substr({time}, 1, instr({time}, ':') - 1) AS INTEGER), "
+            f"CAST(substr({time}, instr({time}, ':') + 1) AS INTEGER))")
+
+
+# Время без ведущих нулей приводится к HH:MM до расчета интервалов
+_BACKFILL_PAD_TIMES = '''
+    UPDATE {table} SET {assignments}
+    WHERE id IN (SELECT id FROM {table} WHERE {condition} LIMIT :limit)
+'''
+
+# Строки, время которых не разбирается (не HH:MM), пропускаются, чтобы backfill завершился
+_BACKFILL_SPAN = '''
+    UPDATE {table} SET {span}
+    WHERE id IN (SELECT id FROM {table} WHERE start_at IS NULL AND {start} IS NOT NULL LIMIT :limit)
+'''
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Базовые таблицы", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            is_master BOOLEAN DEFAULT FALSE,
+            phone TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS masters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER UNIQUE,
+            name TEXT NOT NULL,
+            specialization TEXT,
+            social_media TEXT,
+            address TEXT,
+            password TEXT DEFAULT 'master123',
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS services (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            master_id INTEGER,
+            name TEXT NOT NULL,
+            price DECIMAL(10,2),
+            duration INTEGER, -- в минутах
+            FOREIGN KEY (master_id) REFERENCES masters (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS schedule (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            master_id INTEGER,
+            date DATE,
+            start_time TIME,
+            end_time TIME,
+            is_available BOOLEAN DEFAULT TRUE,
+            FOREIGN KEY (master_id) REFERENCES masters (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS appointments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id INTEGER,
+            master_id INTEGER,
+            service_id INTEGER,
+            appointment_date DATE,
+            appointment_time TIME,
+            status TEXT DEFAULT 'active', -- active, cancelled, completed
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (client_id) REFERENCES users (user_id),
+            FOREIGN KEY (master_id) REFERENCES masters (id),
+            FOREIGN KEY (service_id) REFERENCES services (id)
+        )
+        ''',
+    ]),
+    # Бывший scripts/update_db.py: базы, созданные до появления паролей мастеров
+    Migration(2, "Пароль мастера", [
+        add_column_if_missing('masters', 'password', "TEXT DEFAULT 'master123'"),
+    ]),
+    Migration(3, "Индексы горячих запросов", [
+        'CREATE INDEX IF NOT EXISTS idx_appointments_master_date_status ON appointments (master_id, appointment_date, status)',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_date_status ON appointments (appointment_date, status)',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_client_status ON appointments (client_id, status)',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_created_at ON appointments (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_schedule_master_date ON schedule (master_id, date, start_time)',
+        'CREATE INDEX IF NOT EXISTS idx_services_master ON services (master_id)',
+        'CREATE INDEX IF NOT EXISTS idx_masters_specialization ON masters (specialization)',
+    ]),
+    # Покрывающие индексы для занятости мастера на день и окна напоминаний
+    Migration(4, "Покрывающие индексы записей", [
+        'DROP INDEX IF EXISTS idx_appointments_master_date_status',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_master_day '
+        'ON appointments (master_id, appointment_date, status, appointment_time, service_id)',
+        'DROP INDEX IF EXISTS idx_appointments_date_status',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_date_status_time '
+        'ON appointments (appointment_date, status, appointment_time)',
+    ]),
+    Migration(5, "Очередь напоминаний outbox", [
+        '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            appointment_id INTEGER NOT NULL,
+            kind TEXT NOT NULL, -- day_before, hour_before
+            chat_id INTEGER NOT NULL,
+            due_at TIMESTAMP NOT NULL, -- локальное время следующей попытки
+            status TEXT DEFAULT 'pending', -- pending, sending, delivered, cancelled, expired, failed
+            attempts INTEGER DEFAULT 0,
+            claimed_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            last_error TEXT,
+            UNIQUE (appointment_id, kind),
+            FOREIGN KEY (appointment_id) REFERENCES appointments (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON outbox (status, due_at)',
+    ], [
+        Backfill("Напоминания для будущих записей", BACKFILL_REMINDERS_SQL),
+    ]),
+    # Задачи APScheduler (схема как у SQLAlchemyJobStore) и время кастомного напоминания записи
+    Migration(6, "Постоянное хранилище задач планировщика", [
+        '''
+        CREATE TABLE IF NOT EXISTS apscheduler_jobs (
+            id TEXT PRIMARY KEY,
+            next_run_time REAL,
+            job_state BLOB NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_apscheduler_jobs_next_run_time ON apscheduler_jobs (next_run_time)',
+        add_column_if_missing('appointments', 'custom_reminder_at', 'TIMESTAMP'),
+        'CREATE INDEX IF NOT EXISTS idx_appointments_custom_reminder '
+        'ON appointments (custom_reminder_at) WHERE custom_reminder_at IS NOT NULL',
+    ]),
+    Migration(7, "Сессии пользователей", [
+        '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL, -- JSON с заполненными полями сессии
+            updated_at REAL NOT NULL -- unix time последнего обращения
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)',
+    ]),
+    # Целочисленные интервалы для диапазонных запросов; триггеры держат их в согласии
+    # с текстовыми датой и временем и длительностью услуги при любой записи, в том числе из скриптов
+    Migration(8, "Интервалы записей и расписания в секундах", [
+        add_column_if_missing('appointments', 'start_at', 'INTEGER'),
+        add_column_if_missing('appointments', 'end_at', 'INTEGER'),
+        add_column_if_missing('schedule', 'start_at', 'INTEGER'),
+        add_column_if_missing('schedule', 'end_at', 'INTEGER'),
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_appointments_span_insert AFTER INSERT ON appointments
+        BEGIN
+            UPDATE appointments SET {APPOINTMENT_SPAN_SQL} WHERE id = NEW.id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_appointments_span_update
+        AFTER UPDATE OF appointment_date, appointment_time, service_id ON appointments
+        BEGIN
+            UPDATE appointments SET {APPOINTMENT_SPAN_SQL} WHERE id = NEW.id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_schedule_span_insert AFTER INSERT ON schedule
+        BEGIN
+            UPDATE schedule SET {SCHEDULE_SPAN_SQL} WHERE id = NEW.id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_schedule_span_update AFTER UPDATE OF date, start_time, end_time ON schedule
+        BEGIN
+            UPDATE schedule SET {SCHEDULE_SPAN_SQL} WHERE id = NEW.id;
+        END
+        ''',
+        # end_at зависит от длительности услуги: при ее изменении интервалы активных записей пересчитываются
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_services_duration_span AFTER UPDATE OF duration ON services
+        BEGIN
+            UPDATE appointments SET end_at = start_at + COALESCE(NEW.duration, {DEFAULT_DURATION}) * 60
+            WHERE service_id = NEW.id AND status = 'active';
+        END
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_active_master_span '
+        "ON appointments (master_id, start_at, end_at) WHERE status = 'active'",
+        'CREATE INDEX IF NOT EXISTS idx_appointments_active_start '
+        "ON appointments (start_at) WHERE status = 'active'",
+        'CREATE INDEX IF NOT EXISTS idx_schedule_master_span ON schedule (master_id, start_at, end_at)',
+    ], [
+        Backfill("Время записей", _BACKFILL_PAD_TIMES.format(
+            table='appointments',
+            assignments=f"appointment_time = {_pad('appointment_time')}",
+            condition=_unpadded('appointment_time'))),
+        Backfill("Время расписания", _BACKFILL_PAD_TIMES.format(
+            table='schedule',
+            assignments=(f"start_time = CASE WHEN {_unpadded('start_time')} THEN {_pad('start_time')} "
+                         f"ELSE start_time END, "
+                         f"end_time = CASE WHEN {_unpadded('end_time')} THEN {_pad('end_time')} ELSE end_time END"),
+            condition=f"{_unpadded('start_time')} OR {_unpadded('end_time')}")),
+        Backfill("Интервалы записей", _BACKFILL_SPAN.format(
+            table='appointments', span=APPOINTMENT_SPAN_SQL, start=_epoch('appointment_date', 'appointment_time'))),
+        Backfill("Интервалы расписания", _BACKFILL_SPAN.format(
+            table='schedule', span=SCHEDULE_SPAN_SQL, start=_epoch('date', 'start_time'))),
+    ]),
+    # Порядок (дата, время, rowid) прямо в индексе: страница читается без сортировки
+    Migration(9, "Индексы постраничных списков", [
+        'CREATE INDEX IF NOT EXISTS idx_appointments_active_master_day '
+        "ON appointments (master_id, appointment_date, appointment_time) WHERE status = 'active'",
+        'DROP INDEX IF EXISTS idx_appointments_client_status',
+        'CREATE INDEX IF NOT EXISTS idx_appointments_active_client_day '
+        "ON appointments (client_id, appointment_date, appointment_time) WHERE status = 'active'",
+        'CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)',
+    ]),
+]
+
+
+class MigrationRunner:
+    """Применение миграций по таблице schema_version
+    
+    Каждая миграция выполняется в отдельной транзакции BEGIN IMMEDIATE
+    вместе с записью своей версии. Пакетные backfill'ы выполняются после
+    коммита схемы и отмечаются в schema_version по завершении, поэтому
+    прерванное заполнение продолжится при следующем запуске.
+    """
+    
+    def __init__(self, pool, migrations: Sequence[Migration] = None):
+        self.pool = pool
+        self.migrations = sorted(MIGRATIONS if migrations is None else migrations,
+                                 key=lambda m: m.version)
+        self.latest_version = self.migrations[-1].version if self.migrations else 0
+    
+    def get_state(self):
+        """Текущая версия схемы и число незавершенных backfill'ов (один запрос)"""
+        with self.pool.connection() as conn:
+            try:
+                version, pending = conn.execute(
+                    'SELECT MAX(version), SUM(NOT backfill_done) FROM schema_version'
+                ).fetchone()
+            except sqlite3.OperationalError:
+                return 0, 0  # таблицы schema_version еще нет
+        return version or 0, pending or 0
+    
+    def is_up_to_date(self) -> bool:
+        version, pending = self.get_state()
+        return version >= self.latest_version and not pending
+    
+    def run(self) -> int:
+        """Применение недостающих миграций, возвращает итоговую версию"""
+        version, pending = self.get_state()
+        if version >= self.latest_version and not pending:
+            return version
+        
+        for migration in self.migrations:
+            if migration.version > version:
+                self._apply(migration)
+        
+        self._run_backfills()
+        return self.get_state()[0]
+    
+    def _apply(self, migration: Migration):
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    backfill_done BOOLEAN DEFAULT FALSE
+                )
+            ''')
+            # Повторная проверка под блокировкой: миграцию мог применить другой процесс
+            applied = conn.execute('SELECT 1 FROM schema_version WHERE version = ?',
+                                   (migration.version,)).fetchone()
+            if applied:
+                return
+            migration.apply(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, description, backfill_done) VALUES (?, ?, ?)',
+                (migration.version, migration.description, not migration.backfills)
+            )
+        logger.info(f"🗄️ Миграция {migration.version} применена: {migration.description}")
+    
+    def _run_backfills(self):
+        with self.pool.connection() as conn:
+            pending = {row[0] for row in conn.execute(
+                'SELECT version FROM schema_version WHERE NOT backfill_done'
+            )}
+        
+        for migration in self.migrations:
+            if migration.version not in pending:
+                continue
+            for backfill in migration.backfills:
+                count = backfill.run(self.pool)
+                logger.info(f"🗄️ Миграция {migration.version}: {backfill.description} ({count} строк)")
+            with self.pool.connection() as conn:
+                conn.execute('UPDATE schema_version SET backfill_done = TRUE WHERE version = ?',
+                             (migration.version,))
@@ -0,0 +1,327 @@
+import asyncio
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import IntEnum
+from typing import Callable, Dict, Optional, Set
+from config.settings import (OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_GROUP_RATE, OUTBOUND_CHAT_BURST,
+                             OUTBOUND_SENDERS, OUTBOUND_MAX_RETRIES)
+
+logger = logging.getLogger(__name__)
+
+# Методы TeleBot, которые проходят через очередь исходящих сообщений
+RATE_LIMITED_METHODS = ('send_message', 'edit_message_text')
+
+# Интервал очистки заполненных (простаивающих) корзин чатов (сек)
+BUCKET_PRUNE_INTERVAL = 60
+
+
+class Priority(IntEnum):
+    """Очереди отправки: меньшее значение отправляется раньше"""
+    INTERACTIVE = 0  # Ответы пользователю в обработчиках
+    REMINDER = 1  # Массовая рассылка напоминаний
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity подряд"""
+    
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+    
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def delay(self, now: float) -> float:
+        """Через сколько секунд будет доступен токен (0 - сейчас)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+    
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+    
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ('method', 'args', 'kwargs', 'chat_id', 'priority', 'future', 'attempts')
+    
+    def __init__(self, method: Callable, args: tuple, kwargs: dict, chat_id, priority: Priority):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.chat_id = chat_id
+        self.priority = priority
+        self.future = Future()
+        self.attempts = 0
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Пауза из ответа 429 Too Many Requests, None для остальных ошибок"""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    result = getattr(error, 'result_json', None) or {}
+    return float(result.get('parameters', {}).get('retry_after', 1))
+
+
+class OutboundQueue:
+    """
+    Очередь исходящих сообщений с ограничением частоты отправки
+    
+    Все вызовы send_message/edit_message_text проходят через корзины токенов:
+    общую на бота (~30 сообщений/с), на личный чат (~1/с) и на группу
+    (~20/мин). Диспетчер выбирает следующее сообщение сначала из очереди
+    INTERACTIVE, затем REMINDER, поэтому ответы пользователям не ждут конца
+    рассылки напоминаний. Внутри чата сообщения отправляются по порядку и не
+    больше одного одновременно. Ответ 429 не считается ошибкой: чат
+    откладывается на retry_after, а сообщение возвращается в начало очереди.
+    """
+    
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 group_rate: float = OUTBOUND_GROUP_RATE, chat_burst: int = OUTBOUND_CHAT_BURST,
+                 senders: int = OUTBOUND_SENDERS, max_retries: int = OUTBOUND_MAX_RETRIES):
+        """
+        Args:
+            global_rate: Сообщений в секунду на бота
+            chat_rate: Сообщений в секунду в личный чат
+            group_rate: Сообщений в секунду в группу (chat_id < 0)
+            chat_burst: Сообщений подряд в один чат без ожидания
+            senders: Одновременных запросов к Telegram API
+            max_retries: Повторов одного сообщения после 429
+        """
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.senders = senders
+        self.max_retries = max_retries
+        
+        self._cond = threading.Condition()
+        self._global = TokenBucket(global_rate, max(1.0, global_rate), time.monotonic())
+        self._buckets: Dict[object, TokenBucket] = {}
+        self._cooldown: Dict[object, float] = {}  # chat_id -> до какого момента не отправлять (429)
+        self._paused_until = 0.0  # 429 без чата (inline-сообщения) останавливает всю отправку
+        self._lanes: Dict[Priority, OrderedDict] = {priority: OrderedDict() for priority in Priority}
+        self._in_flight: Set[object] = set()
+        self._busy = 0
+        self._queued = 0
+        self._last_prune = time.monotonic()
+        
+        self._originals: Dict[str, Callable] = {}
+        self._signatures: Dict[Callable, inspect.Signature] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        
+        self.counters = {'submitted': 0, 'sent': 0, 'failed': 0, 'rate_limited': 0, 'max_queued': 0}
+    
+    def install(self, bot, methods=RATE_LIMITED_METHODS):
+        """Перехват методов отправки bot: вызов ставит сообщение в очередь и ждет результата"""
+        for name in methods:
+            original = getattr(bot, name)
+            self._originals[name] = original
+            setattr(bot, name, self._blocking(original))
+    
+    def _blocking(self, method: Callable) -> Callable:
+        def call(*args, priority: Priority = Priority.INTERACTIVE, **kwargs):
+            return self.submit(method, args, kwargs, priority).result()
+        
+        call.__name__ = method.__name__
+        return call
+    
+    def async_client(self, priority: Priority = Priority.REMINDER) -> 'AsyncOutboundClient':
+        """Клиент для кода на asyncio: методы отправки - корутины (для SchedulerService)"""
+        return AsyncOutboundClient(self, priority)
+    
+    def original(self, name: str) -> Callable:
+        """Исходный метод бота, перехваченный install()"""
+        try:
+            return self._originals[name]
+        except KeyError:
+            raise AttributeError(name) from None
+    
+    def _chat_id(self, method: Callable, args: tuple, kwargs: dict):
+        signature = self._signatures.get(method)
+        if signature is None:
+            signature = self._signatures[method] = inspect.signature(method)
+        return signature.bind_partial(*args, **kwargs).arguments.get('chat_id')
+    
+    def submit(self, method: Callable, args: tuple = (), kwargs: dict = None,
+               priority: Priority = Priority.INTERACTIVE) -> Future:
+        """Постановка вызова method(*args, **kwargs) в очередь; Future с результатом вызова"""
+        kwargs = kwargs or {}
+        job = _Job(method, args, kwargs, self._chat_id(method, args, kwargs), priority)
+        with self._cond:
+            if self._thread is None:
+                self._start()
+            self._lanes[priority].setdefault(job.chat_id, deque()).append(job)
+            self._queued += 1
+            self.counters['submitted'] += 1
+            self.counters['max_queued'] = max(self.counters['max_queued'], self._queued)
+            self._cond.notify()
+        return job.future
+    
+    def _start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.senders, thread_name_prefix='outbound')
+        self._thread = threading.Thread(target=self._run, name='outbound-dispatcher', daemon=True)
+        self._thread.start()
+    
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            # Отрицательный id или @username - группа или канал
+            is_group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0)
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._buckets[chat_id] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+    
+    def _next_job(self, now: float):
+        """Следующее сообщение, которое можно отправить сейчас, или (None, сколько ждать)"""
+        if self._busy >= self.senders:
+            return None, None
+        wait = max(self._paused_until - now, self._global.delay(now))
+        if wait > 0:
+            return None, wait
+        
+        wait = None
+        for lane in self._lanes.values():
+            for chat_id, jobs in lane.items():
+                if chat_id is not None:
+                    if chat_id in self._in_flight:
+                        continue
+                    ready_in = max(self._cooldown.get(chat_id, 0) - now, self._chat_bucket(chat_id, now).delay(now))
+                    if ready_in > 0:
+                        wait = ready_in if wait is None else min(wait, ready_in)
+                        continue
+                    self._chat_bucket(chat_id, now).take(now)
+                    self._in_flight.add(chat_id)
+                    self._cooldown.pop(chat_id, None)
+                job = jobs.popleft()
+                if jobs:
+                    lane.move_to_end(chat_id)
+                else:
+                    del lane[chat_id]
+                self._global.take(now)
+                self._busy += 1
+                self._queued -= 1
+                return job, None
+        return None, wait
+    
+    def _run(self):
+        with self._cond:
+            while True:
+                if self._stopping and not self._queued and not self._busy:
+                    return
+                now = time.monotonic()
+                if now - self._last_prune > BUCKET_PRUNE_INTERVAL:
+                    self._prune(now)
+                job, wait = self._next_job(now)
+                if job is None:
+                    self._cond.wait(wait)
+                    continue
+                self._executor.submit(self._send, job)
+    
+    def _prune(self, now: float):
+        """Удаление корзин чатов, которые полностью восстановились и ничего не ждут"""
+        waiting = set(self._in_flight).union(*(lane.keys() for lane in self._lanes.values()))
+        for chat_id in [chat_id for chat_id, bucket in self._buckets.items()
+                        if chat_id not in waiting and bucket.full(now)]:
+            del self._buckets[chat_id]
+        self._last_prune = now
+    
+    def _send(self, job: _Job):
+        try:
+            result = job.method(*job.args, **job.kwargs)
+        except Exception as e:
+            delay = retry_after(e)
+            with self._cond:
+                self._busy -= 1
+                self._in_flight.discard(job.chat_id)
+                if delay is not None and job.attempts < self.max_retries:
+                    self._requeue(job, delay)
+                    return
+                self.counters['failed'] += 1
+                self._cond.notify()
+            job.future.set_exception(e)
+            return
+        with self._cond:
+            self._busy -= 1
+            self._in_flight.discard(job.chat_id)
+            self.counters['sent'] += 1
+            self._cond.notify()
+        job.future.set_result(result)
+    
+    def _requeue(self, job: _Job, delay: float):
+        """Возврат сообщения в начало очереди его чата после 429"""
+        job.attempts += 1
+        self.counters['rate_limited'] += 1
+        until = time.monotonic() + delay
+        if job.chat_id is None:
+            self._paused_until = max(self._paused_until, until)
+        else:
+            self._cooldown[job.chat_id] = until
+        lane = self._lanes[job.priority]
+        jobs = lane.get(job.chat_id)
+        if jobs is None:
+            jobs = lane[job.chat_id] = deque()
+            lane.move_to_end(job.chat_id, last=False)
+        jobs.appendleft(job)
+        self._queued += 1
+        logger.warning(f"429 от Telegram для чата {job.chat_id}: повтор через {delay:.0f} с")
+        self._cond.notify()
+    
+    def stop(self, timeout: float = 30.0):
+        """Остановка после отправки уже поставленных сообщений"""
+        with self._cond:
+            thread = self._thread
+            if thread is None:
+                return
+            self._stopping = True
+            self._cond.notify()
+        thread.join(timeout)
+        self._executor.shutdown(wait=True)
+        with self._cond:
+            self._thread = None
+            self._stopping = False
+    
+    def stats(self) -> dict:
+        """Счетчики и глубина очередей по приоритетам"""
+        with self._cond:
+            stats = dict(self.counters)
+            stats['queued'] = {priority.name.lower(): sum(len(jobs) for jobs in lane.values())
+                               for priority, lane in self._lanes.items()}
+            stats['in_flight'] = self._busy
+            stats['chats_waiting'] = len(self._cooldown)
+        return stats
+
+
+class AsyncOutboundClient:
+    """
+    Отправка через OutboundQueue из asyncio: await client.send_message(...)
+    
+    Вызывается исходный (синхронный) метод TeleBot, перехваченный install(),
+    поэтому сообщения из event loop учитываются в тех же корзинах токенов.
+    """
+    
+    def __init__(self, outbound: OutboundQueue, priority: Priority):
+        self.outbound = outbound
+        self.priority = priority
+    
+    def __getattr__(self, name):
+        method = self.outbound.original(name)
+        
+        async def call(*args, **kwargs):
+            return await asyncio.wrap_future(self.outbound.submit(method, args, kwargs, self.priority))
+        
+        call.__name__ = name
+        return call
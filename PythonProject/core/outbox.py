@@ -0,0 +1,160 @@
+"""
+Таблица outbox: напоминания, которые нужно доставить
+
+Строки добавляются в той же транзакции, что и запись клиента, по одной на
+вид напоминания (UNIQUE (appointment_id, kind)). OutboxWorker забирает
+наступившие строки пачками, отправляет и отмечает каждую доставленной,
+поэтому перезапуск посреди рассылки не теряет и не дублирует напоминания.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+from config.settings import (REMINDER_HOUR, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY,
+                             OUTBOX_CLAIM_TIMEOUT, REMINDER_CONCURRENCY)
+
+logger = logging.getLogger(__name__)
+
+# Формат времени в outbox (локальное время, как datetime('now', 'localtime') в SQLite)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Когда отправлять напоминание вида k.kind о записи a
+_DUE_AT = f'''
+    CASE k.kind
+        WHEN 'day_before' THEN datetime(a.appointment_date, '-1 day', '+{REMINDER_HOUR} hours')
+        ELSE datetime(a.appointment_date || ' ' || a.appointment_time, '-60 minutes')
+    END'''
+
+# Напоминания, время которых уже прошло, не ставятся (запись сделана позже)
+_ENQUEUE = f'''
+    INSERT OR IGNORE INTO outbox (appointment_id, kind, chat_id, due_at)
+    SELECT a.id, k.kind, a.client_id, {_DUE_AT}
+    FROM appointments a
+    CROSS JOIN (SELECT 'day_before' AS kind UNION ALL SELECT 'hour_before') k
+    WHERE {{where}} AND {_DUE_AT} > datetime('now', 'localtime')
+'''
+
+# Напоминания для только что созданной записи (параметр :appointment_id)
+ENQUEUE_REMINDERS_SQL = _ENQUEUE.format(where='a.id = :appointment_id')
+
+# Заполнение outbox для будущих активных записей, созданных до появления таблицы
+BACKFILL_REMINDERS_SQL = _ENQUEUE.format(where='''
+    a.status = 'active' AND a.appointment_date >= date('now', 'localtime')
+    AND NOT EXISTS (SELECT 1 FROM outbox o WHERE o.appointment_id = a.id AND o.kind = k.kind)
+''') + 'LIMIT :limit'
+
+
+def timestamp(moment: datetime) -> str:
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Перцентиль fraction (0..1) по ближайшему рангу, 0 для пустого списка"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class OutboxWorker:
+    """
+    Доставка наступивших напоминаний из outbox
+    
+    Строки забираются пачками (status = 'sending', attempts + 1). Строка,
+    забранная процессом, который упал до отметки, снова становится доступной
+    через OUTBOX_CLAIM_TIMEOUT. Ошибка отправки откладывает строку с
+    экспоненциальной паузой, после OUTBOX_MAX_ATTEMPTS попыток она
+    помечается failed. Напоминания об отмененных и уже начавшихся записях
+    не отправляются.
+    
+    Пачка отправляется параллельно, но не больше concurrency сообщений
+    одновременно; частоту отправки дальше ограничивает OutboundQueue.
+    """
+    
+    def __init__(self, db, bot, render: Callable, batch_size: int = OUTBOX_BATCH_SIZE,
+                 on_retry: Optional[Callable[[int, str, str], None]] = None,
+                 concurrency: int = REMINDER_CONCURRENCY):
+        """
+        Args:
+            db: AsyncDatabase
+            bot: Асинхронный клиент отправки, send_message - корутина
+            render: Текст напоминания для OutboxItem
+            batch_size: Строк, забираемых за один запрос
+            on_retry: Вызывается с (appointment_id, kind, due_at) для отложенной попытки
+            concurrency: Одновременных отправок
+        """
+        self.db = db
+        self.bot = bot
+        self.render = render
+        self.batch_size = batch_size
+        self.on_retry = on_retry
+        self.concurrency = concurrency
+    
+    async def deliver_due(self) -> dict:
+        """Доставка всех наступивших напоминаний, возвращает статистику прогона"""
+        stats = {'claimed': 0, 'delivered': 0, 'skipped': 0, 'retried': 0, 'failed': 0}
+        latencies: List[float] = []
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        while True:
+            now = datetime.now()
+            items = await self.db.claim_outbox(
+                timestamp(now), timestamp(now - timedelta(seconds=OUTBOX_CLAIM_TIMEOUT)), self.batch_size
+            )
+            stats['claimed'] += len(items)
+            # Тексты и пропуски считаются для всей пачки заранее: задачи отправки только ждут сеть
+            batch = self._prepare(items, now)
+            await asyncio.gather(*(self._deliver(item, text, now, stats, semaphore, latencies)
+                                   for item, text in batch))
+            if len(items) < self.batch_size:
+                break
+        
+        stats['duration'] = round(time.perf_counter() - started, 3)
+        stats['p95_latency'] = round(percentile(latencies, 0.95), 3)
+        return stats
+    
+    def _prepare(self, items: List, now: datetime) -> List[Tuple[object, Optional[str]]]:
+        """Пары (строка, текст); текст None, если запись отменена или уже началась"""
+        started_before = now.strftime('%Y-%m-%d %H:%M')
+        batch = []
+        for item in items:
+            if item.appointment_status != 'active':
+                batch.append((item, None))
+            elif f"{item.appointment_date} {item.appointment_time}" <= started_before:
+                batch.append((item, None))
+            else:
+                batch.append((item, self.render(item)))
+        return batch
+    
+    async def _deliver(self, item, text: Optional[str], now: datetime, stats: dict,
+                       semaphore: asyncio.Semaphore, latencies: List[float]):
+        if text is None:
+            status = 'cancelled' if item.appointment_status != 'active' else 'expired'
+            await self.db.finish_outbox(item.id, status, timestamp(now))
+            stats['skipped'] += 1
+            return
+        
+        async with semaphore:
+            sent_at = time.perf_counter()
+            try:
+                await self.bot.send_message(chat_id=item.chat_id, text=text)
+                error = None
+            except Exception as e:
+                error = e
+            latencies.append(time.perf_counter() - sent_at)
+        
+        if error is None:
+            await self.db.finish_outbox(item.id, 'delivered', timestamp(datetime.now()))
+            stats['delivered'] += 1
+        elif item.attempts >= OUTBOX_MAX_ATTEMPTS:
+            await self.db.finish_outbox(item.id, 'failed', timestamp(now), str(error))
+            stats['failed'] += 1
+            logger.error(f"Напоминание {item.kind} для записи {item.appointment_id} не доставлено: {error}")
+        else:
+            retry_at = now + timedelta(seconds=OUTBOX_RETRY_DELAY * 2 ** (item.attempts - 1))
+            await self.db.retry_outbox(item.id, timestamp(retry_at), str(error))
+            if self.on_retry:
+                self.on_retry(item.appointment_id, item.kind, timestamp(retry_at))
+            stats['retried'] += 1
+            logger.warning(f"Напоминание {item.kind} для записи {item.appointment_id}: {error}, повтор в {retry_at:%H:%M:%S}")
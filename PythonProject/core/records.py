@@ -0,0 +1,200 @@
+"""
+Типизированные строки результатов Database
+
+Одна запись на форму запроса. Поля идут в порядке колонок SELECT, поэтому
+строки по-прежнему можно распаковывать как кортежи. Время HH:MM дополнительно
+приходит из SQL в минутах от полуночи (поля *_minutes).
+"""
+from enum import Enum
+from typing import Callable, NamedTuple, Optional, Sequence, Tuple
+
+
+def row_factory(record_type) -> Callable:
+    """sqlite3 row_factory, собирающая строки в record_type"""
+    make = record_type._make
+    return lambda cursor, row: make(row)
+
+
+# Курсор keyset-пагинации: (дата, время, id) последней показанной строки
+PageCursor = Tuple[str, str, int]
+FIRST_PAGE: PageCursor = ('', '', 0)
+
+
+class Page(NamedTuple):
+    """Страница списка и курсор следующей (None - страница последняя)"""
+    items: Sequence
+    next_cursor: Optional[tuple]
+
+
+class User(NamedTuple):
+    user_id: int
+    username: Optional[str]
+    first_name: Optional[str]
+    is_master: bool
+    phone: Optional[str]
+    created_at: str
+
+
+class Master(NamedTuple):
+    id: int
+    user_id: int
+    name: str
+    specialization: Optional[str]
+    social_media: Optional[str]
+    address: Optional[str]
+    password: Optional[str]
+
+
+class MasterListItem(NamedTuple):
+    """Мастер в списке для входа"""
+    id: int
+    name: str
+    specialization: Optional[str]
+
+
+class Service(NamedTuple):
+    id: int
+    master_id: int
+    name: str
+    price: float
+    duration: Optional[int]
+
+
+class ScheduleEntry(NamedTuple):
+    """Рабочее окно мастера"""
+    id: int
+    master_id: int
+    date: str
+    start_time: str
+    end_time: str
+    is_available: bool
+    start_minutes: int
+    end_minutes: int
+
+
+class ClientAppointment(NamedTuple):
+    """Активная запись клиента с мастером и услугой"""
+    id: int
+    client_id: int
+    master_id: int
+    service_id: int
+    appointment_date: str
+    appointment_time: str
+    status: str
+    created_at: str
+    master_name: str
+    service_name: str
+    price: float
+    duration: Optional[int]
+    start_minutes: int
+
+
+class MasterAppointment(NamedTuple):
+    """Активная запись к мастеру с данными клиента"""
+    id: int
+    client_id: int
+    master_id: int
+    service_id: int
+    appointment_date: str
+    appointment_time: str
+    status: str
+    created_at: str
+    client_name: Optional[str]
+    client_username: Optional[str]
+    service_name: str
+    start_minutes: int
+
+
+class AppointmentDetails(NamedTuple):
+    """Запись со всеми связанными данными (напоминания, выборки по дате и ID)"""
+    id: int
+    client_id: int
+    master_id: int
+    service_id: int
+    appointment_date: str
+    appointment_time: str
+    status: str
+    created_at: str
+    client_name: Optional[str]
+    master_name: Optional[str]
+    service_name: Optional[str]
+    duration: Optional[int]
+    address: Optional[str]
+    start_minutes: int
+
+
+class BusyInterval(NamedTuple):
+    """Занятый интервал мастера: начало в минутах от полуночи и длительность"""
+    start: int
+    duration: int
+
+
+class AppointmentSpan(NamedTuple):
+    """Интервал записи [start_at, end_at) в секундах местного времени (utils.fast_time.local_epoch)"""
+    id: int
+    master_id: int
+    start_at: int
+    end_at: int
+
+
+class ReminderAppointment(NamedTuple):
+    """Запись с данными для текста напоминания"""
+    id: int
+    client_id: int
+    appointment_date: str
+    appointment_time: str
+    master_name: str
+    service_name: str
+    address: str
+
+
+class OutboxItem(NamedTuple):
+    """Забранная из outbox строка с данными записи для текста напоминания"""
+    id: int
+    appointment_id: int
+    kind: str  # day_before, hour_before
+    chat_id: int
+    attempts: int
+    appointment_date: str
+    appointment_time: str
+    appointment_status: str
+    master_name: Optional[str]
+    service_name: Optional[str]
+    address: Optional[str]
+
+
+class PendingReminder(NamedTuple):
+    """Ожидающее отправки напоминание из outbox"""
+    appointment_id: int
+    kind: str
+    due_at: str
+
+
+class BookingConfirmation(NamedTuple):
+    """Созданная запись с данными для подтверждения клиенту"""
+    id: int
+    appointment_date: str
+    appointment_time: str
+    master_name: str
+    service_name: str
+    price: float
+    duration: int
+    address: str
+
+
+class BookingStatus(str, Enum):
+    """Итог попытки записи"""
+    BOOKED = 'booked'
+    CONFLICT = 'conflict'  # интервал пересекается с другой записью
+    OUTSIDE_SCHEDULE = 'outside_schedule'  # время вне расписания мастера или уже прошло
+    UNKNOWN_SERVICE = 'unknown_service'  # услуги нет или она другого мастера
+
+
+class BookingResult(NamedTuple):
+    """Результат Database.book_appointment"""
+    status: BookingStatus
+    appointment: Optional[BookingConfirmation] = None
+    
+    @property
+    def booked(self) -> bool:
+        return self.status is BookingStatus.BOOKED
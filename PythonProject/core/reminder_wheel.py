@@ -0,0 +1,123 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from core.outbox import TIMESTAMP_FORMAT
+from core.records import PendingReminder
+
+logger = logging.getLogger(__name__)
+
+
+class ReminderWheel:
+    """
+    Куча ближайших напоминаний: пробуждение ровно ко времени отправки
+    
+    При запуске загружает из outbox ожидающие напоминания, дальше
+    обновляется по событиям Database (запись, отмена) и повторам
+    OutboxWorker. Задача спит до ближайшего due_at и тогда запускает
+    доставку, поэтому работа пропорциональна числу напоминаний, а не
+    частоте опроса. Отмененные записи удаляются лениво: элемент кучи
+    пропускается, если его больше нет в текущем наборе записи.
+    """
+    
+    def __init__(self, deliver: Callable[[], Awaitable[None]],
+                 load: Callable[[], Awaitable[List[PendingReminder]]]):
+        """
+        Args:
+            deliver: Корутина доставки наступивших напоминаний
+            load: Корутина, возвращающая ожидающие напоминания из outbox
+        """
+        self.deliver = deliver
+        self.load = load
+        self._heap: List[Tuple[datetime, int, str]] = []
+        self._pending: Dict[int, Set[Tuple[datetime, str]]] = {}  # appointment_id -> {(due, kind)}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        
+        self.fired = 0
+        self.runs = 0
+    
+    def add(self, appointment_id: int, kind: str, due_at: str):
+        """Добавление напоминания (только из потока event loop)"""
+        due = datetime.strptime(due_at, TIMESTAMP_FORMAT)
+        pending = self._pending.setdefault(appointment_id, set())
+        if (due, kind) in pending:
+            return
+        pending.add((due, kind))
+        heapq.heappush(self._heap, (due, appointment_id, kind))
+        if self._wakeup and self._heap[0][0] == due:
+            self._wakeup.set()
+    
+    def replace(self, appointment_id: int, reminders: List[PendingReminder]):
+        """Новый набор напоминаний записи; пустой список - запись отменена"""
+        self._pending.pop(appointment_id, None)
+        for reminder in reminders:
+            self.add(appointment_id, reminder.kind, reminder.due_at)
+        # Отмененные элементы остаются в куче до своего времени; чистим, если их стало много
+        if len(self._heap) > 4 * len(self._pending) + 64:
+            self._heap = [(due, appointment_id, kind) for due, appointment_id, kind in self._heap
+                          if (due, kind) in self._pending.get(appointment_id, ())]
+            heapq.heapify(self._heap)
+    
+    @property
+    def scheduled(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())
+    
+    def on_reminders_changed(self, appointment_id: int, reminders: List[PendingReminder]):
+        """Слушатель Database: вызывается из любого потока после коммита"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.replace, appointment_id, reminders)
+    
+    def _pop_due(self, now: datetime) -> int:
+        fired = 0
+        while self._heap and self._heap[0][0] <= now:
+            due, appointment_id, kind = heapq.heappop(self._heap)
+            pending = self._pending.get(appointment_id)
+            if not pending or (due, kind) not in pending:
+                continue  # отменено или заменено
+            pending.discard((due, kind))
+            if not pending:
+                del self._pending[appointment_id]
+            fired += 1
+        return fired
+    
+    async def _run(self):
+        for reminder in await self.load():
+            self.add(reminder.appointment_id, reminder.kind, reminder.due_at)
+        logger.info(f"⏰ Загружено напоминаний: {self.scheduled}")
+        
+        while True:
+            self._wakeup.clear()
+            timeout = (self._heap[0][0] - datetime.now()).total_seconds() if self._heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            fired = self._pop_due(datetime.now())
+            if fired:
+                self.fired += fired
+                self.runs += 1
+                try:
+                    await self.deliver()
+                except Exception as e:
+                    logger.error(f"Ошибка доставки напоминаний: {e}", exc_info=True)
+    
+    def start(self):
+        """Запуск задачи в текущем event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+    
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._loop = None
+    
+    def stats(self) -> dict:
+        return {'scheduled': self.scheduled,
+                'heap': len(self._heap), 'fired': self.fired, 'runs': self.runs,
+                'next_due': self._heap[0][0].strftime(TIMESTAMP_FORMAT) if self._heap else None}
@@ -2,35 +2,74 @@ import asyncio
 from datetime import datetime, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from core.database import Database
+from core.async_database import AsyncDatabase
+from core.outbox import OutboxWorker, TIMESTAMP_FORMAT, timestamp
+from core.reminder_wheel import ReminderWheel
+from core.job_store import SQLiteJobStore
+from core.records import OutboxItem
+from utils.fast_time import format_date_short
+from config.settings import OUTBOX_POLL_INTERVAL, SCHEDULER_COALESCE, SCHEDULER_MISFIRE_GRACE_TIME
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Префикс id задач кастомных напоминаний: reminder_<appointment_id>
+CUSTOM_REMINDER_JOB_PREFIX = 'reminder_'
+
+# Сервис, выполняющий задачи из постоянного хранилища (задается в SchedulerService.start)
+_service = None
+
+
+async def send_custom_reminder(appointment_id: int):
+    """
+    Задача кастомного напоминания в постоянном хранилище
+    
+    Хранилище сохраняет ссылку на функцию по имени модуля, а метод экземпляра
+    так сохранить нельзя, поэтому задача вызывает текущий SchedulerService.
+    """
+    if _service is None:
+        logger.warning(f"Планировщик не запущен, напоминание для записи {appointment_id} пропущено")
+        return
+    await _service.send_custom_reminder(appointment_id)
+
+
 class SchedulerService:
     """Сервис для работы с планировщиком и напоминаниями"""
     
-    def __init__(self, bot_instance):
+    def __init__(self, bot_instance, db: Database = None, executor=None):
+        """
+        Args:
+            bot_instance: Асинхронный клиент отправки (OutboundQueue.async_client или
+                AsyncTeleBot), send_message - корутина
+            db: Общая с ботом база данных (по умолчанию создается новая)
+            executor: Пул потоков для запросов к БД
+        """
         self.bot = bot_instance
-        self.db = Database()
-        self.scheduler = AsyncIOScheduler()
+        # Запросы к SQLite выполняются в пуле потоков и не блокируют event loop
+        self.db = AsyncDatabase(db or Database(), executor)
+        # Кастомные напоминания - в таблице apscheduler_jobs базы бота, остальные задачи - в памяти
+        self.scheduler = AsyncIOScheduler(
+            jobstores={'persistent': SQLiteJobStore(self.db.db.pool)},
+            job_defaults={'coalesce': SCHEDULER_COALESCE, 'misfire_grace_time': SCHEDULER_MISFIRE_GRACE_TIME},
+        )
+        # Куча напоминаний будит доставку точно ко времени отправки
+        self.wheel = ReminderWheel(self.deliver_outbox, self.db.get_pending_reminders)
+        self.outbox = OutboxWorker(self.db, self.bot, self.render_reminder, on_retry=self.wheel.add)
     
     def start(self):
         """Запуск планировщика"""
-        # Напоминания за день до записи в 10:00
-        self.scheduler.add_job(
-            self.send_daily_reminders,
-            'cron',
-            hour=10,
-            minute=0,
-            id='daily_reminders'
-        )
-        
-        # Напоминания за час до записи (каждые 15 минут для точности)
+        # Напоминания за день (в 10:00) и за час до записи ставятся в outbox при записи
+        # и доставляются по ReminderWheel. Редкая проверка подбирает то, о чем куча не знает:
+        # записи из других процессов и строки, забранные упавшим процессом
+        self.db.db.add_reminder_listener(self.wheel.on_reminders_changed)
+        self.wheel.start()
         self.scheduler.add_job(
-            self.send_hourly_reminders,
-            'cron',
-            minute='0,15,30,45',  # Каждые 15 минут
-            id='hourly_reminders'
+            self.deliver_outbox,
+            'interval',
+            seconds=OUTBOX_POLL_INTERVAL,
+            id='outbox',
+            max_instances=1,
+            coalesce=True
         )
         
         # Очистка старых записей в полночь
@@ -42,100 +81,58 @@ class SchedulerService:
             id='cleanup'
         )
         
+        global _service
+        _service = self
         self.scheduler.start()
+        self.reconcile_custom_reminders()
         logger.info("⏰ Scheduler started")
     
     def stop(self):
         """Остановка планировщика"""
         self.scheduler.shutdown()
-        logger.info("⏰ Scheduler stopped")
+        self.wheel.stop()
+        logger.info(f"⏰ Scheduler stopped, напоминания: {self.wheel.stats()}")
     
-    async def send_daily_reminders(self):
-        """Отправка напоминаний за день до записи"""
+    async def deliver_outbox(self):
+        """Доставка наступивших напоминаний из outbox"""
         try:
-            appointments = self.db.get_appointments_for_reminder()
-            
-            for app in appointments:
-                try:
-                    text = (
-                        f"🔔 Напоминание!\n\n"
-                        f"У вас завтра запись:\n"
-                        f"📅 {datetime.strptime(app[4], '%Y-%m-%d').strftime('%d.%m.%Y')}\n"
-                        f"⏰ {app[5]}\n"
-                        f"👨‍💼 Мастер: {app[7]}\n"
-                        f"💇‍♀️ Услуга: {app[8]}\n\n"
-                        f"Не забудьте про вашу запись! 😊"
-                    )
-                    
-                    await self.bot.send_message(chat_id=app[1], text=text)
-                    logger.info(f"Daily reminder sent to user {app[1]}")
-                    
-                except Exception as e:
-                    logger.error(f"Failed to send daily reminder to user {app[1]}: {e}")
-                    
+            stats = await self.outbox.deliver_due()
+            if stats['claimed']:
+                logger.info(f"Outbox: {stats}")
         except Exception as e:
-            logger.error(f"Error in send_daily_reminders: {e}")
+            logger.error(f"Error in deliver_outbox: {e}")
     
-    async def send_hourly_reminders(self):
-        """Отправка напоминаний за час до записи"""
-        try:
-            current_time = datetime.now()
-            # Проверяем записи в ближайшие 45-75 минут (чтобы поймать час)
-            for minutes_ahead in range(45, 76, 15):  # 45, 60, 75 минут
-                target_datetime = current_time + timedelta(minutes=minutes_ahead)
-                target_date = target_datetime.strftime("%Y-%m-%d")
-                target_time = target_datetime.strftime("%H:%M")
-                
-                # Получаем все записи на сегодня
-                appointments = self.db.get_appointments_by_date(target_date)
-                
-                for app in appointments:
-                    try:
-                        # Проверяем, точно ли это за час до записи
-                        app_datetime = datetime.strptime(f"{app[4]} {app[5]}", "%Y-%m-%d %H:%M")
-                        time_diff = app_datetime - current_time
-                        
-                        # Если до записи осталось от 55 до 65 минут - отправляем напоминание
-                        if timedelta(minutes=55) <= time_diff <= timedelta(minutes=65):
-                            # Проверяем, не отправляли ли уже напоминание
-                            if not hasattr(app, '_reminder_sent'):
-                                text = (
-                                    f"⏰ Напоминание!\n\n"
-                                    f"Ваша запись через час:\n"
-                                    f"📅 {target_date}\n"
-                                    f"⏰ {app[5]}\n"
-                                    f"👨‍💼 Мастер: {app[7]}\n"
-                                    f"💇‍♀️ Услуга: {app[8]}\n"
-                                    f"📍 Адрес: {app[9]}\n\n"
-                                    f"Подготовьтесь к визиту! 🎯"
-                                )
-                                
-                                await self.bot.send_message(chat_id=app[1], text=text)
-                                logger.info(f"Hourly reminder sent to user {app[1]} for appointment at {app[5]}")
-                                
-                    except Exception as e:
-                        logger.error(f"Failed to send hourly reminder to user {app[1]}: {e}")
-                    
-        except Exception as e:
-            logger.error(f"Error in send_hourly_reminders: {e}")
+    @staticmethod
+    def render_reminder(item: OutboxItem) -> str:
+        """Текст напоминания из outbox"""
+        if item.kind == 'day_before':
+            return (
+                f"🔔 Напоминание!\n\n"
+                f"У вас завтра запись:\n"
+                f"📅 {format_date_short(item.appointment_date)}\n"
+                f"⏰ {item.appointment_time}\n"
+                f"👨‍💼 Мастер: {item.master_name}\n"
+                f"💇‍♀️ Услуга: {item.service_name}\n\n"
+                f"Не забудьте про вашу запись! 😊"
+            )
+        return (
+            f"⏰ Напоминание!\n\n"
+            f"Ваша запись через час:\n"
+            f"📅 {item.appointment_date}\n"
+            f"⏰ {item.appointment_time}\n"
+            f"👨‍💼 Мастер: {item.master_name}\n"
+            f"💇‍♀️ Услуга: {item.service_name}\n"
+            f"📍 Адрес: {item.address}\n\n"
+            f"Подготовьтесь к визиту! 🎯"
+        )
     
     async def cleanup_old_appointments(self):
         """Очистка старых записей"""
         try:
             # Помечаем как завершенные записи старше 1 дня
             cutoff_date = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+            updated_count = await self.db.complete_appointments_before(cutoff_date)
             
-            with self.db.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE appointments 
-                    SET status = 'completed' 
-                    WHERE appointment_date < ? AND status = 'active'
-                ''', (cutoff_date,))
-                
-                updated_count = cursor.rowcount
-                conn.commit()
-                
             logger.info(f"🧹 Cleaned up {updated_count} old appointments")
             
         except Exception as e:
@@ -143,35 +140,54 @@ class SchedulerService:
     
     def add_custom_reminder(self, appointment_id: int, reminder_time: datetime):
         """Добавление кастомного напоминания"""
-        job_id = f"reminder_{appointment_id}"
+        # Время хранится и в записи: по нему восстанавливаются задачи, пропавшие из хранилища
+        self.db.db.set_custom_reminder(appointment_id, timestamp(reminder_time))
+        self._schedule_custom_reminder(appointment_id, reminder_time)
         
+        logger.info(f"Custom reminder scheduled for appointment {appointment_id} at {reminder_time}")
+    
+    def _schedule_custom_reminder(self, appointment_id: int, reminder_time: datetime):
         self.scheduler.add_job(
-            self.send_custom_reminder,
+            send_custom_reminder,
             'date',
             run_date=reminder_time,
             args=[appointment_id],
-            id=job_id
+            id=f"{CUSTOM_REMINDER_JOB_PREFIX}{appointment_id}",
+            jobstore='persistent',
+            replace_existing=True
         )
+    
+    def reconcile_custom_reminders(self) -> int:
+        """
+        Восстановление задач для будущих кастомных напоминаний без задачи в хранилище
         
-        logger.info(f"Custom reminder scheduled for appointment {appointment_id} at {reminder_time}")
+        Задачи, пережившие перезапуск, уже в хранилище; запрос по частичному
+        индексу находит только записи, у которых задачи нет.
+        """
+        missing = self.db.db.get_unscheduled_custom_reminders(timestamp(datetime.now()), CUSTOM_REMINDER_JOB_PREFIX)
+        for reminder in missing:
+            self._schedule_custom_reminder(reminder.appointment_id, datetime.strptime(reminder.due_at, TIMESTAMP_FORMAT))
+        if missing:
+            logger.info(f"⏰ Восстановлено задач кастомных напоминаний: {len(missing)}")
+        return len(missing)
     
     async def send_custom_reminder(self, appointment_id: int):
         """Отправка кастомного напоминания"""
         try:
-            appointment = self.db.get_appointment_by_id(appointment_id)
+            appointment = await self.db.get_appointment_by_id(appointment_id)
             
-            if not appointment or appointment[7] != 'active':  # status
+            if not appointment or appointment.status != 'active':
                 return
             
             text = (
                 f"🔔 Напоминание о записи!\n\n"
-                f"📅 {datetime.strptime(appointment[4], '%Y-%m-%d').strftime('%d.%m.%Y')}\n"
-                f"⏰ {appointment[5]}\n"
-                f"👨‍💼 Мастер: {appointment[8]}\n"
-                f"💇‍♀️ Услуга: {appointment[9]}"
+                f"📅 {format_date_short(appointment.appointment_date)}\n"
+                f"⏰ {appointment.appointment_time}\n"
+                f"👨‍💼 Мастер: {appointment.master_name}\n"
+                f"💇‍♀️ Услуга: {appointment.service_name}"
             )
             
-            await self.bot.send_message(chat_id=appointment[1], text=text)
+            await self.bot.send_message(chat_id=appointment.client_id, text=text)
             
         except Exception as e:
             logger.error(f"Failed to send custom reminder for appointment {appointment_id}: {e}")
@@ -0,0 +1,306 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+from config.settings import SESSION_TTL, SESSION_MAX_SIZE, SESSION_FLUSH_INTERVAL, SESSION_MISS_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    Состояние диалога пользователя
+    
+    Поля фиксированы (__slots__), доступ как к словарю сохранен: None значит
+    "ключа нет". Изменения отмечают сессию для записи в хранилище.
+    """
+    
+    FIELDS = (
+        'selected_specialization', 'selected_master', 'selected_service', 'selected_date',
+        'selected_master_for_login', 'waiting_for_master_password', 'current_master_id', 'current_master_name',
+        'schedule_date', 'schedule_start_time',
+    )
+    __slots__ = FIELDS + ('user_id', 'touched', 'saved', '_store')
+    
+    def __init__(self, user_id: int, data: dict = None, touched: float = None, store: 'SessionStore' = None):
+        self.user_id = user_id
+        self.touched = time.time() if touched is None else touched
+        self.saved = self.touched
+        self._store = store
+        for field in self.FIELDS:
+            setattr(self, field, None)
+        for key, value in (data or {}).items():
+            if key in self.FIELDS:  # поля, которых больше нет, пропускаются
+                setattr(self, key, value)
+    
+    def _check(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+    
+    def __getitem__(self, key: str):
+        self._check(key)
+        value = getattr(self, key)
+        if value is None:
+            raise KeyError(key)
+        return value
+    
+    def get(self, key: str, default=None):
+        self._check(key)
+        value = getattr(self, key)
+        return default if value is None else value
+    
+    def __setitem__(self, key: str, value):
+        self._check(key)
+        setattr(self, key, value)
+        if self._store is not None:
+            self._store.mark_dirty(self)
+    
+    def __delitem__(self, key: str):
+        self[key]  # KeyError, если значения нет
+        self[key] = None
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self.FIELDS and getattr(self, key) is not None
+    
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field) for field in self.FIELDS if getattr(self, field) is not None}
+
+
+class SQLiteSessionBackend:
+    """Хранение сессий в таблице sessions базы бота"""
+    
+    def __init__(self, pool):
+        self.pool = pool
+    
+    def load(self, user_id: int) -> Optional[Tuple[dict, float]]:
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT data, updated_at FROM sessions WHERE user_id = ?', (user_id,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+    
+    def save(self, sessions: Iterable[Session], deleted: Iterable[int], expired_before: float):
+        """Запись пачки изменений одной транзакцией"""
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany('INSERT OR REPLACE INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?)',
+                             [(session.user_id, json.dumps(session.to_dict()), session.touched)
+                              for session in sessions])
+            conn.executemany('DELETE FROM sessions WHERE user_id = ?', [(user_id,) for user_id in deleted])
+            conn.execute('DELETE FROM sessions WHERE updated_at < ?', (expired_before,))
+        for session in sessions:
+            session.saved = session.touched
+
+
+class SessionStore:
+    """
+    Ограниченное хранилище сессий пользователей (замена словаря user_data)
+    
+    Сессия живет ttl секунд с последнего обращения; в памяти держится не
+    больше max_size сессий, самые давние вытесняются (LRU). С backend
+    изменения пишутся в БД фоновым потоком раз в flush_interval секунд
+    (write-behind), а сессия, которой нет в памяти (перезапуск, вытеснение),
+    читается из БД при первом обращении. Промахи БД запоминаются на
+    miss_ttl секунд, чтобы сообщения пользователей без сессии не читали
+    таблицу на каждом обращении.
+    """
+    
+    def __init__(self, backend: Optional[SQLiteSessionBackend] = None, ttl: float = SESSION_TTL,
+                 max_size: int = SESSION_MAX_SIZE, flush_interval: float = SESSION_FLUSH_INTERVAL,
+                 miss_ttl: float = SESSION_MISS_TTL):
+        """
+        Args:
+            backend: Постоянное хранение (None - только память)
+            ttl: Время жизни сессии без обращений (сек)
+            max_size: Максимум сессий в памяти (и запомненных промахов)
+            flush_interval: Период записи изменений в backend (сек)
+            miss_ttl: Сколько помнить, что сессии нет в backend (сек)
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.miss_ttl = miss_ttl
+        
+        self._lock = threading.Lock()
+        self._sessions: OrderedDict = OrderedDict()  # user_id -> Session, от давних к свежим
+        self._dirty: Dict[int, Session] = {}
+        self._deleted: Set[int] = set()  # удалены, но еще не удалены из backend
+        self._absent: OrderedDict = OrderedDict()  # user_id -> время промаха backend, от давних к свежим
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+        self.counters = {'hits': 0, 'misses': 0, 'loaded': 0, 'expired': 0, 'evicted': 0, 'flushed': 0}
+    
+    def _lookup(self, user_id: int) -> Optional[Session]:
+        """Сессия из памяти или из backend, None если нет или истекла"""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None:
+                if now - session.touched <= self.ttl:
+                    session.touched = now
+                    self._sessions.move_to_end(user_id)
+                    # Сессия, которую только читают, тоже продлевается в backend, но не чаще 10 раз за ttl
+                    if self.backend and now - session.saved > self.ttl / 10:
+                        self._dirty[user_id] = session
+                    self.counters['hits'] += 1
+                    return session
+                self._drop(user_id)
+                self.counters['expired'] += 1
+                return None
+            if user_id in self._deleted or self._is_absent(user_id, now):
+                self.counters['misses'] += 1
+                return None
+            # Вытеснена до записи в backend: в очереди записи она свежее, чем в БД
+            session = self._dirty.get(user_id)
+            if session is not None:
+                session.touched = now
+                self._insert(session)
+                self.counters['hits'] += 1
+                return session
+        
+        stored = self.backend.load(user_id) if self.backend else None
+        with self._lock:
+            if stored is None or now - stored[1] > self.ttl:
+                if self.backend and user_id not in self._sessions:
+                    self._remember_absent(user_id, now)
+                self.counters['misses'] += 1
+                return None
+            # Пока читали БД, сессию мог создать тот же пользователь - она свежее
+            session = self._sessions.get(user_id)
+            if session is None:
+                session = Session(user_id, stored[0], now, self)
+                session.saved = stored[1]
+                self._insert(session)
+                self.counters['loaded'] += 1
+            return session
+    
+    def _is_absent(self, user_id: int, now: float) -> bool:
+        checked = self._absent.get(user_id)
+        if checked is None:
+            return False
+        if now - checked <= self.miss_ttl:
+            return True
+        del self._absent[user_id]
+        return False
+    
+    def _remember_absent(self, user_id: int, now: float):
+        self._absent[user_id] = now
+        self._absent.move_to_end(user_id)
+        while len(self._absent) > self.max_size:
+            self._absent.popitem(last=False)
+    
+    def _insert(self, session: Session):
+        self._sessions[session.user_id] = session
+        self._sessions.move_to_end(session.user_id)
+        self._deleted.discard(session.user_id)
+        self._absent.pop(session.user_id, None)
+        while len(self._sessions) > self.max_size:
+            # Вытесненная сессия остается в backend (или в очереди записи) и вернется при обращении
+            self._sessions.popitem(last=False)
+            self.counters['evicted'] += 1
+    
+    def _drop(self, user_id: int):
+        self._sessions.pop(user_id, None)
+        self._dirty.pop(user_id, None)
+        # Без backend удалять из хранилища нечего: набор только рос бы
+        if self.backend:
+            self._deleted.add(user_id)
+    
+    def mark_dirty(self, session: Session):
+        session.touched = time.time()
+        if self.backend:
+            with self._lock:
+                self._dirty[session.user_id] = session
+    
+    # Интерфейс словаря user_data
+    def __contains__(self, user_id: int) -> bool:
+        return self._lookup(user_id) is not None
+    
+    def __getitem__(self, user_id: int) -> Session:
+        session = self._lookup(user_id)
+        if session is None:
+            raise KeyError(user_id)
+        return session
+    
+    def get(self, user_id: int, default=None):
+        session = self._lookup(user_id)
+        return default if session is None else session
+    
+    def __setitem__(self, user_id: int, data):
+        session = Session(user_id, data.to_dict() if isinstance(data, Session) else data, store=self)
+        with self._lock:
+            self._insert(session)
+            if self.backend:
+                self._dirty[user_id] = session
+    
+    def __delitem__(self, user_id: int):
+        with self._lock:
+            self._drop(user_id)
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def purge_expired(self) -> int:
+        """Удаление истекших сессий из памяти: они идут первыми в порядке LRU"""
+        expired_before = time.time() - self.ttl
+        purged = 0
+        with self._lock:
+            while self._sessions:
+                user_id, session = next(iter(self._sessions.items()))
+                if session.touched >= expired_before:
+                    break
+                self._sessions.popitem(last=False)
+                self._dirty.pop(user_id, None)
+                purged += 1
+            self.counters['expired'] += purged
+        return purged
+    
+    def flush(self):
+        """Запись накопленных изменений в backend"""
+        self.purge_expired()
+        if not self.backend:
+            return
+        with self._lock:
+            dirty = list(self._dirty.values())
+            deleted = list(self._deleted)
+            self._dirty.clear()
+            self._deleted.clear()
+        try:
+            self.backend.save(dirty, deleted, time.time() - self.ttl)
+        except Exception as e:
+            logger.error(f"Ошибка записи сессий: {e}")
+            with self._lock:
+                for session in dirty:
+                    self._dirty.setdefault(session.user_id, session)
+                self._deleted.update(user_id for user_id in deleted if user_id not in self._sessions)
+            return
+        with self._lock:
+            self.counters['flushed'] += len(dirty)
+    
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+    
+    def start(self):
+        """Запуск фоновой записи изменений"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='session-flush', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Остановка с записью оставшихся изменений"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+            stats['size'] = len(self._sessions)
+            stats['dirty'] = len(self._dirty)
+            stats['absent'] = len(self._absent)
+        return stats
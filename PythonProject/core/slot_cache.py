@@ -0,0 +1,101 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Set, Tuple
+
+# Ключ кэша: (master_id, дата, длительность услуги в минутах)
+SlotKey = Tuple[int, str, int]
+
+
+class SlotCache:
+    """
+    LRU-кэш свободных слотов мастера на день
+    
+    Значение - кортеж начал свободных слотов в минутах без учета текущего
+    времени (прошедшие слоты отсекаются при чтении). Записи инвалидируются
+    точечно: по дню мастера при изменении записей и расписания на этот день
+    или целиком по мастеру при удалении его расписания или услуг.
+    """
+    
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[SlotKey, Tuple[int, ...]]" = OrderedDict()
+        # (master_id, дата) -> длительности, для которых есть записи в кэше
+        self._days: Dict[Tuple[int, str], Set[int]] = {}
+        self._lock = threading.Lock()
+        # Увеличивается при каждой инвалидации: результат, посчитанный
+        # до нее, не должен попасть в кэш
+        self._epoch = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get_or_compute(self, key: SlotKey, compute: Callable[[], Tuple[int, ...]]) -> Tuple[int, ...]:
+        """Слоты из кэша или посчитанные compute() (вне блокировки)"""
+        with self._lock:
+            slots = self._entries.get(key)
+            if slots is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return slots
+            self.misses += 1
+            epoch = self._epoch
+        
+        slots = tuple(compute())
+        
+        with self._lock:
+            if epoch == self._epoch:
+                self._store(key, slots)
+        return slots
+    
+    def _store(self, key: SlotKey, slots: Tuple[int, ...]):
+        self._entries[key] = slots
+        self._entries.move_to_end(key)
+        self._days.setdefault(key[:2], set()).add(key[2])
+        while len(self._entries) > self.maxsize:
+            (master_id, date, duration), _ = self._entries.popitem(last=False)
+            self._forget(master_id, date, duration)
+            self.evictions += 1
+    
+    def _forget(self, master_id: int, date: str, duration: int):
+        durations = self._days.get((master_id, date))
+        if durations is not None:
+            durations.discard(duration)
+            if not durations:
+                del self._days[(master_id, date)]
+    
+    def invalidate_day(self, master_id: int, date: str):
+        """Сброс всех длительностей для дня мастера"""
+        with self._lock:
+            self._epoch += 1
+            for duration in self._days.pop((master_id, date), ()):
+                del self._entries[(master_id, date, duration)]
+                self.invalidations += 1
+    
+    def invalidate_master(self, master_id: int):
+        """Сброс всех дней мастера"""
+        with self._lock:
+            self._epoch += 1
+            for day in [day for day in self._days if day[0] == master_id]:
+                for duration in self._days.pop(day):
+                    del self._entries[day + (duration,)]
+                    self.invalidations += 1
+    
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._days.clear()
+    
+    def stats(self) -> dict:
+        """Счетчики попаданий, промахов и вытеснений"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
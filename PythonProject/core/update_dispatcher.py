@@ -0,0 +1,117 @@
+import logging
+import queue
+import threading
+from typing import Callable, Hashable, List, Optional
+from core.updates import update_user_key
+from config.settings import UPDATE_SHARDS, UPDATE_SHARD_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class ShardedDispatcher:
+    """
+    Пул рабочих потоков с шардированием обновлений по пользователю
+    
+    Обновление попадает в очередь шарда hash(key(update)) % shards, и каждый
+    шард обрабатывается одним потоком. Обновления одного пользователя
+    выполняются строго по порядку и никогда параллельно друг другу, поэтому
+    состояние сессии (SalonBot.user_data) не гоняется между потоками, а разные
+    пользователи обрабатываются одновременно.
+    
+    Очереди ограничены: при переполнении submit() ждет (backpressure для
+    long polling - новые обновления не запрашиваются, пока есть место) или
+    сразу отказывает (block=False, для webhook - Telegram повторит доставку).
+    """
+    
+    def __init__(self, process: Callable[[List], None], shards: int = UPDATE_SHARDS,
+                 queue_size: int = UPDATE_SHARD_QUEUE_SIZE, key: Callable[[object], Hashable] = update_user_key,
+                 name: str = 'shard'):
+        """
+        Args:
+            process: Обработчик списка обновлений (исходный TeleBot.process_new_updates)
+            shards: Число шардов (рабочих потоков)
+            queue_size: Емкость очереди одного шарда
+            key: Ключ шардирования обновления
+            name: Префикс имен потоков
+        """
+        self.process = process
+        self.key = key
+        self.name = name
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(shards)]
+        self._threads: List[threading.Thread] = []
+        
+        self._lock = threading.Lock()
+        self.counters = {'submitted': 0, 'processed': 0, 'failed': 0, 'blocked': 0, 'rejected': 0}
+    
+    def _count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+    
+    def shard_of(self, update) -> int:
+        return hash(self.key(update)) % len(self._queues)
+    
+    def submit(self, update, block: bool = True, timeout: Optional[float] = None) -> bool:
+        """
+        Постановка обновления в очередь его шарда
+        
+        Returns:
+            False, если очередь переполнена и место не освободилось (block=False или timeout)
+        """
+        shard = self._queues[self.shard_of(update)]
+        try:
+            shard.put_nowait(update)
+        except queue.Full:
+            if not block:
+                self._count('rejected')
+                return False
+            self._count('blocked')
+            try:
+                shard.put(update, timeout=timeout)
+            except queue.Full:
+                self._count('rejected')
+                return False
+        self._count('submitted')
+        return True
+    
+    def submit_many(self, updates: List):
+        """Замена TeleBot.process_new_updates: раздача пачки обновлений по шардам"""
+        for update in updates:
+            self.submit(update)
+    
+    def install(self, bot):
+        """Перехват bot.process_new_updates: polling будет отдавать обновления в шарды"""
+        bot.process_new_updates = self.submit_many
+    
+    def _work(self, shard: queue.Queue):
+        while True:
+            update = shard.get()
+            if update is None:
+                return
+            try:
+                self.process([update])
+                self._count('processed')
+            except Exception as e:
+                self._count('failed')
+                logger.error(f"Ошибка обработки обновления: {e}", exc_info=True)
+    
+    def start(self):
+        for i, shard in enumerate(self._queues):
+            thread = threading.Thread(target=self._work, args=(shard,), name=f'{self.name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def stop(self, timeout: float = 10.0):
+        """Остановка после обработки уже поставленных обновлений"""
+        for shard in self._queues:
+            shard.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+    
+    def stats(self) -> dict:
+        """Счетчики и текущая длина очереди каждого шарда"""
+        with self._lock:
+            stats = dict(self.counters)
+        stats['queue_lengths'] = [shard.qsize() for shard in self._queues]
+        stats['queued'] = sum(stats['queue_lengths'])
+        return stats
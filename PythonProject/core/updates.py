@@ -0,0 +1,97 @@
+import logging
+import threading
+from typing import Callable, Hashable, List, Optional, Set
+from config.settings import UPDATE_DEDUP_WINDOW
+
+logger = logging.getLogger(__name__)
+
+
+def update_chat_key(update) -> Hashable:
+    """Ключ упорядочивания обновления: чат, а если его нет - пользователь или update_id"""
+    message = update.message or update.edited_message
+    if message is not None:
+        return message.chat.id
+    if update.callback_query is not None:
+        call = update.callback_query
+        return call.message.chat.id if call.message is not None else call.from_user.id
+    return update.update_id
+
+
+def update_user_key(update) -> Hashable:
+    """Ключ шардирования обновления: автор (from_user.id), иначе ключ чата"""
+    for event in (update.message, update.edited_message, update.callback_query, update.inline_query):
+        if event is not None and event.from_user is not None:
+            return event.from_user.id
+    return update_chat_key(update)
+
+
+
+def update_kind(update) -> str:
+    """Тип обновления для статистики"""
+    if update.message is not None or update.edited_message is not None:
+        return 'message'
+    if update.callback_query is not None:
+        return 'callback_query'
+    return 'other'
+
+
+class UpdateDeduplicator:
+    """
+    Отбрасывание повторно доставленных обновлений по update_id
+    
+    Помнит последние window идентификаторов: кольцевой буфер задает порядок
+    вытеснения, множество - проверку за O(1). Окно не очищается целиком, а
+    сдвигается на одно обновление, поэтому повтор отсекается, пока после
+    оригинала пришло меньше window других обновлений, при любой частоте.
+    Общий для сообщений и callback'ов; потокобезопасен (шарды вызывают его
+    одновременно).
+    """
+    
+    def __init__(self, window: int = UPDATE_DEDUP_WINDOW):
+        """
+        Args:
+            window: Число последних update_id, среди которых ищутся повторы
+        """
+        self.window = window
+        self._ring: List[Optional[int]] = [None] * window
+        self._position = 0
+        self._seen: Set[int] = set()
+        self._lock = threading.Lock()
+        
+        self.counters = {'message': 0, 'callback_query': 0, 'other': 0}
+        self.duplicates = {'message': 0, 'callback_query': 0, 'other': 0}
+    
+    def check(self, update) -> bool:
+        """Запоминает update_id; False, если обновление уже было в окне"""
+        kind = update_kind(update)
+        update_id = update.update_id
+        with self._lock:
+            self.counters[kind] += 1
+            if update_id in self._seen:
+                self.duplicates[kind] += 1
+                logger.warning(f"Повторное обновление {update_id} ({kind})")
+                return False
+            evicted = self._ring[self._position]
+            if evicted is not None:
+                self._seen.discard(evicted)
+            self._ring[self._position] = update_id
+            self._position = (self._position + 1) % self.window
+            self._seen.add(update_id)
+            return True
+    
+    def filter(self, process: Callable[[List], None]) -> Callable[[List], None]:
+        """Обертка process_new_updates, пропускающая только новые обновления"""
+        def process_new_updates(updates: List):
+            fresh = [update for update in updates if self.check(update)]
+            if fresh:
+                process(fresh)
+        return process_new_updates
+    
+    def stats(self) -> dict:
+        """Обновления и повторы по типам, доля повторов"""
+        with self._lock:
+            total = sum(self.counters.values())
+            duplicates = sum(self.duplicates.values())
+            return {'updates': dict(self.counters), 'duplicates': dict(self.duplicates),
+                    'duplicate_rate': round(duplicates / total, 4) if total else 0.0,
+                    'window': self.window, 'remembered': len(self._seen)}
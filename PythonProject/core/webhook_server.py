@@ -0,0 +1,186 @@
+import hmac
+import json
+import logging
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Hashable, List, Optional
+from core.update_dispatcher import ShardedDispatcher
+from core.updates import update_user_key
+from config.settings import (WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+                             WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS, WEBHOOK_MAX_CONNECTIONS)
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает secret_token из setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Обновления Telegram намного меньше; тело больше этого не читается
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class _WebhookHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Очередь соединений при всплесках доставки
+
+
+class _WebhookRequestHandler(BaseHTTPRequestHandler):
+    """HTTP-обработчик: проверка секрета, постановка в очередь и немедленный ответ"""
+    
+    server_version = 'SalonBotWebhook'
+    
+    def do_POST(self):
+        webhook = self.server.webhook
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY_SIZE:
+            self.close_connection = True
+            self._reply(413)
+            return
+        # Тело читается всегда: закрытие сокета с непрочитанными данными обрывает ответ
+        body = self.rfile.read(length)
+        
+        if self.path != webhook.path:
+            self._reply(404)
+            return
+        if not webhook.check_secret(self.headers.get(SECRET_HEADER)):
+            webhook.count('unauthorized')
+            self._reply(401)
+            return
+        
+        try:
+            update = webhook.decode(json.loads(body))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            webhook.count('bad_request')
+            logger.warning(f"Некорректное обновление: {e}")
+            self._reply(400)
+            return
+        
+        # 503 при переполнении: Telegram повторит доставку позже
+        self._reply(200 if webhook.enqueue(update) else 503)
+    
+    def do_GET(self):
+        webhook = self.server.webhook
+        if self.path != webhook.path + '/stats':
+            self._reply(404)
+            return
+        body = json.dumps(webhook.stats()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class WebhookServer:
+    """
+    Прием обновлений Telegram через webhook
+    
+    HTTP-сервер только проверяет секрет и кладет обновление в ограниченную
+    очередь, отвечая сразу. Обработку выполняет ShardedDispatcher: обновления
+    одного пользователя идут по порядку, разных - параллельно.
+    """
+    
+    def __init__(self, process: Callable[[List], None], host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                 path: str = WEBHOOK_PATH, secret: Optional[str] = WEBHOOK_SECRET,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE, workers: int = WEBHOOK_WORKERS,
+                 decode: Callable = None, key: Callable[[object], Hashable] = update_user_key):
+        """
+        Args:
+            process: Обработчик списка обновлений (TeleBot.process_new_updates)
+            host, port, path: Адрес, на котором принимаются POST-запросы
+            secret: Ожидаемый secret_token (None - не проверять)
+            queue_size: Общая емкость очередей, делится между потоками
+            workers: Число рабочих потоков
+            decode: Преобразование JSON в обновление (по умолчанию telebot Update.de_json)
+            key: Ключ шардирования обновления
+        """
+        if decode is None:
+            from telebot.types import Update
+            decode = Update.de_json
+        self.path = path
+        self.secret = secret
+        self.decode = decode
+        
+        self.dispatcher = ShardedDispatcher(process, shards=workers, queue_size=max(1, queue_size // workers),
+                                            key=key, name='webhook')
+        self._httpd = _WebhookHTTPServer((host, port), _WebhookRequestHandler)
+        self._httpd.webhook = self
+        self._http_thread: Optional[threading.Thread] = None
+        
+        self._lock = threading.Lock()
+        self.counters = {'unauthorized': 0, 'bad_request': 0}
+    
+    @property
+    def address(self):
+        """Фактический (host, port), полезно при port=0"""
+        return self._httpd.server_address[:2]
+    
+    def check_secret(self, token: Optional[str]) -> bool:
+        if not self.secret:
+            return True
+        return token is not None and hmac.compare_digest(token, self.secret)
+    
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+    
+    def enqueue(self, update) -> bool:
+        """Постановка обновления в очередь без ожидания, False при переполнении"""
+        return self.dispatcher.submit(update, block=False)
+    
+    def start(self):
+        """Запуск рабочих потоков и HTTP-сервера в фоне"""
+        self.dispatcher.start()
+        self._http_thread = threading.Thread(target=self._httpd.serve_forever, name='webhook-http', daemon=True)
+        self._http_thread.start()
+        logger.info(f"🌐 Webhook принимает обновления на http://{self.address[0]}:{self.address[1]}{self.path}")
+    
+    def stop(self, timeout: float = 10.0):
+        """Остановка приема и обработка уже принятых обновлений"""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self.dispatcher.stop(timeout)
+    
+    def stats(self) -> dict:
+        stats = self.dispatcher.stats()
+        with self._lock:
+            stats.update(self.counters)
+        return stats
+
+
+def run_webhook(salon_bot):
+    """Запуск бота в режиме webhook (BOT_RUNTIME=webhook) до Ctrl+C"""
+    # Если webhook регистрируем сами, секрет можно сгенерировать на каждый запуск
+    secret = WEBHOOK_SECRET or (secrets.token_urlsafe(32) if WEBHOOK_URL else None)
+    if not secret:
+        logger.warning("WEBHOOK_SECRET не задан: запросы принимаются без проверки секрета")
+    
+    server = WebhookServer(salon_bot.bot.process_new_updates, secret=secret)
+    server.start()
+    
+    if WEBHOOK_URL:
+        url = WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH
+        salon_bot.bot.set_webhook(url=url, secret_token=secret, max_connections=WEBHOOK_MAX_CONNECTIONS)
+        logger.info(f"Webhook зарегистрирован: {url}")
+    else:
+        logger.warning("WEBHOOK_URL не задан: webhook должен быть зарегистрирован вручную")
+    
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        logger.info("🛑 Bot stopped by user")
+    finally:
+        server.stop()
+        logger.info(f"Статистика webhook: {server.stats()}")
+        salon_bot.shutdown()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Проверка планов запросов: горячие запросы Database должны использовать индексы
+
+Запуск: python debug/debug_query_plan.py
+"""
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.admin_utils import AdminUtils
+
+# (объект, метод, аргументы, ожидаемый индекс)
+CHECKS = [
+    ('db', 'get_appointments_by_date', ('2030-01-01',), 'idx_appointments_date_status_time'),
+    ('db', 'get_upcoming_appointments', (60,), 'idx_appointments_active_start'),
+    ('db', 'get_overlapping_appointments', (1, 1893492000, 1893495600), 'idx_appointments_active_master_span'),
+    ('db', 'get_master_busy_intervals', (1, '2030-01-01'), 'idx_appointments_active_master_span'),
+    ('db', 'get_master_appointments', (1,), 'idx_appointments_active_master_day'),
+    ('db', 'get_client_appointments', (1,), 'idx_appointments_active_client_day'),
+    ('db', 'get_client_appointments_page', (1, ('2030-01-01', '10:00', 5)), 'idx_appointments_active_client_day'),
+    ('db', 'get_master_appointments_page', (1, ('2030-01-01', '10:00', 5)), 'idx_appointments_active_master_day'),
+    ('db', 'get_available_schedule', (1, '2030-01-01'), 'idx_schedule_master_date'),
+    ('db', 'get_master_schedule', (1,), 'idx_schedule_master_date'),
+    ('db', 'get_master_schedule_page', (1, ('2030-01-01', '10:00', 5)), 'idx_schedule_master_date'),
+    ('db', 'get_services_by_master', (1,), 'idx_services_master'),
+    ('db', 'get_masters_by_specialization', ('Парикмахер',), 'idx_masters_specialization'),
+    ('db', 'claim_outbox', ('2030-01-01 10:00:00', '2030-01-01 09:55:00', 50), 'idx_outbox_status_due'),
+    ('db', 'get_pending_reminders', (), 'idx_outbox_status_due'),
+    ('db', 'get_unscheduled_custom_reminders', ('2030-01-01 10:00:00', 'reminder_'), 'idx_appointments_custom_reminder'),
+    ('admin', 'get_recent_appointments', (), 'idx_appointments_created_at'),
+    ('admin', 'get_users_page', (('2030-01-01 10:00:00', 5),), 'idx_users_created_at'),
+]
+
+def collect_statements(db, func, args):
+    """Выполнение метода с перехватом SQL (с подставленными параметрами)"""
+    statements = []
+    # Вызовы идут последовательно из одного потока, поэтому пул отдает одно и то же соединение
+    conn = db.pool.acquire()
+    db.pool.release(conn)
+    conn.set_trace_callback(statements.append)
+    try:
+        func(*args)
+    finally:
+        conn.set_trace_callback(None)
+    return [s for s in statements if s.lstrip().upper().startswith('SELECT')]
+
+def check_query_plans():
+    # Проверяем на пустой временной базе, рабочую базу не трогаем
+    os.chdir(tempfile.mkdtemp())
+    os.makedirs("data", exist_ok=True)
+    
+    admin = AdminUtils()
+    targets = {'db': admin.db, 'admin': admin}
+    
+    failed = 0
+    for target, method, args, index in CHECKS:
+        statements = collect_statements(admin.db, getattr(targets[target], method), args)
+        plan_lines = []
+        with admin.db.get_connection() as conn:
+            for sql in statements:
+                plan_lines += [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        
+        # Нужный индекс использован и нет ни одного полного сканирования таблицы
+        full_scans = [line for line in plan_lines if line.startswith("SCAN") and "INDEX" not in line]
+        ok = any(index in line for line in plan_lines) and not full_scans
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {method}: {'; '.join(plan_lines) or 'нет плана'}")
+    
+    print(f"\nПроверено запросов: {len(CHECKS)}, без индекса: {failed}")
+    return failed == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if check_query_plans() else 1)
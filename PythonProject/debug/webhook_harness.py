@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка webhook: отправка синтетических обновлений POST-запросами
+
+Без аргументов поднимает локальный WebhookServer с обработчиком-заглушкой
+и проверяет прием, отказ без секрета и порядок обновлений внутри чата.
+С --url отправляет обновления на уже запущенный бот (BOT_RUNTIME=webhook).
+
+Запуск:
+    python debug/webhook_harness.py
+    python debug/webhook_harness.py --url http://127.0.0.1:9999/webhook --secret SECRET
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.webhook_server import WebhookServer, SECRET_HEADER
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    """Синтетическое обновление с текстовым сообщением"""
+    user = {'id': chat_id, 'is_bot': False, 'first_name': f'Test {chat_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': user,
+            'text': '📋 Мои записи',
+        },
+    }
+
+
+def post(url: str, payload: dict, secret: str = None) -> int:
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+    if secret:
+        request.add_header(SECRET_HEADER, secret)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def send_all(url: str, secret: str, count: int, chats: int, concurrency: int):
+    """Отправка count обновлений по chats чатам; внутри чата - последовательно"""
+    by_chat = {}
+    for update_id in range(1, count + 1):
+        by_chat.setdefault(update_id % chats, []).append(make_update(update_id, 1000 + update_id % chats))
+    
+    statuses = {}
+    lock = threading.Lock()
+    
+    def send_chat(updates):
+        for update in updates:
+            status = post(url, update, secret)
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send_chat, by_chat.values()))
+    elapsed = time.perf_counter() - started
+    print(f"Отправлено {count} обновлений за {elapsed:.2f} с ({count / elapsed:.0f}/с), ответы: {statuses}")
+    return statuses
+
+
+def run_local(count: int, chats: int, concurrency: int) -> bool:
+    secret = 'harness-secret'
+    seen = {}
+    seen_lock = threading.Lock()
+    
+    def process(updates):
+        time.sleep(0.002)  # имитация работы обработчика
+        for update in updates:
+            with seen_lock:
+                seen.setdefault(update['message']['chat']['id'], []).append(update['update_id'])
+    
+    server = WebhookServer(
+        process, host='127.0.0.1', port=0, path='/webhook', secret=secret, queue_size=count, workers=4,
+        decode=lambda data: data, key=lambda update: update['message']['chat']['id']
+    )
+    server.start()
+    host, port = server.address
+    url = f"http://{host}:{port}/webhook"
+    
+    ok = True
+    status = post(url, make_update(0, 1), secret='wrong')
+    print(f"Неверный секрет: {status}")
+    ok &= status == 401
+    
+    statuses = send_all(url, secret, count, chats, concurrency)
+    ok &= statuses == {200: count}
+    server.stop()
+    
+    ordered = all(ids == sorted(ids) for ids in seen.values())
+    processed = sum(len(ids) for ids in seen.values())
+    print(f"Обработано: {processed}, порядок внутри чатов сохранен: {ordered}")
+    print(f"Статистика сервера: {server.stats()}")
+    return ok and ordered and processed == count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='адрес webhook запущенного бота')
+    parser.add_argument('--secret', default=os.getenv('WEBHOOK_SECRET'))
+    parser.add_argument('--count', type=int, default=500)
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+    
+    if args.url:
+        send_all(args.url, args.secret, args.count, args.chats, args.concurrency)
+        return
+    sys.exit(0 if run_local(args.count, args.chats, args.concurrency) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
     from core.bot import SalonBot
-    from config.settings import BOT_TOKEN
+    from config.settings import BOT_TOKEN, BOT_RUNTIME
 except ImportError as e:
     print(f"❌ Ошибка импорта: {e}")
     print("Убедитесь, что все модули установлены: pip install -r requirements.txt")
@@ -52,8 +52,15 @@ def main():
         logger.info("🚀 Запуск Salon Bot...")
         
         # Создаем и запускаем бота
-        bot = SalonBot()
-        bot.run()
+        if BOT_RUNTIME == 'asyncio':
+            from core.async_runtime import AsyncBotRuntime
+            AsyncBotRuntime(SalonBot()).run()
+        elif BOT_RUNTIME == 'webhook':
+            from core.webhook_server import run_webhook
+            run_webhook(SalonBot())
+        else:
+            bot = SalonBot()
+            bot.run()
         
     except KeyboardInterrupt:
         logger.info("🛑 Бот остановлен пользователем")
@@ -1,29 +1,41 @@
 #!/usr/bin/env python3
 """
 Скрипт для обновления структуры базы данных
+
+Применяет недостающие миграции из core/migrations.py
 """
 
-import sqlite3
+import sys
+import os
+
+# Добавляем корневую директорию проекта в путь
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def update_database():
+from core.connection_pool import ConnectionPool
+from core.database import apply_pragmas
+from core.migrations import MigrationRunner
+
+def update_database(db_path: str = 'data/salon_bot.db'):
     """Обновление структуры базы данных"""
     
-    conn = sqlite3.connect('data/salon_bot.db')
-    cursor = conn.cursor()
+    pool = ConnectionPool(db_path, pool_size=1, on_connect=apply_pragmas)
+    runner = MigrationRunner(pool)
     
     try:
-        # Добавляем колонку password если её нет
-        cursor.execute('ALTER TABLE masters ADD COLUMN password TEXT DEFAULT "master123"')
-        print("✅ Колонка password добавлена в таблицу masters")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("✅ Колонка password уже существует")
-        else:
-            print(f"❌ Ошибка: {e}")
-    
-    conn.commit()
-    conn.close()
-    print("✅ База данных обновлена!")
+        version, pending = runner.get_state()
+        print(f"Текущая версия схемы: {version} (последняя: {runner.latest_version})")
+        
+        if runner.is_up_to_date():
+            print("✅ База данных уже актуальна")
+            return
+        
+        if pending:
+            print(f"⏳ Незавершенных заполнений данных: {pending}")
+        
+        version = runner.run()
+        print(f"✅ База данных обновлена до версии {version}!")
+    finally:
+        pool.close()
 
 if __name__ == "__main__":
-    update_database()
+    update_database(*sys.argv[1:2])
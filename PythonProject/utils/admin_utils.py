@@ -4,6 +4,7 @@
 """
 
 from core.database import Database
+from core.records import Page
 from datetime import datetime, timedelta
 import logging
 import os
@@ -34,8 +35,11 @@ class AdminUtils:
             completed_appointments = cursor.fetchone()[0]
             
             # Статистика за сегодня
+            # Диапазон по created_at вместо DATE(created_at), чтобы работал индекс
             today = datetime.now().strftime("%Y-%m-%d")
-            cursor.execute('SELECT COUNT(*) FROM appointments WHERE DATE(created_at) = ?', (today,))
+            tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+            cursor.execute('SELECT COUNT(*) FROM appointments WHERE created_at >= ? AND created_at < ?',
+                           (today, tomorrow))
             appointments_today = cursor.fetchone()[0]
             
             # Популярные услуги
@@ -78,16 +82,42 @@ class AdminUtils:
         
         print("="*50)
     
-    def get_users_list(self):
-        """Получение списка пользователей"""
+    def count_users(self):
+        """Число пользователей"""
         with self.db.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT user_id, username, first_name, is_master, created_at
-                FROM users
-                ORDER BY created_at DESC
-            ''')
-            return cursor.fetchall()
+            cursor.execute('SELECT COUNT(*) FROM users')
+            return cursor.fetchone()[0]
+    
+    def get_users_page(self, before=None, limit: int = 10) -> Page:
+        """
+        Страница пользователей, новые первыми (keyset по (created_at, user_id))
+        
+        Args:
+            before: Курсор (created_at, user_id) последней строки предыдущей страницы
+            limit: Строк на странице
+        """
+        with self.db.get_connection() as conn:
+            cursor = conn.cursor()
+            if before is None:
+                cursor.execute('''
+                    SELECT user_id, username, first_name, is_master, created_at
+                    FROM users
+                    ORDER BY created_at DESC, user_id DESC
+                    LIMIT ?
+                ''', (limit + 1,))
+            else:
+                cursor.execute('''
+                    SELECT user_id, username, first_name, is_master, created_at
+                    FROM users
+                    WHERE created_at <= :created_at AND (created_at < :created_at OR user_id < :user_id)
+                    ORDER BY created_at DESC, user_id DESC
+                    LIMIT :limit
+                ''', {'created_at': before[0], 'user_id': before[1], 'limit': limit + 1})
+            rows = cursor.fetchall()
+        if len(rows) <= limit:
+            return Page(rows, None)
+        return Page(rows[:limit], (rows[limit - 1][4], rows[limit - 1][0]))
     
     def get_masters_list(self):
         """Получение списка мастеров"""
@@ -114,7 +144,7 @@ class AdminUtils:
                 JOIN users u ON a.client_id = u.user_id
                 JOIN masters m ON a.master_id = m.id
                 JOIN services s ON a.service_id = s.id
-                WHERE DATE(a.created_at) >= ?
+                WHERE a.created_at >= ?
                 ORDER BY a.created_at DESC
             ''', (cutoff_date,))
             return cursor.fetchall()
@@ -127,7 +157,7 @@ class AdminUtils:
             cursor = conn.cursor()
             cursor.execute('''
                 DELETE FROM appointments 
-                WHERE status = 'cancelled' AND DATE(created_at) < ?
+                WHERE status = 'cancelled' AND created_at < ?
             ''', (cutoff_date,))
             
             deleted_count = cursor.rowcount
@@ -141,11 +171,17 @@ class AdminUtils:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_path = f"data/backup_salon_bot_{timestamp}.db"
         
-        import shutil
+        import sqlite3
         try:
             # Создаем папку data если её нет
             os.makedirs("data", exist_ok=True)
-            shutil.copy2(self.db.db_path, backup_path)
+            # В режиме WAL часть данных лежит в -wal файле, поэтому копируем через backup API
+            with self.db.get_connection() as conn:
+                backup_conn = sqlite3.connect(backup_path)
+                try:
+                    conn.backup(backup_conn)
+                finally:
+                    backup_conn.close()
             print(f"✅ Резервная копия создана: {backup_path}")
         except Exception as e:
             print(f"❌ Ошибка создания резервной копии: {e}")
@@ -191,11 +227,17 @@ def main():
             admin.print_statistics()
         
         elif choice == "2":
-            users = admin.get_users_list()
-            print(f"\n👥 Пользователи ({len(users)}):")
-            for user in users[:10]:  # Показываем первые 10
-                status = "👨‍💼 Мастер" if user[3] else "👤 Клиент"
-                print(f"ID: {user[0]} | @{user[1] or 'N/A'} | {user[2]} | {status}")
+            print(f"\n👥 Пользователи ({admin.count_users()}):")
+            page = admin.get_users_page()
+            while True:
+                for user in page.items:
+                    status = "👨‍💼 Мастер" if user[3] else "👤 Клиент"
+                    print(f"ID: {user[0]} | @{user[1] or 'N/A'} | {user[2]} | {status}")
+                if page.next_cursor is None:
+                    break
+                if input("Enter - следующая страница, 0 - назад: ").strip() == "0":
+                    break
+                page = admin.get_users_page(page.next_cursor)
         
         elif choice == "3":
             masters = admin.get_masters_list()
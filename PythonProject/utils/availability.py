@@ -0,0 +1,177 @@
+import logging
+from bisect import bisect_right
+from datetime import datetime
+from typing import Iterable, List, Sequence, Tuple
+from core.records import AppointmentDetails, BusyInterval, ClientAppointment, ScheduleEntry
+
+logger = logging.getLogger(__name__)
+
+MINUTES_IN_DAY = 24 * 60
+
+# Длительность записи, если услуга не найдена
+DEFAULT_DURATION = 60
+
+# Шаг сетки слотов для клиентов
+SLOT_STEP = 60
+
+
+def to_minutes(time_str: str) -> int:
+    """Перевод "HH:MM" в минуты от полуночи"""
+    hours, minutes = time_str.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minutes(minutes: int) -> str:
+    """Перевод минут от полуночи в строку HH:MM"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def minutes_not_before(date_str: str, now: datetime = None) -> int:
+    """
+    Первая минута дня, которая еще не в прошлом
+    
+    Returns:
+        0 для будущих дат, MINUTES_IN_DAY + 1 для прошедших
+    """
+    now = now or datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    if date_str > today:
+        return 0
+    if date_str < today:
+        return MINUTES_IN_DAY + 1
+    # Слот в текущую минуту уже в прошлом, если минута началась не ровно сейчас
+    return now.hour * 60 + now.minute + (1 if now.second or now.microsecond else 0)
+
+
+def _merge(intervals: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Слияние пересекающихся и соприкасающихся полуинтервалов [start, end)"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class DayAvailability:
+    """
+    Занятость мастера на один день в целых минутах
+    
+    Рабочие окна и записи переводятся в отсортированные интервалы один раз,
+    после чего свободные слоты находятся одним проходом слиянием.
+    Слот [t, t + duration) свободен, если не пересекается ни с одной записью
+    (строгое пересечение: запись, заканчивающаяся в t, не мешает).
+    """
+    
+    __slots__ = ('windows', 'busy', '_busy_starts')
+    
+    def __init__(self, windows: Iterable[Tuple[int, int]], busy: Iterable[Tuple[int, int]]):
+        """
+        Args:
+            windows: Рабочие окна (начало, конец) в минутах
+            busy: Записи (начало в минутах, длительность в минутах)
+        """
+        self.windows = sorted(windows)
+        self.busy = _merge((start, start + duration) for start, duration in busy if duration > 0)
+        self._busy_starts = [start for start, _ in self.busy]
+    
+    @classmethod
+    def from_rows(cls, schedule: Sequence[Tuple] = (), appointments: Sequence = ()) -> "DayAvailability":
+        """
+        Построение из строк БД
+        
+        Args:
+            schedule: ScheduleEntry или строки таблицы schedule (start_time в [3], end_time в [4])
+            appointments: BusyInterval, записи из core.records или строки (время в [5], длительность в [11])
+        """
+        windows = [
+            (row.start_minutes, row.end_minutes) if isinstance(row, ScheduleEntry)
+            else (to_minutes(row[3]), to_minutes(row[4]))
+            for row in schedule
+        ]
+        busy = []
+        for appointment in appointments:
+            if isinstance(appointment, BusyInterval):
+                busy.append((appointment.start, appointment.duration))
+            elif isinstance(appointment, (AppointmentDetails, ClientAppointment)):
+                # Время уже переведено в минуты при чтении из БД
+                duration = appointment.duration
+                busy.append((appointment.start_minutes, duration if duration is not None else DEFAULT_DURATION))
+            elif len(appointment) > 5:
+                # Длительность услуги из appointment[11], если она есть в строке
+                duration = appointment[11] if len(appointment) > 11 else DEFAULT_DURATION
+                try:
+                    start = to_minutes(appointment[5])
+                except (ValueError, IndexError) as e:
+                    # Запись с испорченным временем пропускается, как раньше в is_slot_available
+                    logger.error(f"Ошибка при обработке записи {appointment}: {e}")
+                    continue
+                busy.append((start, duration if duration is not None else DEFAULT_DURATION))
+        return cls(windows, busy)
+    
+    def on_grid(self, start: int, step: int = SLOT_STEP) -> bool:
+        """Входит ли start в сетку слотов какого-либо рабочего окна (см. free_slots)"""
+        return any(
+            window_start <= start <= window_end - step and (start - window_start) % step == 0
+            for window_start, window_end in self.windows
+        )
+    
+    def is_free(self, start: int, duration: int) -> bool:
+        """Проверка одного интервала [start, start + duration)"""
+        i = bisect_right(self._busy_starts, start) - 1
+        if i >= 0 and self.busy[i][1] > start:
+            return False
+        return i + 1 >= len(self.busy) or self.busy[i + 1][0] >= start + duration
+    
+    def free_slots(self, duration: int, step: int = SLOT_STEP, not_before: int = 0) -> List[int]:
+        """
+        Свободные слоты для услуги длительностью duration
+        
+        Кандидаты строятся по сетке рабочих окон с шагом step так же, как
+        TimeUtils.generate_time_slots: слот t входит в окно, если t + step <= конец окна.
+        
+        Args:
+            duration: Продолжительность услуги в минутах
+            step: Шаг сетки слотов в минутах
+            not_before: Минимальное время начала (минуты), отсекает прошедшие слоты
+        
+        Returns:
+            Отсортированный список начал свободных слотов в минутах
+        """
+        candidates = set()
+        for window_start, window_end in self.windows:
+            candidates.update(range(window_start, window_end - step + 1, step))
+        
+        free = []
+        busy = self.busy
+        i = 0
+        for start in sorted(candidates):
+            if start < not_before:
+                continue
+            # Записи, закончившиеся до начала слота, больше не понадобятся
+            while i < len(busy) and busy[i][1] <= start:
+                i += 1
+            if i == len(busy) or busy[i][0] >= start + duration:
+                free.append(start)
+        return free
+    
+    def free_gaps(self) -> List[Tuple[int, int]]:
+        """Свободные промежутки (начало, конец) внутри рабочих окон"""
+        gaps = []
+        busy = self.busy
+        i = 0
+        for window_start, window_end in _merge(self.windows):
+            cursor = window_start
+            while i < len(busy) and busy[i][1] <= window_start:
+                i += 1
+            j = i
+            while j < len(busy) and busy[j][0] < window_end:
+                if busy[j][0] > cursor:
+                    gaps.append((cursor, busy[j][0]))
+                cursor = max(cursor, busy[j][1])
+                j += 1
+            if cursor < window_end:
+                gaps.append((cursor, window_end))
+        return gaps
@@ -0,0 +1,121 @@
+"""
+Быстрые операции с датами и временем
+
+Время - минуты от полуночи (int), дата - порядковый номер дня
+(date.toordinal()). Сетки слотов и форматирование дат вычисляются один
+раз и берутся из lru_cache, поэтому в циклах по слотам и строкам
+расписания нет strptime/strftime.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Optional, Tuple
+from utils.availability import format_minutes
+
+MONTHS_GENITIVE = (
+    "января", "февраля", "марта", "апреля", "мая", "июня",
+    "июля", "августа", "сентября", "октября", "ноября", "декабря",
+)
+
+WEEKDAYS = ("понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье")
+
+
+def parse_time(time_str: str) -> Optional[int]:
+    """Минуты от полуночи для "H:MM"/"HH:MM", None для неверной строки"""
+    hours, sep, minutes = time_str.partition(':')
+    if not sep or not (1 <= len(hours) <= 2 and 1 <= len(minutes) <= 2) \
+            or not (hours.isdigit() and minutes.isdigit() and hours.isascii() and minutes.isascii()):
+        return None
+    hours, minutes = int(hours), int(minutes)
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+@lru_cache(maxsize=4096)
+def parse_date(date_str: str) -> Optional[int]:
+    """Порядковый номер дня для "YYYY-MM-DD", None для неверной строки"""
+    try:
+        return datetime.strptime(date_str, "%Y-%m-%d").toordinal()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=4096)
+def ordinal_to_str(ordinal: int) -> str:
+    """Строка "YYYY-MM-DD" для порядкового номера дня"""
+    return date.fromordinal(ordinal).isoformat()
+
+
+_UNIX_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def local_epoch(ordinal: int, minute: int = 0) -> int:
+    """Секунды от 1970-01-01 для местного времени без учета пояса (как strftime('%s') в SQLite)"""
+    return (ordinal - _UNIX_EPOCH) * 86400 + minute * 60
+
+
+def now_epoch() -> int:
+    """Текущее местное время в шкале local_epoch"""
+    now = datetime.now()
+    return local_epoch(now.toordinal()) + now.hour * 3600 + now.minute * 60 + now.second
+
+
+def today() -> int:
+    return date.today().toordinal()
+
+
+@lru_cache(maxsize=256)
+def slot_grid(start: int, end: int, step: int) -> Tuple[int, ...]:
+    """Начала слотов длиной step, целиком помещающихся в [start, end]"""
+    return tuple(range(start, end - step + 1, step))
+
+
+@lru_cache(maxsize=256)
+def slot_labels(start: int, end: int, step: int) -> Tuple[str, ...]:
+    """Сетка slot_grid в виде строк HH:MM"""
+    return tuple(format_minutes(minute) for minute in slot_grid(start, end, step))
+
+
+@lru_cache(maxsize=1024)
+def format_date_russian(date_str: str) -> str:
+    """Дата вида "15 марта (пятница)"; неверная строка возвращается как есть"""
+    ordinal = parse_date(date_str)
+    if ordinal is None:
+        return date_str
+    day = date.fromordinal(ordinal)
+    return f"{day.day} {MONTHS_GENITIVE[day.month - 1]} ({WEEKDAYS[day.weekday()]})"
+
+
+@lru_cache(maxsize=1024)
+def format_date_short(date_str: str) -> str:
+    """Дата вида "15.03.2025"; неверная строка возвращается как есть"""
+    ordinal = parse_date(date_str)
+    if ordinal is None:
+        return date_str
+    day = date.fromordinal(ordinal)
+    return f"{day.day:02d}.{day.month:02d}.{day.year}"
+
+
+@lru_cache(maxsize=16)
+def next_days(first: int, count: int, skip_weekends: bool) -> Tuple[Tuple[str, str], ...]:
+    """count дней начиная с first: пары ("YYYY-MM-DD", русская дата)"""
+    days = []
+    ordinal = first
+    while len(days) < count:
+        # date.fromordinal(1) - понедельник, поэтому (ordinal - 1) % 7 - день недели
+        if not (skip_weekends and (ordinal - 1) % 7 >= 5):
+            day_str = ordinal_to_str(ordinal)
+            days.append((day_str, format_date_russian(day_str)))
+        ordinal += 1
+    return tuple(days)
+
+
+def is_past(date_str: str, time_str: str) -> bool:
+    """Момент date_str time_str уже прошел; False для неверных строк"""
+    ordinal, minute = parse_date(date_str), parse_time(time_str)
+    if ordinal is None or minute is None:
+        return False
+    now = datetime.now()
+    # Как сравнение datetime: минута, которая уже началась, в прошлом
+    elapsed = now.hour * 3600 + now.minute * 60 + now.second + (1 if now.microsecond else 0)
+    return (ordinal, minute * 60) < (now.toordinal(), elapsed)
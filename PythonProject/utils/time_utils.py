@@ -1,11 +1,18 @@
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta
 from typing import List, Tuple
 import logging
+from utils.availability import DayAvailability, to_minutes
+from utils import fast_time
 
 logger = logging.getLogger(__name__)
 
 class TimeUtils:
-    """Утилиты для работы с временем и расписанием"""
+    """
+    Утилиты для работы с временем и расписанием
+    
+    Строковый интерфейс поверх utils.fast_time: сетки слотов и форматирование
+    дат берутся из кэша, без strptime на каждый вызов.
+    """
     
     @staticmethod
     def generate_time_slots(start_time: str, end_time: str, duration: int = 60) -> List[str]:
@@ -20,16 +27,7 @@ class TimeUtils:
         Returns:
             Список временных слотов
         """
-        slots = []
-        start = datetime.strptime(start_time, "%H:%M")
-        end = datetime.strptime(end_time, "%H:%M")
-        
-        current = start
-        while current + timedelta(minutes=duration) <= end:
-            slots.append(current.strftime("%H:%M"))
-            current += timedelta(minutes=duration)
-        
-        return slots
+        return list(fast_time.slot_labels(to_minutes(start_time), to_minutes(end_time), duration))
     
     @staticmethod
     def is_slot_available(slot_time: str, existing_appointments: List[Tuple], service_duration: int = 60) -> bool:
@@ -44,36 +42,9 @@ class TimeUtils:
         Returns:
             True если слот доступен
         """
-        slot_start = datetime.strptime(slot_time, "%H:%M").time()
-        slot_end = (datetime.combine(datetime.today(), slot_start) + 
-                   timedelta(minutes=service_duration)).time()
-        
-        logger.info(f"Проверка слота {slot_time} (продолжительность {service_duration} мин)")
-        logger.info(f"Слот: {slot_start} - {slot_end}")
-        
-        for appointment in existing_appointments:
-            if len(appointment) > 5:  # Проверяем что у нас есть время записи
-                try:
-                    app_time = datetime.strptime(appointment[5], "%H:%M").time()  # appointment_time
-                    # Используем реальную продолжительность услуги из appointment[11] если доступна
-                    app_duration = appointment[11] if len(appointment) > 11 else 60
-                    app_end = (datetime.combine(datetime.today(), app_time) + 
-                              timedelta(minutes=app_duration)).time()
-                    
-                    logger.info(f"Существующая запись: {app_time} - {app_end} (продолжительность {app_duration} мин)")
-                    
-                    # Проверка пересечения
-                    if (slot_start < app_end and slot_end > app_time):
-                        logger.info(f"❌ Слот {slot_time} пересекается с записью {app_time}")
-                        return False
-                    else:
-                        logger.info(f"✅ Слот {slot_time} не пересекается с записью {app_time}")
-                except (ValueError, IndexError) as e:
-                    logger.error(f"Ошибка при обработке записи {appointment}: {e}")
-                    continue
-        
-        logger.info(f"✅ Слот {slot_time} доступен")
-        return True
+        # Проверка одним проходом по отсортированным интервалам в минутах
+        availability = DayAvailability.from_rows(appointments=existing_appointments)
+        return availability.is_free(to_minutes(slot_time), service_duration)
     
     @staticmethod
     def format_date_russian(date_str: str) -> str:
@@ -86,27 +57,7 @@ class TimeUtils:
         Returns:
             Отформатированная дата
         """
-        try:
-            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-            
-            months = [
-                "января", "февраля", "марта", "апреля", "мая", "июня",
-                "июля", "августа", "сентября", "октября", "ноября", "декабря"
-            ]
-            
-            weekdays = [
-                "понедельник", "вторник", "среда", "четверг", 
-                "пятница", "суббота", "воскресенье"
-            ]
-            
-            day = date_obj.day
-            month = months[date_obj.month - 1]
-            weekday = weekdays[date_obj.weekday()]
-            
-            return f"{day} {month} ({weekday})"
-            
-        except ValueError:
-            return date_str
+        return fast_time.format_date_russian(date_str)
     
     @staticmethod
     def get_next_working_days(count: int = 7, skip_weekends: bool = False) -> List[Tuple[str, str]]:
@@ -120,22 +71,8 @@ class TimeUtils:
         Returns:
             Список кортежей (дата в формате YYYY-MM-DD, отформатированная дата)
         """
-        days = []
-        current_date = datetime.now() + timedelta(days=1)  # Начинаем с завтра
-        
-        while len(days) < count:
-            # Пропускаем выходные если нужно
-            if skip_weekends and current_date.weekday() >= 5:  # 5 = суббота, 6 = воскресенье
-                current_date += timedelta(days=1)
-                continue
-            
-            date_str = current_date.strftime("%Y-%m-%d")
-            formatted_date = TimeUtils.format_date_russian(date_str)
-            
-            days.append((date_str, formatted_date))
-            current_date += timedelta(days=1)
-        
-        return days
+        # Начинаем с завтра; список за день один и тот же, он берется из кэша
+        return list(fast_time.next_days(fast_time.today() + 1, count, skip_weekends))
     
     @staticmethod
     def is_time_in_past(date_str: str, time_str: str) -> bool:
@@ -149,11 +86,7 @@ class TimeUtils:
         Returns:
             True если время в прошлом
         """
-        try:
-            appointment_datetime = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-            return appointment_datetime < datetime.now()
-        except ValueError:
-            return False
+        return fast_time.is_past(date_str, time_str)
     
     @staticmethod
     def calculate_reminder_time(appointment_date: str, appointment_time: str, 
@@ -188,17 +121,9 @@ class TimeUtils:
         Returns:
             Список дней недели с датами
         """
-        schedule = []
-        start_of_week = datetime.now() - timedelta(days=datetime.now().weekday())
-        
-        for i in range(7):
-            current_day = start_of_week + timedelta(days=i)
-            date_str = current_day.strftime("%Y-%m-%d")
-            formatted_date = TimeUtils.format_date_russian(date_str)
-            
-            schedule.append((date_str, formatted_date))
-        
-        return schedule
+        today = fast_time.today()
+        # (today - 1) % 7 - день недели, как date.weekday()
+        return list(fast_time.next_days(today - (today - 1) % 7, 7, False))
     
     @staticmethod
     def format_duration(minutes: int) -> str:
@@ -233,11 +158,7 @@ class TimeUtils:
         Returns:
             True если формат корректный
         """
-        try:
-            datetime.strptime(time_str, "%H:%M")
-            return True
-        except ValueError:
-            return False
+        return fast_time.parse_time(time_str) is not None
     
     @staticmethod
     def validate_date_format(date_str: str) -> bool:
@@ -250,8 +171,4 @@ class TimeUtils:
         Returns:
             True если формат корректный
         """
-        try:
-            datetime.strptime(date_str, "%Y-%m-%d")
-            return True
-        except ValueError:
-            return False
+        return fast_time.parse_date(date_str) is not None